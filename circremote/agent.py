@@ -0,0 +1,403 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import json
+import time
+import codecs
+import select
+import socket
+import threading
+import socketserver
+from pathlib import Path
+
+from .cache import DeviceCache
+from .connection import CircuitPythonConnection
+from .repl import RawREPL, CTRL_C
+from .upload import send_program
+
+
+# Every raw REPL run ends with the end of its error output (Ctrl+D) and the prompt
+RAW_REPL_RUN_END = b"\x04>"
+
+# Device entry fields that need a new connection when they change
+CONNECTION_SETTINGS = ('device', 'password', 'baudrate', 'read_timeout', 'flow_control', 'write_timeout')
+
+# How long a run may keep going after its client has disconnected before we interrupt it
+DISCONNECT_GRACE = 0.5
+
+
+def default_socket_path():
+    """Return the default path of the agent's Unix socket."""
+    return str(Path.home() / '.circremote' / 'agent.sock')
+
+
+class DeviceSession:
+    """
+    A connection to one device that the agent keeps open between jobs.
+
+    After a run completes the board is left at the raw REPL prompt, so the
+    next job can skip opening the port, authenticating and interrupting.
+    """
+
+    def __init__(self, device_info, debug_options=None):
+        self.device_info = device_info
+        self.debug_options = debug_options or {}
+        self.connection = None
+        self.repl = None
+        self.lock = threading.Lock()
+        # True when the board is known to be sitting at the raw REPL prompt
+        self.idle = False
+
+    def run(self, device_info, payload, timeout, cache, started, emit, cancelled):
+        """
+        Run payload on the device, one job at a time.
+
+        started(warm) is called once the code is running, emit(data) with each
+        piece of output, and cancelled() should return True once nobody is
+        listening any more.
+        """
+        with self.lock:
+            if any(device_info.get(key) != self.device_info.get(key) for key in CONNECTION_SETTINGS):
+                self.debug(f"Settings for '{device_info['name']}' changed, reconnecting")
+                self.close()
+            self.device_info = device_info
+
+            try:
+                warm = self.prepare()
+                send_program(self.connection, self.repl, payload, self.device_info, cache, self.debug_options)
+                started(warm)
+                finished = self.stream(timeout, emit, cancelled)
+            except Exception:
+                self.close()
+                raise
+
+            self.idle = finished or self.stop()
+            self.debug(f"Job on '{device_info['name']}' {'finished' if finished else 'stopped'}, "
+                       f"board {'idle at raw REPL' if self.idle else 'state unknown'}")
+
+    def prepare(self):
+        """
+        Get the board to the raw REPL prompt.
+
+        Returns:
+            bool: True if the warm connection could be reused as is
+        """
+        if self.connection and self.idle:
+            self.idle = False
+            try:
+                # A single Ctrl+A round trip confirms the board is still where we left it
+                if self.repl.enter():
+                    return True
+                self.debug("Board was not at the raw REPL prompt, interrupting")
+            except Exception as e:
+                self.debug(f"Warm connection failed ({e}), reconnecting")
+                self.close()
+
+        if not self.connection:
+            self.open()
+        self.repl.interrupt()
+        self.repl.enter()
+        return False
+
+    def open(self):
+        """Open the connection to the device."""
+        self.debug(f"Opening connection to '{self.device_info['name']}' at {self.device_info['device']}")
+        self.connection = CircuitPythonConnection(
+            self.device_info['device'],
+            password=self.device_info.get('password'),
+            debug_options=self.debug_options,
+            device_options=self.device_info
+        )
+        self.repl = RawREPL(self.connection, debug_options=self.debug_options)
+
+    def stream(self, timeout, emit, cancelled):
+        """
+        Pass output to emit() until the run ends.
+
+        Returns:
+            bool: True if the run ended by itself, False if it timed out or was abandoned
+        """
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        abandoned = False
+        tail = b''
+        while True:
+            if not abandoned and cancelled():
+                # Give a run that is just finishing a moment to reach the prompt
+                abandoned = True
+                grace_deadline = time.monotonic() + DISCONNECT_GRACE
+                deadline = grace_deadline if deadline is None else min(deadline, grace_deadline)
+
+            wait = 0.1
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            data = self.connection.read_available(wait)
+            if not data:
+                continue
+            if not abandoned:
+                emit(data)
+            if RAW_REPL_RUN_END in tail + data:
+                return True
+            tail = data[-1:]
+
+    def stop(self):
+        """Interrupt a run that is still going and wait for the raw REPL prompt."""
+        self.debug("Interrupting unfinished run")
+        try:
+            self.connection.write(CTRL_C)
+            self.connection.flush()
+            return self.connection.read_until(RAW_REPL_RUN_END, 2.0).endswith(RAW_REPL_RUN_END)
+        except Exception as e:
+            self.debug(f"Could not interrupt run: {e}")
+            self.close()
+            return False
+
+    def close(self):
+        """Close the connection; the next job will open it again."""
+        if self.connection:
+            try:
+                self.connection.close()
+            except Exception as e:
+                self.debug(f"Error closing connection: {e}")
+        self.connection = None
+        self.repl = None
+        self.idle = False
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
+
+
+class Agent:
+    """
+    Long-running process that owns device connections and runs jobs for CLI invocations.
+
+    Jobs arrive over a Unix socket as one JSON line:
+        {"device": {...device entry...}, "payload": "...", "timeout": 10}
+    and are answered with JSON lines: {"status": "running", "warm": true},
+    then {"output": "..."} as the device prints, then {"status": "done"}
+    or {"error": "..."}.
+    """
+
+    def __init__(self, socket_path=None, options=None):
+        self.socket_path = Path(socket_path or default_socket_path())
+        self.options = options
+        self.debug_options = options.__dict__ if options else {}
+        self.cache = DeviceCache(options)
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.server = None
+
+    def serve_forever(self):
+        """Listen on the socket and run jobs until interrupted."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if self.is_running():
+                raise RuntimeError(f"An agent is already listening on {self.socket_path}")
+            self.socket_path.unlink()
+
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                agent.handle_client(self.connection)
+
+        # Anyone who can reach the socket can run code on the devices, so it's
+        # created private rather than made private after it's already listening
+        umask = os.umask(0o077)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        self.server.daemon_threads = True
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Close the socket and every device connection."""
+        if self.server:
+            self.server.server_close()
+            self.server = None
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                with session.lock:
+                    session.close()
+            self.sessions.clear()
+
+    def is_running(self):
+        """Check whether another agent is answering on the socket."""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def session_for(self, device_info):
+        """Return the session for a device, creating it on first use."""
+        with self.sessions_lock:
+            session = self.sessions.get(device_info['name'])
+            if session is None:
+                session = DeviceSession(device_info, self.debug_options)
+                self.sessions[device_info['name']] = session
+            return session
+
+    def handle_client(self, sock):
+        """Run one job for a connected client."""
+        client_gone = threading.Event()
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        def send(message):
+            try:
+                sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            except OSError:
+                client_gone.set()
+
+        def started(warm):
+            send({'status': 'running', 'warm': warm})
+
+        def emit(data):
+            text = decoder.decode(data)
+            if text:
+                send({'output': text})
+
+        def cancelled():
+            # Clients send nothing after the request, so a readable socket means it closed
+            if not client_gone.is_set() and select.select([sock], [], [], 0)[0]:
+                client_gone.set()
+            return client_gone.is_set()
+
+        try:
+            request = json.loads(self.read_request(sock))
+            device_info = request['device']
+            payload = request['payload']
+            timeout = float(request.get('timeout', 10.0))
+        except Exception as e:
+            send({'error': f"Bad request: {e}"})
+            return
+
+        self.debug(f"Job for '{device_info['name']}' ({len(payload)} bytes, timeout {timeout}s)")
+        try:
+            self.session_for(device_info).run(device_info, payload, timeout, self.cache, started, emit, cancelled)
+            send({'status': 'done'})
+        except Exception as e:
+            self.debug(f"Job for '{device_info['name']}' failed: {type(e).__name__}: {e}")
+            send({'error': str(e)})
+
+    def read_request(self, sock):
+        """Read the request line from a client."""
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode('utf-8')
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
+
+
+class AgentClient:
+    """
+    Submits a job to the agent and reads its output.
+
+    Output is read with read_data() just like a serial CircuitPythonConnection,
+    so the usual output monitor works unchanged.
+    """
+
+    connection_type = 'agent'
+
+    def __init__(self, socket_path=None, debug_options=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.debug_options = debug_options or {}
+        self.sock = None
+        self.buffer = bytearray()
+        self.warm = False
+        self.done = False
+
+    def submit(self, device_info, payload, timeout):
+        """Send a job to the agent and wait until the code is running on the device."""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        request = {'device': device_info, 'payload': payload, 'timeout': timeout}
+        self.sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+        message = self.read_message()
+        if message is None:
+            raise RuntimeError("Agent closed the connection")
+        if 'error' in message:
+            raise RuntimeError(message['error'])
+        self.warm = message.get('warm', False)
+
+    def read_message(self, timeout=None):
+        """Read the next JSON message; None if the timeout expired or the agent hung up."""
+        while b'\n' not in self.buffer:
+            if timeout is not None and not select.select([self.sock], [], [], timeout)[0]:
+                return None
+            data = self.sock.recv(65536)
+            if not data:
+                self.done = True
+                return None
+            self.buffer.extend(data)
+
+        line, _, rest = bytes(self.buffer).partition(b'\n')
+        self.buffer = bytearray(rest)
+        return json.loads(line)
+
+    def read_nonblock(self, max_bytes=1024):
+        """
+        Return the next piece of device output, or '' if none arrived within a second.
+        
+        Raises EOFError once the agent has finished the job.
+        """
+        if self.done:
+            raise EOFError("Agent finished the job")
+
+        message = self.read_message(timeout=1.0)
+        if message is None:
+            return ''
+        if 'error' in message:
+            self.done = True
+            print(f"\nError from circremote agent: {message['error']}")
+        elif message.get('status') == 'done':
+            self.done = True
+        return message.get('output', '')
+
+    def read_data(self, max_bytes=1024):
+        """Like read_nonblock(), as bytes; the agent has already decoded the device output."""
+        return self.read_nonblock(max_bytes).encode('utf-8')
+
+    def write(self, data):
+        """The agent owns the device; extra input can't be sent from the client."""
+        self.debug(f"Ignoring {len(data)} bytes of input, not supported through the agent")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Close the connection to the agent."""
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import re
+import time
+from collections import deque
+
+from .output import LineOutput
+from .recorder import parse_reading
+from .sketch import QuantileSketch
+
+
+# Lines like "------" or "=====" that sensor commands print between readings
+SEPARATOR = re.compile(r'^[\s\-=_*#~.]*$')
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class WindowAggregator(LineOutput):
+    """
+    Summarise readings over time windows instead of passing each one on.
+
+    Readings ("Name: value unit" lines) are collected per name into panes
+    of slide seconds, each with a QuantileSketch. When a pane ends, the
+    last window / slide panes are merged and one summary line per reading
+    is written: count, min, mean, max and percentiles. With slide equal
+    to window the windows don't overlap. Memory depends on the number of
+    readings and panes, not on how many values arrive.
+
+    Separator lines are dropped; other lines, like errors, are passed on.
+    """
+
+    def __init__(self, output, window, slide=None):
+        super().__init__()
+        self.output = output
+        self.window = window
+        self.slide = slide or window
+        self.panes_per_window = max(1, round(self.window / self.slide))
+        self.current_pane = None
+        # Name -> (unit, deque of (pane number, QuantileSketch)), in the order readings first appeared
+        self.readings = {}
+
+    def emit(self, line, received):
+        pane = int(received // self.slide)
+        if self.current_pane is None:
+            self.current_pane = pane
+        elif pane > self.current_pane:
+            self.end_panes(pane)
+
+        reading = parse_reading(line)
+        if reading is None:
+            if not SEPARATOR.match(line):
+                self.output.write(line + '\r\n')
+            return
+
+        name, value, unit = reading
+        if name not in self.readings:
+            self.readings[name] = (unit, deque())
+        panes = self.readings[name][1]
+        if not panes or panes[-1][0] != pane:
+            panes.append((pane, QuantileSketch()))
+        panes[-1][1].add(value)
+
+    def end_panes(self, next_pane):
+        """Write the windows ending at each pane before next_pane that still hold readings."""
+        last = min(next_pane - 1, self.current_pane + self.panes_per_window - 1)
+        for pane in range(self.current_pane, last + 1):
+            self.write_window(pane)
+        self.current_pane = next_pane
+
+    def write_window(self, end_pane):
+        first_pane = end_pane - self.panes_per_window + 1
+        start = time.strftime('%H:%M:%S', time.localtime(first_pane * self.slide))
+        end = time.strftime('%H:%M:%S', time.localtime((end_pane + 1) * self.slide))
+
+        lines = []
+        for name, (unit, panes) in self.readings.items():
+            while panes and panes[0][0] < first_pane:
+                panes.popleft()
+            sketch = QuantileSketch()
+            for pane, pane_sketch in panes:
+                if pane <= end_pane:
+                    sketch.merge(pane_sketch)
+            if not sketch.count:
+                continue
+            percentiles = ' '.join(f"p{round(fraction * 100)}={sketch.quantile(fraction):.6g}"
+                                   for fraction in PERCENTILES)
+            lines.append(f"{start}-{end} {name}: n={sketch.count} min={sketch.min:.6g} "
+                         f"mean={sketch.mean:.6g} max={sketch.max:.6g} {percentiles}"
+                         f"{' ' + unit if unit else ''}\r\n")
+        if lines:
+            self.output.write(''.join(lines))
+
+    def write_frame(self, frame):
+        self.output.write_frame(frame)
+
+    def close(self):
+        """Summarise the window in progress and close the output."""
+        if self.closed:
+            return
+        super().close()
+        if self.current_pane is not None:
+            self.write_window(self.current_pane)
+        self.output.close()
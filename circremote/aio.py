@@ -0,0 +1,504 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+asyncio interface to CircuitPython devices.
+
+One event loop can drive many boards at once without a thread per
+connection:
+
+    import asyncio
+    from circremote.aio import run_command
+
+    async def main():
+        results = await asyncio.gather(
+            run_command('sign-1', 'BME280'),
+            run_command('192.168.1.100', 'SHT30', {'address': '0x45'}),
+        )
+
+    asyncio.run(main())
+"""
+
+import os
+import ssl
+import time
+import base64
+import codecs
+import struct
+import asyncio
+import hashlib
+import serial
+from websocket import ABNF
+
+from .cache import DeviceCache
+from .command import load_command, prepare_code
+from .config import Config
+from .connection import CircuitPythonConnection, DEFAULT_BAUDRATE, DEFAULT_READ_TIMEOUT, FLOW_CONTROL
+from .markers import MarkerScanner, START_MARKER, END_MARKER
+from .repl import RawREPLProtocol
+from .upload import build_payload, send_program_steps
+from .usb import resolve_device_info
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+async def drive(connection, steps):
+    """Carry out the I/O requested by protocol steps (see repl.drive()) on an async connection."""
+    try:
+        request = next(steps)
+        while True:
+            method, *args = request
+            if method == 'sleep':
+                result = await asyncio.sleep(*args)
+            else:
+                result = await getattr(connection, method)(*args)
+            request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+class AsyncCircuitPythonConnection:
+    """
+    asyncio counterpart of CircuitPythonConnection.
+
+    Serial ports are watched with the event loop's add_reader(), and the
+    Web Workflow WebSocket is spoken directly over an asyncio stream, so no
+    threads are involved. Takes the same arguments as CircuitPythonConnection;
+    call open() (or use it with "async with") before reading or writing.
+
+    websocket-client, which the blocking connection uses, only offers a
+    thread per connection, so frames are built and unmasked with its ABNF
+    class and only the HTTP upgrade is done here.
+    """
+
+    def __init__(self, connection_string, password=None, debug_options=None, device_options=None):
+        self.connection_string = connection_string
+        self.password = password
+        self.debug_options = debug_options or {}
+
+        device_options = device_options or {}
+        self.baudrate = device_options.get('baudrate') or DEFAULT_BAUDRATE
+        self.flow_control = device_options.get('flow_control') or 'none'
+        self.read_timeout = device_options.get('read_timeout', DEFAULT_READ_TIMEOUT)
+        self.write_chunk_size = device_options.get('write_chunk_size')
+        self.write_delay = device_options.get('write_delay', 0)
+        self.write_timeout = device_options.get('write_timeout')
+        self.connect_timeout = 5
+        self.bytes_written = 0
+
+        self.connection_type = None
+        self.rx_buffer = bytearray()
+        self.at_eof = False
+        self.data_ready = None
+        self.loop = None
+        # Serial
+        self.port = None
+        self.fd = None
+        # WebSocket
+        self.ws_reader = None
+        self.ws_writer = None
+        self.ws_task = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Open the serial port or WebSocket."""
+        self.loop = asyncio.get_running_loop()
+        self.data_ready = asyncio.Event()
+        if CircuitPythonConnection.is_websocket_connection(self.connection_string):
+            await self.open_websocket()
+        else:
+            self.open_serial()
+
+    def open_serial(self):
+        """Open the serial port and have the event loop tell us when it has data."""
+        self.connection_type = 'serial'
+        self.debug(f"Opening serial port '{self.connection_string}' at {self.baudrate} bps")
+        self.port = serial.Serial(
+            port=self.connection_string,
+            baudrate=self.baudrate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=0,
+            **FLOW_CONTROL[self.flow_control]
+        )
+        try:
+            self.fd = self.port.fileno()
+        except AttributeError:
+            self.port.close()
+            raise RuntimeError("Async serial connections need a port with a file descriptor (not supported on Windows)")
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self.on_serial_readable)
+
+    def on_serial_readable(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.debug(f"Serial read failed: {e}")
+            data = b''
+        if data:
+            self.feed(data)
+        else:
+            self.set_eof()
+
+    async def open_websocket(self):
+        """Connect to the Web Workflow serial WebSocket."""
+        self.connection_type = 'websocket'
+        host, port = CircuitPythonConnection.parse_websocket_connection(self.connection_string)
+        self.debug(f"Connecting to WebSocket at {host}:{port}")
+
+        try:
+            self.ws_reader, self.ws_writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl.create_default_context() if port == 443 else None),
+                self.connect_timeout
+            )
+        except ConnectionRefusedError:
+            raise RuntimeError("Connection refused")
+        except asyncio.TimeoutError:
+            raise RuntimeError("Connection timeout")
+
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        headers = [
+            "GET /cp/serial/ HTTP/1.1",
+            f"Host: {host}:{port}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {key}",
+            "Sec-WebSocket-Version: 13",
+        ]
+        if self.password:
+            auth_string = base64.b64encode(f":{self.password}".encode()).decode()
+            headers.append(f"Authorization: Basic {auth_string}")
+        self.ws_writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('ascii'))
+
+        try:
+            response = await asyncio.wait_for(self.ws_reader.readuntil(b'\r\n\r\n'), self.connect_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            self.ws_writer.close()
+            raise RuntimeError("WebSocket handshake failed: no response")
+
+        status_line, *header_lines = response.decode('latin-1').split('\r\n')
+        status = status_line.split(' ')[1] if ' ' in status_line else ''
+        if status == '401':
+            self.ws_writer.close()
+            raise RuntimeError("Bad password - authentication failed")
+        if status != '101':
+            self.ws_writer.close()
+            raise RuntimeError(f"WebSocket handshake failed: {status_line}")
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        response_headers = dict(
+            (name.strip().lower(), value.strip())
+            for name, _, value in (line.partition(':') for line in header_lines if line)
+        )
+        if response_headers.get('sec-websocket-accept') != accept:
+            self.ws_writer.close()
+            raise RuntimeError("WebSocket handshake failed: bad Sec-WebSocket-Accept")
+
+        self.debug("WebSocket connection established")
+        self.ws_task = self.loop.create_task(self.read_websocket())
+
+    async def read_websocket(self):
+        """Receive WebSocket frames until the connection closes."""
+        try:
+            while True:
+                head = await self.ws_reader.readexactly(2)
+                opcode = head[0] & 0x0f
+                length = head[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('>H', await self.ws_reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('>Q', await self.ws_reader.readexactly(8))[0]
+                mask = await self.ws_reader.readexactly(4) if head[1] & 0x80 else None
+                payload = await self.ws_reader.readexactly(length)
+                if mask:
+                    payload = ABNF.mask(mask, payload)
+
+                if opcode in (ABNF.OPCODE_CONT, ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+                    self.feed(payload)
+                elif opcode == ABNF.OPCODE_PING:
+                    self.ws_writer.write(ABNF.create_frame(payload, ABNF.OPCODE_PONG).format())
+                elif opcode == ABNF.OPCODE_CLOSE:
+                    self.debug("WebSocket closed by device")
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.debug(f"WebSocket connection lost: {e}")
+        finally:
+            self.set_eof()
+
+    def feed(self, data):
+        self.rx_buffer.extend(data)
+        self.data_ready.set()
+
+    def set_eof(self):
+        if self.fd is not None and not self.at_eof:
+            self.loop.remove_reader(self.fd)
+        self.at_eof = True
+        self.data_ready.set()
+
+    async def write(self, data):
+        """
+        Write data (str or bytes) to the connection.
+
+        Data is split into write_chunk_size pieces with write_delay seconds
+        between them when those are configured for the device.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.debug(f"Writing {len(data)} bytes")
+
+        chunk_size = self.write_chunk_size or len(data) or 1
+        for offset in range(0, len(data), chunk_size):
+            if offset and self.write_delay:
+                await asyncio.sleep(self.write_delay)
+            chunk = data[offset:offset + chunk_size]
+            if self.connection_type == 'serial':
+                await self.write_serial(chunk)
+            else:
+                self.ws_writer.write(ABNF.create_frame(chunk, ABNF.OPCODE_TEXT).format())
+                await self.ws_writer.drain()
+        self.bytes_written += len(data)
+
+    async def flush(self):
+        """Wait until written data has been handed to the operating system."""
+        if self.ws_writer:
+            await self.ws_writer.drain()
+
+    async def write_serial(self, chunk):
+        """Write to the port, waiting for it to drain whenever the kernel buffer is full."""
+        view = memoryview(chunk)
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                written = 0
+            view = view[written:]
+            if not view:
+                return
+
+            writable = self.loop.create_future()
+            self.loop.add_writer(self.fd, lambda: writable.done() or writable.set_result(None))
+            try:
+                await asyncio.wait_for(writable, self.write_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"Timed out after {self.write_timeout} seconds writing to {self.connection_string}")
+            finally:
+                self.loop.remove_writer(self.fd)
+
+    async def wait_for_data(self, timeout):
+        """Wait up to timeout seconds (None for ever) for more data to arrive."""
+        if self.at_eof:
+            return
+        self.data_ready.clear()
+        try:
+            await asyncio.wait_for(self.data_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def read_until(self, terminator, timeout):
+        """
+        Read until terminator is seen or timeout expires.
+
+        Anything received after the terminator stays buffered for the next read.
+        """
+        deadline = self.loop.time() + timeout
+        while True:
+            index = self.rx_buffer.find(terminator)
+            if index >= 0:
+                end = index + len(terminator)
+                data = bytes(self.rx_buffer[:end])
+                del self.rx_buffer[:end]
+                return data
+
+            remaining = deadline - self.loop.time()
+            if remaining <= 0 or self.at_eof:
+                data = bytes(self.rx_buffer)
+                self.rx_buffer.clear()
+                self.debug(f"Timed out waiting for {terminator!r}")
+                return data
+            await self.wait_for_data(remaining)
+
+    async def read_bytes(self, count, timeout):
+        """
+        Read exactly count bytes unless timeout expires first.
+
+        A timeout of 0 only returns data that has already arrived.
+        """
+        deadline = self.loop.time() + timeout
+        while len(self.rx_buffer) < count and not self.at_eof:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            await self.wait_for_data(remaining)
+
+        data = bytes(self.rx_buffer[:count])
+        del self.rx_buffer[:count]
+        return data
+
+    async def read_available(self, timeout=None):
+        """Return buffered data, or wait up to timeout seconds (default read_timeout) for new data."""
+        if timeout is None:
+            timeout = self.read_timeout
+        if not self.rx_buffer:
+            await self.wait_for_data(timeout)
+        data = bytes(self.rx_buffer)
+        self.rx_buffer.clear()
+        return data
+
+    async def close(self):
+        """Close the connection."""
+        self.debug(f"Closing {self.connection_type} connection")
+        if self.port:
+            if not self.at_eof:
+                self.loop.remove_reader(self.fd)
+                self.at_eof = True
+            self.port.close()
+            self.port = None
+        if self.ws_writer:
+            try:
+                self.ws_writer.write(ABNF.create_frame(struct.pack('>H', 1000), ABNF.OPCODE_CLOSE).format())
+                self.ws_writer.close()
+                await self.ws_writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.ws_writer = None
+        if self.ws_task:
+            self.ws_task.cancel()
+            try:
+                await self.ws_task
+            except asyncio.CancelledError:
+                pass
+            self.ws_task = None
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
+
+
+class AsyncRawREPL(RawREPLProtocol):
+    """asyncio counterpart of RawREPL, driving an AsyncCircuitPythonConnection."""
+
+    def __init__(self, connection, timeout=0.5, flow_timeout=5.0, debug_options=None):
+        super().__init__(timeout, flow_timeout, debug_options)
+        self.connection = connection
+
+    async def interrupt(self):
+        return await drive(self.connection, self.interrupt_steps())
+
+    async def enter(self):
+        return await drive(self.connection, self.enter_steps())
+
+    async def execute(self):
+        return await drive(self.connection, self.execute_steps())
+
+    async def run_code(self, code, raw_paste=True):
+        return await drive(self.connection, self.run_code_steps(code, raw_paste))
+
+    async def paste(self, code):
+        return await drive(self.connection, self.paste_steps(code))
+
+    async def write_paced(self, code):
+        return await drive(self.connection, self.write_paced_steps(code))
+
+    async def exit(self):
+        return await drive(self.connection, self.exit_steps())
+
+    async def wait_for(self, expected):
+        return await drive(self.connection, self.wait_for_steps(expected))
+
+
+async def run_command(device, command, variables=None, timeout=10.0, config=None, cache=None,
+                      debug_options=None, on_output=None):
+    """
+    Run a circremote command on a device and return what it printed.
+
+    Args:
+        device: Config device name, serial port, usb:SERIAL_NUMBER or Web Workflow address
+        command: Command name, alias or path, as on the command line
+        variables: Template variables for the command
+        timeout: Seconds to wait for the command to finish (0 = wait indefinitely)
+        on_output: Called with each piece of output as it arrives
+
+    Dependencies in requirements.txt are not installed and no warnings are
+    shown; use the CLI for that.
+    """
+    debug_options = debug_options or {}
+    config = config or Config()
+    cache = cache or DeviceCache()
+
+    device_info = dict(config.find_device(device) or {'name': device, 'device': device})
+    if not device_info.get('baudrate') and cache.get(device_info['name'], 'baudrate'):
+        device_info['baudrate'] = cache.get(device_info['name'], 'baudrate')
+    # Finding a usb:SERIAL_NUMBER device may wait for it to reappear after a reset
+    device_info = await asyncio.get_running_loop().run_in_executor(None, resolve_device_info, device_info, cache)
+
+    code, info_data = load_command(command, config)
+    code = prepare_code(code, info_data, variables or {}, command)
+    return await run_code(device_info, code, timeout, cache, debug_options, on_output)
+
+
+async def run_code(device_info, code, timeout=10.0, cache=None, debug_options=None, on_output=None):
+    """
+    Run command code that's already been prepared on a device and return what it printed.
+
+    device_info is a device entry like those in the config file, with at
+    least 'name' and 'device'.
+    """
+    debug_options = debug_options or {}
+    cache = cache or DeviceCache()
+
+    payload = build_payload(code)
+
+    connection = AsyncCircuitPythonConnection(
+        device_info['device'],
+        password=device_info.get('password'),
+        debug_options=debug_options,
+        device_options=device_info
+    )
+    async with connection:
+        repl = AsyncRawREPL(connection, debug_options=debug_options)
+        await repl.interrupt()
+        await repl.enter()
+
+        await drive(connection, send_program_steps(repl, payload, device_info, cache, debug_options))
+        output = await collect_output(connection, timeout, on_output)
+        await repl.exit()
+    return output
+
+
+async def collect_output(connection, timeout, on_output=None):
+    """Return the output between the start and end markers, passing it to on_output as it arrives."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    scanner = MarkerScanner(START_MARKER.encode(), END_MARKER.encode())
+    output = []
+
+    while not scanner.found_end:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0 or connection.at_eof and not connection.rx_buffer:
+            # Give up, keeping anything held back as a possible partial end marker
+            text = decoder.decode(scanner.flush(), final=True)
+            finished = True
+        else:
+            data = scanner.feed(await connection.read_available(remaining))
+            text = decoder.decode(data, final=scanner.found_end)
+            finished = False
+        if text:
+            output.append(text)
+            if on_output:
+                on_output(text)
+        if finished:
+            break
+
+    return ''.join(output)
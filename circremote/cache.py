@@ -0,0 +1,177 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows; saves there aren't serialised between processes
+    fcntl = None
+
+
+class DeviceCache:
+    """
+    Facts learned about devices, kept between runs in ~/.circremote/cache.json.
+
+    Entries are stored per device and per key, together with the time they
+    were recorded so callers can ignore entries that are too old. One
+    DeviceCache can be shared between threads, as the agent does.
+
+    Several circremote processes can use the file at once. Saving takes a
+    lock on cache.json.lock, reads the file again and applies only the
+    changes made here, so other processes' entries aren't lost.
+    """
+
+    def __init__(self, options=None, path=None):
+        if path:
+            self.cache_path = Path(path)
+        else:
+            self.cache_path = Path.home() / '.circremote' / 'cache.json'
+        self.options = options
+        self.data = None
+        self.lock = threading.RLock()
+        # (device, key, entry) for each change not saved yet; entry None deletes, key None deletes the device
+        self.changes = []
+        self.batch_depth = 0
+
+    def get(self, device, key, default=None, max_age=None):
+        """
+        Look up a cached value for a device.
+
+        Returns:
+            The cached value, or default if it is missing or older than max_age seconds
+        """
+        with self.lock:
+            entry = self.load().get(device, {}).get(key)
+        if entry is None:
+            return default
+
+        if max_age is not None and time.time() - entry.get('updated', 0) > max_age:
+            self.debug(f"Cache entry {device}/{key} is older than {max_age} seconds, ignoring")
+            return default
+
+        return entry.get('value', default)
+
+    def set(self, device, key, value):
+        """Store a value for a device and write the cache file, unless in a batch()."""
+        with self.lock:
+            entry = {
+                'value': value,
+                'updated': time.time()
+            }
+            self.load().setdefault(device, {})[key] = entry
+            self.changes.append((device, key, entry))
+            self.debug(f"Caching {device}/{key} = {value!r}")
+            if not self.batch_depth:
+                self.save()
+
+    def delete(self, device, key=None):
+        """Forget one cached value for a device, or everything about it if key is None."""
+        with self.lock:
+            devices = self.load()
+            if device not in devices:
+                return
+
+            if key is None:
+                del devices[device]
+            elif key in devices[device]:
+                del devices[device][key]
+            else:
+                return
+            self.changes.append((device, key, None))
+            if not self.batch_depth:
+                self.save()
+
+    @contextmanager
+    def batch(self):
+        """Make several changes and write the cache file once, at the end."""
+        with self.lock:
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if not self.batch_depth and self.changes:
+                    self.save()
+
+    def devices(self):
+        """List all devices with cached entries."""
+        with self.lock:
+            return list(self.load().keys())
+
+    def load(self):
+        """Read the cache file once; a missing or damaged file is treated as empty."""
+        with self.lock:
+            if self.data is None:
+                self.data = self.read_file()
+            return self.data
+
+    def read_file(self):
+        """Read the devices in the cache file; a missing or damaged file has none."""
+        if not self.cache_path.exists():
+            return {}
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                cache_data = json.load(f)
+            if isinstance(cache_data.get('devices'), dict):
+                self.debug(f"Loaded device cache from {self.cache_path}")
+                return cache_data['devices']
+        except Exception as e:
+            self.debug(f"Could not read device cache {self.cache_path}: {e}")
+        return {}
+
+    @contextmanager
+    def file_lock(self):
+        """Hold the lock other circremote processes take to save the cache file."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.cache_path.with_name(self.cache_path.name + '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """
+        Apply the changes made here to the cache file as it is now, and
+        write it atomically so concurrent runs never see a partial file.
+        """
+        temp_path = None
+        with self.lock:
+            try:
+                self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.file_lock():
+                    devices = self.read_file()
+                    for device, key, entry in self.changes:
+                        if key is None:
+                            devices.pop(device, None)
+                        elif entry is None:
+                            devices.get(device, {}).pop(key, None)
+                        else:
+                            devices.setdefault(device, {})[key] = entry
+                    fd, temp_path = tempfile.mkstemp(dir=self.cache_path.parent, prefix='.cache-', suffix='.json')
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump({'devices': devices}, f, indent=2)
+                    os.replace(temp_path, self.cache_path)
+                self.data = devices
+                self.changes = []
+            except Exception as e:
+                self.debug(f"Could not write device cache {self.cache_path}: {e}")
+                if temp_path and os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.options and getattr(self.options, 'verbose', False) and not getattr(self.options, 'quiet', False):
+            print(f"DEBUG: {message}")
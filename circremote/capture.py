@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+A capture of device output with a fixed memory ceiling.
+
+Lines are written as they arrive to gzip-compressed segment files in the
+capture directory, each named after the number of its first line:
+
+    000000000000.gz  000000031337.gz  000000062611.gz
+
+The current segment is flushed every second or so, so other processes
+can read a running capture and a crash loses little. Reading the last
+lines only decompresses the newest segments, however long the capture
+has been running.
+"""
+
+import gzip
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+
+from .output import LineOutput
+
+
+DEFAULT_MEMORY_LIMIT = 1024 * 1024
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+SEGMENT_SUFFIX = '.gz'
+
+
+def segment_paths(directory):
+    """List a capture's segment files, oldest first."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.glob('*' + SEGMENT_SUFFIX) if path.stem.isdigit())
+
+
+def read_segment(path):
+    """
+    Read the lines in a segment file.
+
+    A segment that's still being written, or was cut short, gives the
+    lines that could be read.
+    """
+    # Decompress by hand so a stream without its gzip trailer still gives its data
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(Path(path).read_bytes())
+    except zlib.error:
+        data = b''
+    lines = data.decode('utf-8', errors='replace').split('\n')
+    # The last piece is empty after a complete line, or part of a line that was being written
+    return lines[:-1]
+
+
+def tail(directory, count):
+    """Return the last count lines of a capture directory, reading segments from the newest back."""
+    lines = []
+    for path in reversed(segment_paths(directory)):
+        if len(lines) >= count:
+            break
+        lines = read_segment(path) + lines
+    return lines[-count:] if count else []
+
+
+def replay(directory):
+    """Yield every line of a capture directory, oldest first, a segment at a time."""
+    for path in segment_paths(directory):
+        yield from read_segment(path)
+
+
+class Capture(LineOutput):
+    """
+    Keep device output in a capture directory without growing memory.
+
+    Each line is compressed into the current segment file as it arrives,
+    and a new segment is started every segment_size bytes. The segment is
+    flushed at most every flush_interval seconds, so what's on disk is
+    never more than that behind. Up to memory_limit bytes of the newest
+    lines are also kept in memory so tail() rarely has to read the disk.
+    A capture directory that already has segments is added to.
+    """
+
+    def __init__(self, directory, memory_limit=DEFAULT_MEMORY_LIMIT, segment_size=DEFAULT_SEGMENT_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_limit = memory_limit
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.recent = deque()
+        self.recent_size = 0
+        self.segment = None
+        self.segment_written = 0
+        self.last_flush = time.monotonic()
+
+        existing = segment_paths(self.directory)
+        if existing:
+            self.next_line = int(existing[-1].stem) + len(read_segment(existing[-1]))
+        else:
+            self.next_line = 0
+
+    def emit(self, line, received):
+        if self.segment is None or self.segment_written >= self.segment_size:
+            self.start_segment()
+        data = (line + '\n').encode('utf-8')
+        self.segment.write(data)
+        self.segment_written += len(data)
+        self.next_line += 1
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+        self.recent.append(line)
+        self.recent_size += len(line) + 1
+        while self.recent_size > self.memory_limit:
+            self.recent_size -= len(self.recent.popleft()) + 1
+
+    def flush(self):
+        """Make everything written so far readable from the segment file."""
+        if self.segment is not None:
+            self.segment.flush()
+        self.last_flush = time.monotonic()
+
+    def start_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+        path = self.directory / f'{self.next_line:012d}{SEGMENT_SUFFIX}'
+        self.segment = gzip.open(path, 'wb')
+        self.segment_written = 0
+
+    def tail(self, count):
+        """Return the last count lines, from memory if it holds enough of them, otherwise from disk."""
+        if count <= len(self.recent):
+            return list(self.recent)[-count:] if count else []
+        self.flush()
+        return tail(self.directory, count)
+
+    def close(self):
+        """Flush and close the segment."""
+        if self.closed:
+            return
+        super().close()
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
@@ -7,17 +7,46 @@ import os
 import json
 import time
 import re
+import codecs
 import subprocess
+import threading
 import signal
 import urllib.parse
 import requests
 import tempfile
+import sqlite3
+import asyncio
+import contextlib
 from pathlib import Path
 from argparse import ArgumentParser, Namespace
 from typing import Dict, Any, Optional
 
-from .config import Config
-from .connection import CircuitPythonConnection
+from .cache import DeviceCache
+from .config import Config, BUILTIN_COMMANDS_DIR
+from .command import (
+    is_pathname, defined_variables, variable_defaults, normalize_variables, template_variables,
+    fill_template, load_command, prepare_code
+)
+from .connection import CircuitPythonConnection, probe_baudrate
+from .output import TextOutput, TeeOutput, PrefixedOutput, make_output, OUTPUT_FORMATS
+from .recorder import Recorder, DEFAULT_FLUSH_INTERVAL
+from .frames import FrameDemux, USES_FRAMES
+from .thermal import ThermalOutput
+from .capture import Capture, tail, replay
+from .timestamps import TimestampDemux
+from .metrics import MetricsOutput, MetricsRegistry, MetricsServer, load_metrics
+from .aggregate import WindowAggregator
+from .fleet import run_fleet, summary_lines, DEFAULT_CONCURRENCY, DEFAULT_DEVICE_TIMEOUT
+from .discover import discover, parse_network, remember, find_by_hostname
+from .usb import USB_PREFIX, list_boards, resolve_device_info, remember as remember_usb_port, forget as forget_usb_port
+from .inventory import (
+    INVENTORY_CODE, INVENTORY_MAX_AGE, parse_inventory, find_devices, missing_libraries, missing_pins,
+    skip_pin_fallback
+)
+from .markers import MarkerScanner, START_MARKER, END_MARKER
+from .repl import RawREPL
+from .upload import build_payload, send_program
+from .agent import Agent, AgentClient, default_socket_path
 
 
 def main():
@@ -29,17 +58,31 @@ def main():
 class CLI:
     def __init__(self, options=None):
         self.config = Config(options)
+        self.cache = DeviceCache(options)
+        self.output = TextOutput()
+        # Where JSON Lines records go; everything else goes to stderr with --format jsonl
+        self.records = None
 
     def run(self, args):
         """Run the CLI with the given arguments."""
         options, remaining = self.parse_options(args)
+        if options.output_format != 'jsonl':
+            return self.run_options(options, remaining)
         
+        # Keep stdout for the records so it can be parsed, and send every other message to stderr
+        self.records = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            return self.run_options(options, remaining)
+
+    def run_options(self, options, remaining):
+        """Run the CLI with parsed options."""
         # Reinitialize config with custom config file path if specified
         if options.config:
             self.config = Config(options)
         
         # Update config with options for debug output
         self.config.options = options
+        self.cache.options = options
         
         # Check for command help request: -h COMMAND
         if options.help and len(remaining) >= 1:
@@ -52,6 +95,24 @@ class CLI:
             self.list_all_commands(options)
             sys.exit(0)
         
+        # Show a capture: circremote --capture DIR --tail N, or --replay
+        if options.capture and (options.tail is not None or options.replay) and not remaining:
+            self.show_capture(options)
+            sys.exit(0)
+        
+        # Run the persistent connection agent: circremote agent
+        if remaining == ['agent']:
+            self.run_agent(options)
+            sys.exit(0)
+        
+        # Search a network for Web Workflow devices: circremote discover 192.168.1.0/24
+        if remaining and remaining[0] == 'discover' and len(remaining) == 2 and not self.config.find_device('discover'):
+            self.run_discover(remaining[1], options)
+        
+        # Take or show an inventory of devices: circremote inventory [devices]
+        if remaining and remaining[0] == 'inventory' and len(remaining) <= 2 and not self.config.find_device('inventory'):
+            self.run_inventory(remaining[1] if len(remaining) == 2 else None, options)
+        
         if len(remaining) < 2:
             print("Usage: circremote [options] <device_name_or_path> <command_name_or_path> [variable=value ...]")
             print("Built-in commands:")
@@ -73,6 +134,10 @@ class CLI:
         device_spec = remaining[0]
         command_name = remaining[1]
         
+        # Several devices at once: circremote sign-1,sign-2,/dev/ttyACM0 info, or a group or tags
+        if self.is_fleet(device_spec):
+            self.run_fleet(device_spec, command_name, remaining[2:], options)
+        
         # Check if command_name looks like a URL and fetch content if so
         file_content = None
         info_data = None
@@ -133,7 +198,7 @@ class CLI:
                     self.debug(f"Found command '{command_name}' in search path: {command_dir}", options)
                 else:
                     # Fall back to built-in commands
-                    commands_dir = Path(__file__).parent / 'commands'
+                    commands_dir = BUILTIN_COMMANDS_DIR
                     command_dir = commands_dir / command_name
                     code_file = command_dir / 'code.py'
 
@@ -193,10 +258,16 @@ class CLI:
         
         # Resolve device
         device_info = self.resolve_device(device_spec, options)
+        device_info = self.apply_serial_settings(device_info, options)
+        if options.compress:
+            device_info['compress'] = True
         
         serial_port = device_info['device']
         password = device_info.get('password') or options.password
         
+        # What an earlier `circremote inventory` found out about the device, if it's recent
+        facts = self.cache.get(device_info['name'], 'inventory', max_age=options.inventory_age)
+        
         # Store remaining arguments for later parsing after we have info.json
         remaining_args = remaining[2:]
 
@@ -220,7 +291,9 @@ class CLI:
                 self.debug(f"Actual requirements after filtering: {actual_requirements}", options)
                 self.debug(f"Number of actual requirements: {len(actual_requirements)}", options)
                 
-                if actual_requirements:
+                if actual_requirements and facts and not missing_libraries(facts, actual_requirements):
+                    self.debug("The device's inventory shows the requirements are installed, skipping circup", options)
+                elif actual_requirements:
                     self.debug("Local requirements.txt has actual content (after filtering comments/blanks), checking for circup", options)
                     self.handle_circup_installation(requirements_file, serial_port, password, options)
                 else:
@@ -240,7 +313,9 @@ class CLI:
             self.debug(f"Actual requirements after filtering: {actual_requirements}", options)
             self.debug(f"Number of actual requirements: {len(actual_requirements)}", options)
             
-            if actual_requirements:
+            if actual_requirements and facts and not missing_libraries(facts, actual_requirements):
+                self.debug("The device's inventory shows the requirements are installed, skipping circup", options)
+            elif actual_requirements:
                 self.debug("Remote requirements.txt has actual content, checking for circup", options)
                 self.handle_remote_circup_installation(requirements_content, serial_port, password, options)
             else:
@@ -261,6 +336,9 @@ class CLI:
                         # Check for warn_offline flag
                         if info_data.get('warn_offline'):
                             self.show_offline_warning(options)
+                            # The board may come back on another port, so look for it again next time
+                            if device_info.get('usb_serial'):
+                                forget_usb_port(self.cache, device_info['usb_serial'])
                         
                         # Check for tested flag
                         if info_data.get('tested') is False:
@@ -308,6 +386,12 @@ class CLI:
             
             # Validate variables against info.json
             self.validate_variables(variables, info_data, command_name)
+            
+            # Catch pins the board doesn't have before the code has to fall back at run time
+            pins = missing_pins(facts, variables.values()) if facts else []
+            if pins and not options.quiet:
+                print(f"⚠️  Warning: {facts.get('board_id', 'The board')} has no {', '.join(pins)} "
+                      f"(from its inventory)")
 
         # Read the file content (only for local commands)
         if not file_content:  # Only read local files if we didn't fetch from URL
@@ -337,9 +421,8 @@ class CLI:
                 sys.exit(1)
 
         # Check for template variables and interpolate if needed
-        template_vars = re.findall(r'\{\{\s*(\w+)\s*\}\}', file_content)
+        template_vars = template_variables(file_content)
         if template_vars:
-            template_vars = list(set(template_vars))  # Remove duplicates
             self.debug(f"Found template variables in code: {template_vars}", options)
             
             if variables:
@@ -365,15 +448,112 @@ class CLI:
         else:
             self.debug("No template variables found in code", options)
 
+        # The device's inventory says which pins it has, so the code needn't find out by trying them
+        if facts:
+            checked_content = skip_pin_fallback(file_content, facts)
+            if checked_content != file_content:
+                self.debug("Skipping the I2C pin fallback, the device's inventory shows which bus to use", options)
+                file_content = checked_content
+
+        uses_frames = bool(USES_FRAMES.search(file_content))
+        if uses_frames:
+            self.debug("Code sends frames, adding the send_frame() helper", options)
+        if options.timestamps:
+            self.debug("Adding the timestamping print() helper", options)
+
+        # Wrap the code with markers so we can pick its output out of the REPL chatter
+        self.debug("Wrapping code with print('***START***') and print('***END***') markers", options)
+        payload = build_payload(file_content, timestamps=options.timestamps)
+
+        self.debug(f"Prepared {len(payload.encode('utf-8'))} bytes of Python code", options)
+        if options.verbose:
+            self.debug("Code transmission details:", options)
+            self.debug(f"  - Characters: {len(payload)}", options)
+            self.debug(f"  - Lines: {len(payload.split(chr(10)))}", options)
+            self.debug(f"  - Bytes: {len(payload.encode('utf-8'))}", options)
+
+        display = make_output(options.output_format, device_info['name'], command_name, self.records,
+                              unbuffered=options.unbuffered)
+        if options.aggregate is not None:
+            display = self.add_aggregator(display, options)
+        if options.thermal or options.npy:
+            display = self.add_thermal_output(display, options)
+        self.output = display
+        if options.record:
+            self.output = self.add_recorder(self.output, device_info, command_name, options)
+        if options.capture:
+            self.output = self.add_capture(self.output, options)
+        metrics_server = None
+        if options.metrics_file or options.metrics_port is not None:
+            self.output, metrics_server = self.add_metrics(self.output, info_data, device_info, command_name, options)
+        frames = timestamps = None
+        if uses_frames:
+            self.output = frames = FrameDemux(self.output, display.write_frame)
+        if options.timestamps:
+            self.output = timestamps = TimestampDemux(self.output)
+        
+        if options.agent:
+            connection = self.submit_to_agent(device_info, password, payload, options)
+        else:
+            connection = self.run_on_device(device_info, password, payload, options)
+
+        # Display output from connection for 10 seconds
+        self.debug("Listening for output (10 seconds)...", options)
+        self.debug("-" * 50, options)
+
+        try:
+            self.debug("Starting output monitoring with 10-second timeout", options)
+            self.monitor_output(connection, options)
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+        except Exception as e:
+            print(f"\nError reading from connection: {e}")
+            self.debug(f"Output reading error details: {type(e).__name__}: {e}", options)
+            if options.verbose:
+                import traceback
+                self.debug(f"Error backtrace: {traceback.format_exc()}", options)
+        finally:
+            self.output.close()
+            if metrics_server:
+                metrics_server.close()
+            if not options.quiet:
+                if frames and frames.damaged:
+                    print(f"⚠️  Warning: Dropped {frames.damaged} damaged frame(s)")
+                if isinstance(display, ThermalOutput):
+                    print(f"Received {display.rate.count} frames, {display.rate.average():.1f} frames/s")
+                if timestamps:
+                    for line in timestamps.report():
+                        print(line)
+            
+            # Handle double exit option after output monitoring
+            if options.double_exit:
+                self.debug("Double exit mode: waiting 10 seconds before sending additional Ctrl+D", options)
+                time.sleep(10)
+                self.debug("Sending additional Ctrl+D character (\\x04)", options)
+                connection.write("\x04")  # Send additional Ctrl+D
+                connection.flush()
+                self.debug("Double exit sequence complete", options)
+            
+            self.debug("Closing connection", options)
+            connection.close()
+            if connection.connection_type == 'serial':
+                self.debug("Serial port closed", options)
+            elif connection.connection_type == 'agent':
+                self.debug("Agent connection closed", options)
+            else:
+                self.debug("WebSocket connection closed", options)
+
+    def run_on_device(self, device_info, password, payload, options):
+        """Connect to the device, upload payload through the raw REPL and start it running."""
         # Establish connection using CircuitPythonConnection class
         try:
             self.debug("Establishing CircuitPython connection", options)
             connection = CircuitPythonConnection(
-                serial_port, 
+                device_info['device'], 
                 password=password, 
-                debug_options=options.__dict__
+                debug_options=options.__dict__,
+                device_options=device_info
             )
-            connection_type = connection.connection_type
         except Exception as e:
             # Don't show duplicate error messages for connection refused or bad password
             error_str = str(e)
@@ -392,53 +572,21 @@ class CLI:
         try:
             self.debug("Starting CircuitPython REPL protocol", options)
             
+            repl = RawREPL(connection, debug_options=options.__dict__)
+            
             self.debug("Interrupting CircuitPython (Ctrl+C x3)...", options)
-            self.debug("Sending 3 Ctrl+C characters (\\x03)", options)
-            connection.write("\x03\x03\x03")  # Send Ctrl+C three times
-            self.debug("Waiting 0.5 seconds after Ctrl+C", options)
-            time.sleep(0.5)
+            repl.interrupt()
             
             self.debug("Entering raw REPL mode (Ctrl+A)...", options)
-            self.debug("Sending Ctrl+A character (\\x01)", options)
-            connection.write("\x01")  # Send Ctrl+A
-            self.debug("Waiting 0.5 seconds after Ctrl+A", options)
-            time.sleep(0.5)
+            repl.enter()
             
-            self.debug("Sending start marker...", options)
-            self.debug("Sending: print('***START***')", options)
-            start_marker = "print('***START***')\r\n"
-            connection.write(start_marker)
-            connection.flush()
-            self.debug("Start marker sent and flushed", options)
-            
-            file_content = file_content.replace('\n', '\r\n')
-
             self.debug("Transmitting Python code...", options)
-            self.debug(f"Transmitting {len(file_content.encode('utf-8'))} bytes of Python code", options)
-            if options.verbose:
-                self.debug("Code transmission details:", options)
-                self.debug(f"  - Characters: {len(file_content)}", options)
-                self.debug(f"  - Lines: {len(file_content.split(chr(10)))}", options)
-                self.debug(f"  - Bytes: {len(file_content.encode('utf-8'))}", options)
-            connection.write(file_content)
-            connection.flush()
-            self.debug("Python code transmission complete and flushed", options)
-            self.debug("Code transmission complete", options)
+            used_raw_paste = send_program(connection, repl, payload, device_info, self.cache, options.__dict__)
+            self.debug(f"Code transmission complete ({'raw-paste' if used_raw_paste else 'raw REPL'} mode)", options)
+            self.debug(f"Wrote {connection.bytes_written} bytes at {connection.write_rate():.0f} bytes/s", options)
             
-            self.debug("Sending end marker...", options)
-            self.debug("Sending: print('***END***')", options)
-            end_marker = "print('***END***')\r\n"
-            connection.write(end_marker)
-            connection.flush()
-            self.debug("End marker sent and flushed", options)
-            
-            self.debug("Exiting raw REPL mode (Ctrl+D, Ctrl+B)...", options)
-            self.debug("Sending Ctrl+D character (\\x04)", options)
-            connection.write("\x04")  # Send Ctrl+D
-            self.debug("Waiting 0.1 seconds after Ctrl+D", options)
-            time.sleep(0.1)
-            self.debug("Sending Ctrl+B character (\\x02)", options)
-            connection.write("\x02")  # Send Ctrl+B
+            self.debug("Exiting raw REPL mode (Ctrl+B)...", options)
+            repl.exit()
             
             connection.flush()
             self.debug("REPL exit sequence complete and flushed", options)
@@ -452,37 +600,379 @@ class CLI:
             connection.close()
             sys.exit(1)
 
-        # Display output from connection for 10 seconds
-        self.debug("Listening for output (10 seconds)...", options)
-        self.debug("-" * 50, options)
+        return connection
+
+    def add_aggregator(self, output, options):
+        """Show summaries of readings over --aggregate second windows in place of the readings."""
+        window = options.aggregate
+        slide = options.slide or window
+        if window <= 0 or slide <= 0:
+            print("❌ Error: --aggregate and --slide must be greater than 0")
+            sys.exit(1)
+        if slide > window or abs(window / slide - round(window / slide)) > 1e-9:
+            print(f"❌ Error: --aggregate {window:g} must be a whole number of --slide {slide:g} steps")
+            sys.exit(1)
+        
+        self.debug(f"Summarising readings over {window:g} second windows every {slide:g} seconds", options)
+        return WindowAggregator(output, window, slide)
 
+    def add_thermal_output(self, output, options):
+        """Show thermal camera frames as an image and/or save them to a .npy file."""
         try:
-            self.debug("Starting output monitoring with 10-second timeout", options)
-            self.monitor_output(connection, options)
+            return ThermalOutput(output, view=options.thermal, npy_path=options.npy)
+        except OSError as e:
+            print(f"❌ Error: Could not create {options.npy}: {e}")
+            sys.exit(1)
+
+    def add_capture(self, output, options):
+        """Keep the device output in the --capture directory as well as writing it to output."""
+        self.debug(f"Capturing output to {options.capture}", options)
+        try:
+            capture = Capture(options.capture)
+        except OSError as e:
+            print(f"❌ Error: Could not use capture directory {options.capture}: {e}")
+            sys.exit(1)
+        return TeeOutput(output, capture)
+
+    def show_capture(self, options):
+        """Print the last --tail lines of a capture directory, or all of it with --replay."""
+        if not os.path.isdir(options.capture):
+            print(f"❌ Error: Capture directory {options.capture} does not exist")
+            sys.exit(1)
+        if options.tail is not None and options.tail < 0:
+            print(f"❌ Error: --tail must be 0 or more, got {options.tail}")
+            sys.exit(1)
+        
+        lines = replay(options.capture) if options.replay else tail(options.capture, options.tail)
+        for line in lines:
+            print(line)
+
+    def add_metrics(self, output, info_data, device_info, command_name, options):
+        """
+        Turn output into the metrics the command's info.json declares, for Prometheus.
+
+        Returns:
+            tuple: (output, MetricsServer or None)
+        """
+        try:
+            metrics = load_metrics(info_data, command_name)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        if not metrics:
+            if not options.quiet:
+                print(f"⚠️  Warning: '{command_name}' doesn't declare any metrics in its info.json")
+            return output, None
+        
+        registry = MetricsRegistry()
+        server = None
+        if options.metrics_port is not None:
+            try:
+                server = MetricsServer(registry, options.metrics_port)
+            except OSError as e:
+                print(f"❌ Error: Could not serve metrics on port {options.metrics_port}: {e}")
+                sys.exit(1)
+            self.debug(f"Serving metrics at http://127.0.0.1:{server.port}/metrics", options)
+        if options.metrics_file:
+            self.debug(f"Writing metrics to {options.metrics_file}", options)
+        
+        metrics_output = MetricsOutput(metrics, registry, device_info['name'], command_name, options.metrics_file)
+        return TeeOutput(output, metrics_output), server
+
+    def add_recorder(self, output, device_info, command_name, options):
+        """Record readings from the device output in the --record database as well as writing it to output."""
+        if options.record_interval <= 0:
+            print(f"❌ Error: --record-interval must be greater than 0, got {options.record_interval}")
+            sys.exit(1)
+        
+        self.debug(f"Recording readings to {options.record} every {options.record_interval} seconds", options)
+        try:
+            recorder = Recorder(options.record, device_info['name'], command_name, options.record_interval)
+        except sqlite3.Error as e:
+            print(f"❌ Error: Could not open recording database {options.record}: {e}")
+            sys.exit(1)
+        return TeeOutput(output, recorder)
+
+    def submit_to_agent(self, device_info, password, payload, options):
+        """Hand payload to a running circremote agent, which owns a warm connection to the device."""
+        socket_path = options.agent_socket or default_socket_path()
+        self.debug(f"Submitting job for '{device_info['name']}' to agent at {socket_path}", options)
+        
+        connection = AgentClient(socket_path, debug_options=options.__dict__)
+        try:
+            connection.submit(dict(device_info, password=password), payload, getattr(options, 'timeout', 10.0))
+        except Exception as e:
+            connection.close()
+            print(f"❌ Error: Could not run command through the circremote agent at {socket_path}: {e}")
+            print("Start the agent with: circremote agent")
+            sys.exit(1)
+        
+        self.debug(f"Agent accepted job ({'warm' if connection.warm else 'cold'} connection)", options)
+        return connection
+
+    def run_agent(self, options):
+        """Run the persistent connection agent in the foreground until interrupted."""
+        agent = Agent(options.agent_socket, options)
+        if not options.quiet:
+            print(f"circremote agent listening on {agent.socket_path}")
+            print("Run commands through it with: circremote --agent <device> <command>")
+        try:
+            agent.serve_forever()
         except KeyboardInterrupt:
-            print("\nInterrupted by user")
+            if not options.quiet:
+                print("\nAgent stopped")
         except Exception as e:
-            print(f"\nError reading from connection: {e}")
-            self.debug(f"Output reading error details: {type(e).__name__}: {e}", options)
-            if options.verbose:
-                import traceback
-                self.debug(f"Error backtrace: {traceback.format_exc()}", options)
+            print(f"❌ Error: Could not start circremote agent: {e}")
+            sys.exit(1)
+
+    def run_fleet(self, device_spec, command_name, args, options):
+        """
+        Run a command on several devices at once and exit.
+
+        Each line of output is prefixed with its device's name (JSON Lines
+        records carry it already), and a table of how each device did ends
+        the run. Exits with status 1 if any device failed.
+        """
+        single_device_options = (
+            ('record', '--record'), ('capture', '--capture'), ('thermal', '--thermal'), ('npy', '--npy'),
+            ('timestamps', '--timestamps'), ('metrics_file', '--metrics-file'),
+            ('metrics_port', '--metrics-port'), ('aggregate', '--aggregate'), ('agent', '-a'),
+            ('probe_baud', '--probe-baud'),
+        )
+        for setting, option in single_device_options:
+            if getattr(options, setting, None) not in (None, False):
+                print(f"❌ Error: {option} can only be used with one device")
+                sys.exit(1)
+        if options.concurrency < 1:
+            print("❌ Error: --concurrency must be at least 1")
+            sys.exit(1)
+        if options.device_timeout < 0:
+            print("❌ Error: --device-timeout must be 0 or more seconds")
+            sys.exit(1)
+
+        devices = self.resolve_devices(device_spec, options)
+
+        try:
+            code, info_data = load_command(command_name, self.config)
+            variables = {}
+            positional = [arg for arg in args if '=' not in arg]
+            if info_data and positional:
+                variables.update(self.parse_default_commandline_variables(positional, info_data, command_name))
+            variables.update(self.parse_command_line_variables(args))
+            code = prepare_code(code, info_data, variables, command_name)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+
+        if info_data and info_data.get('warn_offline'):
+            self.show_offline_warning(options)
+            for device_info in devices:
+                if device_info.get('usb_serial'):
+                    forget_usb_port(self.cache, device_info['usb_serial'])
+        if info_data and info_data.get('tested') is False:
+            self.show_tested_warning(options)
+        if not options.quiet and self.command_has_requirements(command_name):
+            print("⚠️  Warning: Dependencies in requirements.txt are not installed when running on several devices")
+
+        if options.output_format == 'jsonl':
+            display = None
+            outputs = {device_info['name']: make_output('jsonl', device_info['name'], command_name, self.records)
+                       for device_info in devices}
+        else:
+            display = make_output('text', None, command_name, unbuffered=options.unbuffered)
+            width = max(len(device_info['name']) for device_info in devices)
+            outputs = {device_info['name']: PrefixedOutput(display, f"{device_info['name']:<{width}} | ")
+                       for device_info in devices}
+
+        self.debug(f"Running '{command_name}' on {len(devices)} devices, {options.concurrency} at a time", options)
+        start_time = time.monotonic()
+        results = None
+        try:
+            results = asyncio.run(run_fleet(
+                devices, code, options.timeout, options.concurrency, options.device_timeout,
+                self.cache, options.__dict__,
+                lambda device_info, text: outputs[device_info['name']].write(text)
+            ))
+        except KeyboardInterrupt:
+            pass
         finally:
-            # Handle double exit option after output monitoring
-            if options.double_exit:
-                self.debug("Double exit mode: waiting 10 seconds before sending additional Ctrl+D", options)
-                time.sleep(10)
-                self.debug("Sending additional Ctrl+D character (\\x04)", options)
-                connection.write("\x04")  # Send additional Ctrl+D
-                connection.flush()
-                self.debug("Double exit sequence complete", options)
-            
-            self.debug("Closing connection", options)
-            connection.close()
-            if connection.connection_type == 'serial':
-                self.debug("Serial port closed", options)
-            else:
-                self.debug("WebSocket connection closed", options)
+            for output in outputs.values():
+                output.close()
+            if display:
+                display.close()
+
+        if results is None:
+            print("\nInterrupted by user")
+            sys.exit(1)
+        if not options.quiet:
+            print()
+            for line in summary_lines(results, time.monotonic() - start_time):
+                print(line)
+        sys.exit(0 if all(result.ok for result in results) else 1)
+
+    def run_inventory(self, selector, options):
+        """
+        Take an inventory of devices and show it, then exit: circremote inventory [devices]
+
+        Devices whose facts are older than --inventory-age are asked again,
+        several at once; the rest are shown from the cache. Without a
+        selector, every device in the config file is included.
+        """
+        filters = []
+        for where in options.where or []:
+            fact, separator, pattern = where.partition('=')
+            if not separator or not fact:
+                print(f"❌ Error: --where takes FACT=PATTERN, like version=9.*, not '{where}'")
+                sys.exit(1)
+            filters.append((fact, pattern))
+        
+        if selector is None:
+            selector = ','.join(self.config.list_devices())
+            if not selector:
+                print("❌ Error: No devices given and none in the config file")
+                print("Usage: circremote inventory [devices]")
+                sys.exit(1)
+        devices = self.resolve_devices(selector, options)
+        
+        failed = []
+        stale = [device_info for device_info in devices
+                 if self.cache.get(device_info['name'], 'inventory', max_age=options.inventory_age) is None]
+        if stale and not options.cached:
+            self.debug(f"Taking inventory of {len(stale)} devices", options)
+            try:
+                results = asyncio.run(run_fleet(stale, INVENTORY_CODE, options.timeout, options.concurrency,
+                                                options.device_timeout, self.cache, options.__dict__))
+            except KeyboardInterrupt:
+                print("\nInterrupted by user")
+                sys.exit(1)
+            with self.cache.batch():
+                for result in results:
+                    facts = parse_inventory(result.output) if result.ok else None
+                    if facts is None:
+                        failed.append((result.device, result.error or "No inventory in its output"))
+                    else:
+                        self.cache.set(result.device, 'inventory', facts)
+        
+        found = find_devices(self.cache, [device_info['name'] for device_info in devices], filters,
+                             options.inventory_age)
+        if options.output_format == 'jsonl':
+            for name, facts in found:
+                self.print_record(dict(facts, device=name))
+        elif found:
+            self.print_table(('Device', 'Board', 'CircuitPython', 'Wi-Fi', 'Libraries'),
+                             [(name, facts.get('board_id', '?'), facts.get('version', '?'),
+                               'yes' if facts.get('wifi') else 'no', len(facts.get('libs', [])))
+                              for name, facts in found])
+        elif not options.quiet:
+            print("No devices match" if filters else "Nothing known about these devices yet")
+        
+        if not options.quiet:
+            for name, error in failed:
+                print(f"⚠️  Warning: Could not take inventory of {name}: {error}")
+        sys.exit(1 if failed else 0)
+
+    def run_discover(self, spec, options):
+        """
+        Search a network range for Web Workflow devices, or USB for boards,
+        remember them in the device cache and exit.
+        """
+        if spec == 'usb':
+            self.run_discover_usb(options)
+        
+        try:
+            network, port = parse_network(spec)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        
+        if not options.quiet:
+            print(f"Searching {network} for Web Workflow devices...")
+        start_time = time.monotonic()
+        try:
+            found = asyncio.run(discover(network, port))
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+            sys.exit(1)
+        with self.cache.batch():
+            found = [(address, remember(self.cache, address, version)) for address, version in found]
+        
+        if options.output_format == 'jsonl':
+            for address, facts in found:
+                self.print_record(dict(facts, device=address))
+        elif found:
+            self.print_table(('Address', 'Hostname', 'Board', 'CircuitPython'),
+                             [(address, facts.get('hostname', '?'), facts.get('board_id', '?'), facts.get('version', '?'))
+                              for address, facts in found])
+        if not options.quiet:
+            print(f"Found {len(found)} Web Workflow devices among {network.num_addresses} addresses "
+                  f"in {time.monotonic() - start_time:.1f} seconds")
+        sys.exit(0)
+
+    def run_discover_usb(self, options):
+        """List the CircuitPython boards connected over USB, remember their ports and exit."""
+        boards = list_boards()
+        with self.cache.batch():
+            for board in boards:
+                remember_usb_port(self.cache, board)
+        
+        if options.output_format == 'jsonl':
+            for board in boards:
+                self.print_record(board._asdict())
+        elif boards:
+            self.print_table(('Port', 'Device', 'VID:PID', 'Board'),
+                             [(board.port, USB_PREFIX + board.serial_number if board.serial_number else '-',
+                               f"{board.vid or 0:04x}:{board.pid or 0:04x}",
+                               ' '.join(part for part in (board.manufacturer, board.product) if part))
+                              for board in boards])
+        if not options.quiet:
+            print(f"Found {len(boards)} CircuitPython boards on USB")
+        sys.exit(0)
+
+    def print_record(self, record):
+        """Print a JSON Lines record to stdout, even while other messages are going to stderr."""
+        print(json.dumps(record), file=self.records or sys.stdout)
+
+    def print_table(self, headings, rows):
+        """Print rows in columns under headings."""
+        rows = [tuple(str(value) for value in row) for row in rows]
+        widths = [max(len(row[column]) for row in rows + [headings]) for column in range(len(headings))]
+        for row in [headings] + rows:
+            print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+    def is_fleet(self, device_spec):
+        """Check whether a device argument names several devices: a list, a group or tags."""
+        if self.config.find_device(device_spec):
+            return False
+        return (',' in device_spec or device_spec.startswith(('tag:', 'group:')) or
+                self.config.find_group(device_spec) is not None)
+
+    def resolve_devices(self, device_spec, options):
+        """Resolve a device list, group or tag selector to its devices, each once, with their serial settings."""
+        try:
+            specs = self.config.select_devices(device_spec)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        
+        devices = {}
+        for spec in specs:
+            device_info = self.apply_serial_settings(self.resolve_device(spec, options), options)
+            if options.compress:
+                device_info['compress'] = True
+            devices.setdefault(device_info['name'], device_info)
+        return list(devices.values())
+
+    def command_has_requirements(self, command_name):
+        """Check whether a local command has a requirements.txt with anything in it."""
+        if is_pathname(command_name):
+            command_dir = Path(command_name)
+        else:
+            command_dir = self.config.find_command(self.config.find_command_alias(command_name) or command_name)
+        requirements_file = command_dir / 'requirements.txt' if command_dir and command_dir.is_dir() else None
+        if not requirements_file or not requirements_file.exists():
+            return False
+        return any(line.strip() and not line.strip().startswith('#')
+                   for line in requirements_file.read_text().split('\n'))
 
     def parse_options(self, args):
         """Parse command line options."""
@@ -511,6 +1001,60 @@ class CLI:
                           help='Timeout in seconds for receiving data (0 = wait indefinitely)')
         parser.add_argument('-l', '--list', action='store_true',
                           help='List all available commands from all sources')
+        parser.add_argument('-b', '--baudrate', type=int,
+                          help='Serial port speed in bits per second (default 115200)')
+        parser.add_argument('--flow-control', choices=['none', 'rtscts', 'xonxoff', 'dsrdtr'],
+                          help='Serial port flow control')
+        parser.add_argument('--read-timeout', type=float,
+                          help='Longest a serial read waits for data, in seconds (default 1)')
+        parser.add_argument('--write-timeout', type=float,
+                          help='Give up if a serial write blocks for this many seconds')
+        parser.add_argument('--probe-baud', action='store_true',
+                          help='Find the fastest serial rate the device answers at and remember it')
+        parser.add_argument('-z', '--compress', action='store_true',
+                          help='Compress code before uploading it, if the board has zlib')
+        parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default='text',
+                          help='Device output format: text, or jsonl for one JSON record per line')
+        parser.add_argument('-U', '--unbuffered', action='store_true',
+                          help='Show device output as soon as it arrives instead of in batches')
+        parser.add_argument('--record', type=str, metavar='PATH',
+                          help='Record sensor readings in a SQLite database')
+        parser.add_argument('--record-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                          help='Seconds between writes to the --record database')
+        parser.add_argument('--thermal', action='store_true',
+                          help='Show thermal camera frames as a colour image')
+        parser.add_argument('--npy', type=str, metavar='PATH',
+                          help='Save thermal camera frames to a NumPy .npy file')
+        parser.add_argument('--capture', type=str, metavar='DIR',
+                          help='Keep device output in a capture directory, or show one with --tail or --replay')
+        parser.add_argument('--tail', type=int, metavar='N',
+                          help='Show the last N lines of the --capture directory')
+        parser.add_argument('--replay', action='store_true',
+                          help='Show everything in the --capture directory')
+        parser.add_argument('--timestamps', action='store_true',
+                          help='Timestamp output lines on the device and report their latency')
+        parser.add_argument('--metrics-file', type=str, metavar='PATH',
+                          help='Write the metrics the command declares to a Prometheus textfile')
+        parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                          help='Serve the metrics the command declares at http://127.0.0.1:PORT/metrics')
+        parser.add_argument('--aggregate', type=float, metavar='SECONDS',
+                          help='Show a summary of each reading every SECONDS instead of every value')
+        parser.add_argument('--slide', type=float, metavar='SECONDS',
+                          help='With --aggregate, summarise the last --aggregate seconds every SECONDS')
+        parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, metavar='N',
+                          help='With several devices, work on at most N at once')
+        parser.add_argument('--device-timeout', type=float, default=DEFAULT_DEVICE_TIMEOUT, metavar='SECONDS',
+                          help='With several devices, give each at most SECONDS in all (0 = no limit)')
+        parser.add_argument('--cached', action='store_true',
+                          help='With inventory, show what is already known without contacting the devices')
+        parser.add_argument('--where', action='append', metavar='FACT=PATTERN',
+                          help='With inventory, only show devices whose FACT matches PATTERN, like version=9.*')
+        parser.add_argument('--inventory-age', type=float, default=INVENTORY_MAX_AGE, metavar='SECONDS',
+                          help='Take a device\'s inventory again once it is this old')
+        parser.add_argument('-a', '--agent', action='store_true',
+                          help='Run the command through a running circremote agent')
+        parser.add_argument('--agent-socket', type=str,
+                          help='Path to the circremote agent socket')
         parser.add_argument('-V', '--version', action='store_true',
                           help='Show version and exit')
         parser.add_argument('-h', '--help', action='store_true',
@@ -528,6 +1072,15 @@ class CLI:
             print("   Use -v for verbose debug output or -q for quiet mode, but not both")
             sys.exit(1)
         
+        # JSON Lines output is for other programs; run() keeps everything else off stdout
+        if options.output_format == 'jsonl':
+            if options.verbose:
+                print("❌ Error: Cannot use -v (verbose) with --format jsonl", file=sys.stderr)
+                sys.exit(1)
+            if options.thermal:
+                print("❌ Error: Cannot use --thermal with --format jsonl", file=sys.stderr)
+                sys.exit(1)
+        
         # Handle help manually - but only if no command is specified
         if options.help and len(remaining) == 0:
             self.show_help(parser)
@@ -560,6 +1113,33 @@ class CLI:
         print("  -q, --quiet                      Quiet mode: suppress output except device output, exit on confirmations")
         print("  -t, --timeout SECONDS            Timeout in seconds for receiving data (0 = wait indefinitely)")
         print("  -l, --list                       List all available commands from all sources")
+        print("  -b, --baudrate BPS               Serial port speed in bits per second (default 115200)")
+        print("  --flow-control MODE              Serial flow control: none, rtscts, xonxoff or dsrdtr")
+        print("  --read-timeout SECONDS           Longest a serial read waits for data (default 1)")
+        print("  --write-timeout SECONDS          Give up if a serial write blocks for this many seconds")
+        print("  --probe-baud                     Find the fastest serial rate the device answers at and remember it")
+        print("  -z, --compress                   Compress code before uploading it, if the board has zlib")
+        print("  --format FORMAT                  Device output format: text (default) or jsonl, one JSON record per line")
+        print("  -U, --unbuffered                 Show device output as soon as it arrives instead of in batches")
+        print("  --record PATH                    Record sensor readings in a SQLite database")
+        print(f"  --record-interval SECONDS        Seconds between writes to the --record database (default {DEFAULT_FLUSH_INTERVAL:g})")
+        print("  --thermal                        Show thermal camera frames as a colour image")
+        print("  --npy PATH                       Save thermal camera frames to a NumPy .npy file")
+        print("  --capture DIR                    Keep device output in a capture directory, or show one with --tail or --replay")
+        print("  --tail N                         Show the last N lines of the --capture directory")
+        print("  --replay                         Show everything in the --capture directory")
+        print("  --timestamps                     Timestamp output lines on the device and report their latency")
+        print("  --metrics-file PATH              Write the metrics the command declares to a Prometheus textfile")
+        print("  --metrics-port PORT              Serve the metrics the command declares at http://127.0.0.1:PORT/metrics")
+        print("  --aggregate SECONDS              Show a summary of each reading every SECONDS instead of every value")
+        print("  --slide SECONDS                  With --aggregate, summarise the last --aggregate seconds every SECONDS")
+        print(f"  --concurrency N                  With several devices, work on at most N at once (default {DEFAULT_CONCURRENCY})")
+        print(f"  --device-timeout SECONDS         With several devices, give each at most SECONDS in all (default {DEFAULT_DEVICE_TIMEOUT:g}, 0 = no limit)")
+        print("  --cached                         With inventory, show what is already known without contacting the devices")
+        print("  --where FACT=PATTERN             With inventory, only show devices whose FACT matches PATTERN, like version=9.*")
+        print(f"  --inventory-age SECONDS          Take a device's inventory again once it is this old (default {INVENTORY_MAX_AGE})")
+        print("  -a, --agent                      Run the command through a running circremote agent")
+        print("  --agent-socket PATH              Path to the circremote agent socket")
         print("  -V, --version                    Show version and exit")
         print("  -h, --help                       Show this help message")
         print("  -h COMMAND                       Show help for a specific command")
@@ -583,6 +1163,17 @@ class CLI:
         print("  circremote -q -y /dev/ttyUSB0 BME280                  # Quiet mode with auto-confirm")
         print("  circremote -t 30 /dev/ttyUSB0 BME280                  # Wait 30 seconds for output")
         print("  circremote -t 0 /dev/ttyUSB0 BME280                   # Wait indefinitely for output")
+        print("  circremote -b 921600 /dev/ttyUSB0 ls                  # Faster UART bridge")
+        print("  circremote --probe-baud uart-1 info                   # Find and remember the fastest rate")
+        print("  circremote --format jsonl sign-1 BME280 > readings.jsonl  # One JSON record per output line")
+        print("  circremote -t 0 --record bench.db sign-1 SCD40         # Record readings until interrupted")
+        print("  circremote -t 0 --thermal sign-1 MLX90640 stream=True refresh_rate=4  # Live thermal view")
+        print("  circremote -t 0 --capture ~/captures/sign-1 sign-1 SCD40  # Keep days of output")
+        print("  circremote --capture ~/captures/sign-1 --tail 100         # Show the last 100 lines")
+        print("  circremote -t 0 --metrics-port 9464 sign-1 SHT31D        # Publish readings for Prometheus")
+        print("  circremote -t 0 --aggregate 60 sign-1 BME280             # One summary a minute")
+        print("  circremote sign-1,sign-2,/dev/ttyACM0 info             # Several devices at once")
+        print("  circremote tag:site=lab1,board=feather-s3 info         # Devices with these tags")
         print("  circremote /dev/ttyUSB0 mycommand filename.txt         # Positional arguments (if default_commandline defined)")
         print("  circremote /dev/ttyUSB0 mycommand filename.txt sda=board.IO1  # Mix of positional and explicit")
         print()
@@ -592,6 +1183,19 @@ class CLI:
         print("  circremote /dev/ttyUSB0 ../custom_sensors/BME280       # Relative path to sensor directory")
         print("  circremote /dev/ttyUSB0 /home/user/sensors/BME280.py   # Absolute path to Python file")
         print()
+        print("Discovery:")
+        print("  circremote discover 192.168.1.0/24                      # Find Web Workflow devices")
+        print("  circremote discover usb                                 # List boards on USB by serial number")
+        print("  circremote usb:DF6254B8D3433A2B info                    # A USB board, whatever its port")
+        print()
+        print("Inventory:")
+        print("  circremote inventory                                    # Facts about every device in the config file")
+        print("  circremote inventory --cached --where version=9.* --where wifi=true  # Without touching the devices")
+        print()
+        print("Agent:")
+        print("  circremote agent                                        # Keep device connections open between runs")
+        print("  circremote -a sign-1 BME280                             # Run through the agent")
+        print()
         print("Command help:")
         print("  circremote -h BME280                                    # Show help for BME280 command")
         print("  circremote -h clean                                     # Show help for clean command")
@@ -621,7 +1225,7 @@ class CLI:
                 self.debug(f"Found command '{command_name}' in search path: {command_dir}", options)
             else:
                 # Fall back to built-in commands
-                commands_dir = Path(__file__).parent / 'commands'
+                commands_dir = BUILTIN_COMMANDS_DIR
                 command_dir = commands_dir / command_name
                 code_file = command_dir / 'code.py'
                 info_file = command_dir / 'info.json'
@@ -668,7 +1272,7 @@ class CLI:
             
             # List built-in commands
             builtin_commands = set()
-            commands_dir = Path(__file__).parent / 'commands'
+            commands_dir = BUILTIN_COMMANDS_DIR
             if commands_dir.exists():
                 for cmd in commands_dir.iterdir():
                     if cmd.is_dir() and cmd.name not in ['.', '..']:
@@ -742,6 +1346,14 @@ class CLI:
             print("Arguments: None")
             print()
         
+        # Show metrics for --metrics-file and --metrics-port
+        if info_data.get('metrics'):
+            print("Metrics:")
+            for metric in info_data['metrics']:
+                unit = f" ({metric['unit']})" if metric.get('unit') else ""
+                print(f"  {metric.get('name')}{unit}: {metric.get('help', '')}")
+            print()
+        
         # Show examples
         print("Examples:")
         if 'default_commandline' in info_data:
@@ -791,7 +1403,7 @@ class CLI:
         
         # List built-in commands
         builtin_commands = set()
-        commands_dir = Path(__file__).parent / 'commands'
+        commands_dir = BUILTIN_COMMANDS_DIR
         if commands_dir.exists():
             for cmd in commands_dir.iterdir():
                 if cmd.is_dir() and cmd.name not in ['.', '..']:
@@ -911,7 +1523,7 @@ class CLI:
             return
         
         # Get the list of valid variable names from info.json
-        valid_variables = [var['name'] for var in info_data['variables']]
+        valid_variables = defined_variables(info_data)
         
         # Check each provided variable against the valid list
         invalid_variables = [var for var in variables.keys() if var not in valid_variables]
@@ -936,31 +1548,22 @@ class CLI:
         if not info_data or 'variables' not in info_data:
             return variables
         
-        # Create a copy of the variables dict
+        # Add defaults for any variables not already provided
         result = variables.copy()
-        
-        # Add defaults for any missing variables
-        for var in info_data['variables']:
-            var_name = var['name']
-            if var_name not in result:  # Skip if already provided
-                if 'default' in var:
-                    default_value = var['default']
-                    if default_value is not None:
-                        result[var_name] = str(default_value)
-                        self.debug(f"Added default '{default_value}' for variable '{var_name}'", None)
+        for var_name, default_value in variable_defaults(info_data).items():
+            if var_name not in result:
+                result[var_name] = default_value
+                self.debug(f"Added default '{default_value}' for variable '{var_name}'", None)
         
         return result
 
     def interpolate_variables(self, content, variables, info_data, command_name):
         """Interpolate variables into template content."""
         # Get the list of valid variable names from info.json
-        valid_variables = []
-        if info_data and 'variables' in info_data:
-            valid_variables = [var['name'] for var in info_data['variables']]
+        valid_variables = defined_variables(info_data)
         
         # Find all template variables in the content
-        template_vars = re.findall(r'\{\{\s*(\w+)\s*\}\}', content)
-        template_vars = list(set(template_vars))  # Remove duplicates
+        template_vars = template_variables(content)
         
         # Check if any template variables are not in the valid list
         invalid_template_vars = [var for var in template_vars if var not in valid_variables]
@@ -989,13 +1592,14 @@ class CLI:
             print("Please provide values for all template variables on the command line.")
             sys.exit(1)
         
-        # Perform the interpolation
-        result = content
-        for var_name, value in variables.items():
-            pattern = r'\{\{\s*' + re.escape(var_name) + r'\s*\}\}'
-            result = re.sub(pattern, value, result)
+        try:
+            variables = normalize_variables(info_data, variables)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
         
-        return result
+        # Perform the interpolation
+        return fill_template(content, variables)
 
     def resolve_device(self, device_spec, options):
         """Resolve device specification to device info."""
@@ -1004,14 +1608,91 @@ class CLI:
         
         if device_config:
             self.debug(f"Found device '{device_spec}' in config: {device_config['device']}", options)
-            return device_config
+            return self.resolve_usb_port(device_config, options)
+        
+        # A board found earlier by `circremote discover`, by its hostname
+        if not device_spec.startswith(('/', USB_PREFIX)) and not CircuitPythonConnection.is_websocket_connection(device_spec):
+            address = find_by_hostname(self.cache, device_spec)
+            if address:
+                self.debug(f"Device '{device_spec}' was discovered at {address}", options)
+                return {
+                    'name': device_spec,
+                    'device': address
+                }
         
         # If not found in config, treat as direct device specification
         self.debug(f"Device '{device_spec}' not found in config, treating as direct specification", options)
-        return {
+        return self.resolve_usb_port({
             'name': device_spec,
             'device': device_spec
-        }
+        }, options)
+
+    def resolve_usb_port(self, device_info, options):
+        """Find the current port of a device given as usb:SERIAL_NUMBER; other devices are returned as they are."""
+        try:
+            resolved = resolve_device_info(device_info, self.cache)
+        except RuntimeError as e:
+            print(f"❌ Error: {e}")
+            print("Run 'circremote discover usb' to list the boards that are connected")
+            sys.exit(1)
+        if resolved is not device_info:
+            self.debug(f"USB serial number {resolved['usb_serial']} is on {resolved['device']}", options)
+        return resolved
+
+    def apply_serial_settings(self, device_info, options):
+        """
+        Work out the serial line settings for a device.
+        
+        Command line options win over the device entry in config.json, which
+        wins over a rate found by an earlier --probe-baud run.
+        """
+        device_info = dict(device_info)
+        if getattr(options, 'baudrate', None):
+            device_info['baudrate'] = options.baudrate
+        if getattr(options, 'flow_control', None):
+            device_info['flow_control'] = options.flow_control
+        for setting in ('read_timeout', 'write_timeout'):
+            value = getattr(options, setting, None)
+            if value is None:
+                continue
+            if value <= 0:
+                print(f"❌ --{setting.replace('_', '-')} must be a positive number of seconds")
+                sys.exit(1)
+            device_info[setting] = value
+        
+        probe = getattr(options, 'probe_baud', False)
+        if CircuitPythonConnection.is_websocket_connection(device_info['device']):
+            if probe:
+                print(f"⚠️  Warning: --probe-baud only applies to serial devices, ignoring it for {device_info['device']}")
+            return device_info
+        if device_info.get('baudrate'):
+            if probe:
+                print(f"⚠️  Warning: --probe-baud ignored, '{device_info['name']}' is set to {device_info['baudrate']} bps "
+                      f"by -b or its device entry")
+            return device_info
+        
+        device_name = device_info['name']
+        if probe:
+            if not options.quiet:
+                print(f"Probing serial rates on {device_info['device']}...")
+            rate = probe_baudrate(
+                device_info['device'],
+                flow_control=device_info.get('flow_control') or 'none',
+                debug_options=options.__dict__
+            )
+            if rate:
+                if not options.quiet:
+                    print(f"Using {rate} bps for '{device_name}' (remembered for future runs)")
+                self.cache.set(device_name, 'baudrate', rate)
+            else:
+                print(f"⚠️  Warning: No response from {device_info['device']} at any rate, using the default")
+                self.cache.delete(device_name, 'baudrate')
+        
+        rate = self.cache.get(device_name, 'baudrate')
+        if rate:
+            self.debug(f"Using cached rate of {rate} bps for '{device_name}'", options)
+            device_info['baudrate'] = rate
+        return device_info
 
     def resolve_command_path(self, command_name, options):
         """
@@ -1023,7 +1704,7 @@ class CLI:
         command_path = Path(command_name)
         
         # Check if it's an absolute or relative path
-        if command_path.is_absolute() or command_name.startswith('./') or command_name.startswith('../'):
+        if is_pathname(command_name):
             self.debug(f"Command '{command_name}' appears to be a pathname", options)
             
             # Check if it's a Python file
@@ -1380,111 +2061,74 @@ class CLI:
             raise TimeoutError("Timeout reached")
         
         # Only set up signal-based timeout for serial connections if timeout > 0
-        if connection.connection_type == 'serial' and timeout > 0:
+        if connection.connection_type in ('serial', 'agent') and timeout > 0:
             signal.signal(signal.SIGALRM, timeout_handler)
             signal.alarm(int(timeout))
         
         try:
-            if connection.connection_type == 'serial':
+            if connection.connection_type in ('serial', 'agent'):
                 self.monitor_serial_output(connection, options)
             else:
                 self.monitor_websocket_output(connection, options)
         finally:
             # Cancel the alarm if it was set
-            if connection.connection_type == 'serial' and timeout > 0:
+            if connection.connection_type in ('serial', 'agent') and timeout > 0:
                 signal.alarm(0)
 
     def monitor_serial_output(self, connection, options):
         """Monitor output from serial connection."""
-        buffer = ""
-        found_start = False
-        found_end = False
+        scanner = MarkerScanner(START_MARKER.encode(), END_MARKER.encode())
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
         bytes_read = 0
         read_count = 0
         
-        self.debug(f"Initial state: buffer='{buffer}', found_start={found_start}, found_end={found_end}", options)
-        
-        while True:
+        while not scanner.found_end:
             try:
-                data = connection.read_nonblock(1024)
+                # Blocks until data arrives (or the read timeout passes) without polling
+                data = connection.read_data(4096)
                 if not data:
-                    time.sleep(0.1)
                     continue
                     
-                bytes_read += len(data.encode('utf-8'))
+                bytes_read += len(data)
                 read_count += 1
-                self.debug(f"Read {len(data.encode('utf-8'))} bytes (total: {bytes_read}, reads: {read_count})", options)
+                self.debug(f"Read {len(data)} bytes (total: {bytes_read}, reads: {read_count})", options)
                 if options.verbose:
                     self.debug(f"Raw data: {repr(data)}", options)
                 
-                buffer += data
-                self.debug(f"Buffer length: {len(buffer)} characters", options)
-                
-                # Look for ***START*** marker
-                if not found_start and "***START***" in buffer:
-                    start_index = buffer.index("***START***")
-                    self.debug(f"Found ***START*** marker at index {start_index}", options)
-                    
-                    # Check if ***END*** is also in this buffer
-                    if "***END***" in buffer:
-                        end_index = buffer.index("***END***")
-                        self.debug(f"Found ***END*** marker at index {end_index} in same buffer", options)
-                        
-                        # Only display content between ***START*** and ***END***
-                        display_start = start_index + len("***START***")
-                        display_end = end_index
-                        if display_start < display_end:
-                            display_content = buffer[display_start:display_end]
-                            self.debug(f"Content between markers: {repr(display_content)}", options)
-                            if display_content.strip():
-                                self.debug("Displaying content between markers", options)
-                                print(display_content, end='', flush=True)
-                        
-                        found_start = True
-                        found_end = True
-                        self.debug("Set found_start=true, found_end=true, breaking loop", options)
-                        break
-                    else:
-                        # Only ***START*** found, display content after it
-                        display_content = buffer[start_index + len("***START***"):]
-                        self.debug(f"Content after ***START***: {repr(display_content)}", options)
-                        if display_content.strip():
-                            self.debug("Displaying content after ***START***", options)
-                            print(display_content, end='', flush=True)
-                        found_start = True
-                        buffer = ""
-                        self.debug("Set found_start=true, cleared buffer", options)
-                elif found_start and not found_end:
-                    # Look for ***END*** marker
-                    if "***END***" in buffer:
-                        end_index = buffer.index("***END***")
-                        self.debug(f"Found ***END*** marker at index {end_index}", options)
-                        # Display content up to ***END***
-                        display_content = buffer[:end_index]
-                        self.debug(f"Content before ***END***: {repr(display_content)}", options)
-                        if display_content.strip():
-                            self.debug("Displaying content before ***END***", options)
-                            print(display_content, end='', flush=True)
-                        found_end = True
-                        self.debug("Set found_end=true, breaking loop", options)
-                        break
-                    else:
-                        # Display all content since we're between markers
-                        self.debug(f"Displaying buffer content (between markers): {repr(buffer)}", options)
-                        print(buffer, end='', flush=True)
-                        buffer = ""
-                        self.debug("Cleared buffer after display", options)
-                else:
-                    self.debug(f"Skipping data (found_start={found_start}, found_end={found_end})", options)
+                self.show_output(scanner, decoder, data, options)
                     
+            except EOFError:
+                self.debug("Connection reported end of output", options)
+                break
             except Exception as e:
                 if "timeout" in str(e).lower():
                     break
                 time.sleep(0.1)
         
+        self.flush_output(scanner, decoder, options)
         self.debug("Output monitoring complete", options)
         self.debug(f"Final stats: bytes_read={bytes_read}, read_count={read_count}", options)
 
+    def show_output(self, scanner, decoder, data, options):
+        """Print the part of data that falls between the ***START*** and ***END*** markers."""
+        found_start = scanner.found_start
+        display_content = decoder.decode(scanner.feed(data), final=scanner.found_end)
+        if scanner.found_start and not found_start:
+            self.debug("Found ***START*** marker", options)
+        if display_content:
+            self.output.write(display_content)
+        if scanner.found_end:
+            self.debug("Found ***END*** marker, output complete", options)
+
+    def flush_output(self, scanner, decoder, options):
+        """Print output held back as a possible partial ***END*** marker when it never arrived."""
+        if scanner.found_end:
+            return
+        display_content = decoder.decode(scanner.flush(), final=True)
+        if display_content:
+            self.debug(f"No ***END*** marker, showing {len(display_content)} held back characters", options)
+            self.output.write(display_content)
+
     def looks_like_url(self, command_name):
         """Check if the command name looks like a URL."""
         # Check for common URL patterns
@@ -1660,96 +2304,46 @@ class CLI:
 
     def monitor_websocket_output(self, connection, options):
         """Monitor output from WebSocket connection."""
-        buffer = ""
-        found_start = False
-        found_end = False
+        scanner = MarkerScanner(START_MARKER.encode(), END_MARKER.encode())
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
         bytes_read = 0
         message_count = 0
         
-        self.debug(f"Initial WebSocket state: buffer='{buffer}', found_start={found_start}, found_end={found_end}", options)
+        # Set by the WebSocket thread once ***END*** arrives or the socket closes
+        output_done = threading.Event()
+        # Keeps the final flush from racing a message still being shown
+        output_lock = threading.Lock()
         
-        # Set up message handler for WebSocket
+        # Set up message handler for WebSocket; handlers are called one at a time
         def message_handler(msg):
-            nonlocal buffer, found_start, found_end, bytes_read, message_count
+            nonlocal bytes_read, message_count
             message_count += 1
-            data = msg.data if hasattr(msg, 'data') else str(msg)
-            bytes_read += len(data.encode('utf-8'))
-            self.debug(f"WebSocket received {len(data.encode('utf-8'))} bytes (total: {bytes_read}, messages: {message_count})", options)
+            data = msg.data if hasattr(msg, 'data') else msg
+            bytes_read += len(data)
+            self.debug(f"WebSocket received {len(data)} bytes (total: {bytes_read}, messages: {message_count})", options)
             if options.verbose:
                 self.debug(f"Raw WebSocket data: {repr(data)}", options)
             
-            buffer += data
-            self.debug(f"Buffer length: {len(buffer)} characters", options)
-            
-            # Look for ***START*** marker
-            if not found_start and "***START***" in buffer:
-                start_index = buffer.index("***START***")
-                self.debug(f"Found ***START*** marker at index {start_index}", options)
-                
-                # Check if ***END*** is also in this buffer
-                if "***END***" in buffer:
-                    end_index = buffer.index("***END***")
-                    self.debug(f"Found ***END*** marker at index {end_index} in same buffer", options)
-                    
-                    # Only display content between ***START*** and ***END***
-                    display_start = start_index + len("***START***")
-                    display_end = end_index
-                    if display_start < display_end:
-                        display_content = buffer[display_start:display_end]
-                        self.debug(f"Content between markers: {repr(display_content)}", options)
-                        if display_content.strip():
-                            self.debug("Displaying content between markers", options)
-                            print(display_content, end='', flush=True)
-                    
-                    found_start = True
-                    found_end = True
-                    self.debug("Set found_start=true, found_end=true, WebSocket monitoring complete", options)
-                else:
-                    # Only ***START*** found, display content after it
-                    display_content = buffer[start_index + len("***START***"):]
-                    self.debug(f"Content after ***START***: {repr(display_content)}", options)
-                    if display_content.strip():
-                        self.debug("Displaying content after ***START***", options)
-                        print(display_content, end='', flush=True)
-                    found_start = True
-                    buffer = ""
-                    self.debug("Set found_start=true, cleared buffer", options)
-            elif found_start and not found_end:
-                # Look for ***END*** marker
-                if "***END***" in buffer:
-                    end_index = buffer.index("***END***")
-                    self.debug(f"Found ***END*** marker at index {end_index}", options)
-                    # Display content up to ***END***
-                    display_content = buffer[:end_index]
-                    self.debug(f"Content before ***END***: {repr(display_content)}", options)
-                    if display_content.strip():
-                        self.debug("Displaying content before ***END***", options)
-                        print(display_content, end='', flush=True)
-                    found_end = True
-                    self.debug("Set found_end=true, WebSocket monitoring complete", options)
-                else:
-                    # Display all content since we're between markers
-                    self.debug(f"Displaying buffer content (between markers): {repr(buffer)}", options)
-                    print(buffer, end='', flush=True)
-                    buffer = ""
-                    self.debug("Cleared buffer after display", options)
-            else:
-                self.debug(f"Skipping data (found_start={found_start}, found_end={found_end})", options)
+            with output_lock:
+                self.show_output(scanner, decoder, data, options)
+            if scanner.found_end:
+                output_done.set()
         
+        def close_handler(close_status_code, close_msg):
+            self.debug(f"WebSocket closed while waiting for output ({close_status_code})", options)
+            output_done.set()
+        
+        connection.on_close(close_handler)
         connection.on_message(message_handler)
         
         # Get timeout from options, default to 10 seconds if not specified
         timeout = getattr(options, 'timeout', 10.0)
         
-        # Wait for output with timeout
-        start_time = time.time()
-        while True:
-            if found_end:
-                break
-            # If timeout is 0, wait indefinitely
-            if timeout > 0 and time.time() - start_time >= timeout:
-                break
-            time.sleep(0.1)
+        # Wait for output with timeout; if timeout is 0, wait indefinitely
+        if not output_done.wait(timeout if timeout > 0 else None):
+            self.debug(f"No ***END*** marker after {timeout} seconds", options)
         
+        with output_lock:
+            self.flush_output(scanner, decoder, options)
         self.debug("WebSocket output monitoring complete", options)
-        self.debug(f"Final WebSocket stats: bytes_read={bytes_read}, message_count={message_count}", options) 
\ No newline at end of file
+        self.debug(f"Final WebSocket stats: bytes_read={bytes_read}, message_count={message_count}", options)
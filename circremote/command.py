@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Finding command code and filling in its template variables.
+
+Shared by the CLI, which reports problems to the user, and the asyncio
+API, which raises them.
+"""
+
+import re
+import json
+from pathlib import Path
+
+
+TEMPLATE_VARIABLE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# How the values of "type": "bool" variables can be written, and the Python they become
+BOOLEAN_VALUES = {
+    'true': 'True', 'yes': 'True', 'on': 'True', '1': 'True',
+    'false': 'False', 'no': 'False', 'off': 'False', '0': 'False',
+}
+
+
+def is_pathname(command_name):
+    """Check whether a command was given as a path rather than a name."""
+    return Path(command_name).is_absolute() or command_name.startswith('./') or command_name.startswith('../')
+
+
+def read_info(command_dir):
+    """
+    Read a command's info.json.
+
+    Returns:
+        dict: The parsed info.json, or None if the command doesn't have one
+    """
+    info_file = Path(command_dir) / 'info.json'
+    if not info_file.exists():
+        return None
+    with open(info_file, 'r') as f:
+        return json.load(f)
+
+
+def defined_variables(info_data):
+    """List the variable names a command's info.json defines."""
+    if not info_data or 'variables' not in info_data:
+        return []
+    return [var['name'] for var in info_data['variables']]
+
+
+def variable_defaults(info_data):
+    """Return the default values info.json gives for its variables, as strings."""
+    if not info_data or 'variables' not in info_data:
+        return {}
+    return {
+        var['name']: str(var['default'])
+        for var in info_data['variables']
+        if var.get('default') is not None
+    }
+
+
+def normalize_variables(info_data, values):
+    """
+    Turn the values of variables info.json gives "type": "bool" into True or False.
+
+    Returns:
+        dict: A copy of values
+
+    Raises:
+        ValueError: If a bool variable's value isn't one of BOOLEAN_VALUES
+    """
+    result = dict(values)
+    for var in (info_data or {}).get('variables', []):
+        name = var['name']
+        if var.get('type') != 'bool' or name not in result:
+            continue
+        value = BOOLEAN_VALUES.get(str(result[name]).strip().lower())
+        if value is None:
+            raise ValueError(f"'{name}' must be true or false, not '{result[name]}'")
+        result[name] = value
+    return result
+
+
+def template_variables(content):
+    """List the distinct {{ variable }} names used in code, in order of first use."""
+    return list(dict.fromkeys(TEMPLATE_VARIABLE.findall(content)))
+
+
+def fill_template(content, values):
+    """Replace each {{ variable }} that has a value; others are left as they are."""
+    return TEMPLATE_VARIABLE.sub(lambda match: values.get(match.group(1), match.group(0)), content)
+
+
+def load_command(command, config):
+    """
+    Find a command the way the CLI does: a path to a .py file or command
+    directory, a command alias, a search path entry or a built-in command.
+
+    Returns:
+        tuple: (code, info_data); info_data is None without an info.json
+    """
+    if is_pathname(command):
+        command_path = Path(command)
+        if command_path.is_file():
+            return command_path.read_text(), None
+        if not command_path.is_dir():
+            raise FileNotFoundError(f"Pathname '{command}' does not exist")
+        command_dir = command_path
+    else:
+        command = config.find_command_alias(command) or command
+        if re.match(r'^https?://', command):
+            raise ValueError(f"URL commands are not supported here: {command}")
+        command_dir = config.find_command(command)
+
+    code_file = command_dir / 'code.py' if command_dir else None
+    if not code_file or not code_file.exists():
+        raise FileNotFoundError(f"Command '{command}' not found")
+    return code_file.read_text(), read_info(command_dir)
+
+
+def prepare_code(code, info_data, variables, command):
+    """
+    Fill in a command's template variables, using info.json defaults for any not given.
+
+    Raises:
+        ValueError: If a variable isn't defined in info.json or has no value
+    """
+    defined = defined_variables(info_data)
+    invalid = [name for name in variables if name not in defined]
+    if invalid:
+        raise ValueError(f"Invalid variables for '{command}': {', '.join(invalid)}")
+
+    values = variable_defaults(info_data)
+    values.update({name: str(value) for name, value in variables.items()})
+
+    missing = sorted(name for name in template_variables(code) if name not in values)
+    if missing:
+        raise ValueError(f"Missing values for '{command}': {', '.join(missing)}")
+
+    return fill_template(code, normalize_variables(info_data, values))
@@ -6,13 +6,20 @@ import time
 import board
 import busio
 import adafruit_mlx90640
+from array import array
+
+stream = {{ stream }}
 
 print("MLX90640 Thermal Camera Sensor")
 print("=" * 40)
 
 # Initialize I2C bus
 try:
-    i2c = busio.I2C({{ scl }}, {{ sda }})
+    if stream:
+        # Streaming needs a fast bus to keep up with refresh rates over 2 Hz
+        i2c = busio.I2C({{ scl }}, {{ sda }}, frequency=800000)
+    else:
+        i2c = busio.I2C({{ scl }}, {{ sda }})
 except:
     i2c = board.I2C()
 
@@ -22,7 +29,7 @@ try:
     print("✓ MLX90640 sensor initialized successfully")
     
     # Configure sensor settings
-    mlx.refresh_rate = adafruit_mlx90640.RefreshRate.REFRESH_2_HZ
+    mlx.refresh_rate = getattr(adafruit_mlx90640.RefreshRate, "REFRESH_{{ refresh_rate }}_HZ")
     print(f"Refresh Rate: {mlx.refresh_rate}")
     
     # Get frame dimensions
@@ -34,6 +41,21 @@ except Exception as e:
     import sys
     sys.exit(1)
 
+# Streaming mode: send every frame as a binary frame for circremote to decode,
+# in hundredths of a degree so each pixel takes two bytes instead of four
+if stream:
+    print("\nStreaming thermal frames...")
+    centi = array('h', frame)
+    while True:
+        try:
+            mlx.getFrame(frame)
+        except ValueError:
+            # The library gives up on frames it couldn't read cleanly; just wait for the next one
+            continue
+        for i in range(768):
+            centi[i] = int(frame[i] * 100)
+        send_frame(centi, 'h')
+
 print("\nStarting thermal imaging measurements...")
 print("Temperature readings (°C):")
 
@@ -9,6 +9,10 @@ import getpass
 from pathlib import Path
 
 
+# Commands that ship with circremote
+BUILTIN_COMMANDS_DIR = Path(__file__).parent / 'commands'
+
+
 class Config:
     def __init__(self, options=None):
         # Use custom config file path if specified in options
@@ -18,6 +22,9 @@ class Config:
             self.config_path = Path.home() / '.circremote' / 'config.json'
         
         self.devices = {}
+        # Group name -> device names, and (tag, value) -> device names, both in config file order
+        self.groups = {}
+        self.tag_index = {}
         self.command_aliases = {}
         self.search_paths = []
         self.circup_path = None
@@ -32,6 +39,80 @@ class Config:
         """List all configured device names."""
         return list(self.devices.keys())
 
+    def find_group(self, name):
+        """List the names of the devices in a group, or None if there's no such group."""
+        members = self.groups.get(name)
+        return list(members) if members is not None else None
+
+    def find_tagged(self, tags):
+        """
+        List the names of the devices that have every one of tags, a dict of tag -> value.
+
+        Each tag is looked up in the index, and only the smallest set of
+        matches is walked, so this doesn't depend on how many devices there are.
+        """
+        matches = [self.tag_index.get((tag, value), {}) for tag, value in tags.items()]
+        if not matches:
+            return []
+        matches.sort(key=len)
+        return [name for name in matches[0] if all(name in others for others in matches[1:])]
+
+    def select_devices(self, spec):
+        """
+        Turn a device selector into the devices it names.
+
+        A selector is one of:
+            tag:site=lab1,board=feather-s3   devices with all of these tags
+            group:bench                      devices in a group
+            sign-1,bench,/dev/ttyACM0        device names, group names, ports
+                                             and addresses, separated by commas
+
+        A name that is both a device and a group means the device.
+
+        Returns:
+            list: Device names from the config file, and ports or addresses
+                  as given, each once, in order
+
+        Raises:
+            ValueError: If a tag selector is malformed, a group: doesn't
+                exist, or nothing is selected
+        """
+        if spec.startswith('tag:'):
+            tags = {}
+            for item in spec[len('tag:'):].split(','):
+                tag, separator, value = item.partition('=')
+                if not separator or not tag.strip():
+                    raise ValueError(f"Tag selectors look like tag:site=lab1,board=feather-s3, not '{spec}'")
+                tags[tag.strip()] = value.strip()
+            selected = self.find_tagged(tags)
+        else:
+            selected = []
+            for item in spec.split(','):
+                item = item.strip()
+                if item.startswith('group:'):
+                    members = self.find_group(item[len('group:'):])
+                    if members is None:
+                        raise ValueError(f"No group named '{item[len('group:'):]}' in the config file")
+                    selected.extend(members)
+                elif item and item not in self.devices and item in self.groups:
+                    selected.extend(self.groups[item])
+                elif item:
+                    selected.append(item)
+
+        if not selected:
+            raise ValueError(f"No devices match '{spec}'")
+        return list(dict.fromkeys(selected))
+
+    def index_devices(self):
+        """Rebuild the group and tag indexes from the devices."""
+        self.groups = {}
+        self.tag_index = {}
+        for name, device in self.devices.items():
+            for group in device.get('groups', []):
+                self.groups.setdefault(group, {})[name] = True
+            for tag, value in device.get('tags', {}).items():
+                self.tag_index.setdefault((tag, value), {})[name] = True
+
     def find_command_alias(self, name):
         """Find a command alias by name in the configuration."""
         return self.command_aliases.get(name)
@@ -69,6 +150,20 @@ class Config:
         # Not found in search paths
         return None
 
+    def find_command(self, command_name):
+        """
+        Find a command in the search paths, falling back to the built-in commands.
+        
+        Returns:
+            Path: Path to the command directory if found, None otherwise
+        """
+        command_dir = self.find_command_in_search_paths(command_name)
+        if command_dir:
+            return command_dir
+        
+        command_dir = BUILTIN_COMMANDS_DIR / command_name
+        return command_dir if command_dir.exists() else None
+
     def debug(self, message):
         """Print debug message if verbose mode is enabled."""
         if self.options and hasattr(self.options, 'verbose') and self.options.verbose:
@@ -101,6 +196,8 @@ class Config:
                         self.validate_device_config(device)
                         self.devices[device['name']] = device
                         self.debug(f"Added device: {device['name']} -> {device['device']}")
+                    self.index_devices()
+                    self.debug(f"Indexed {len(self.groups)} device groups and {len(self.tag_index)} device tags")
                 else:
                     self.debug("No 'devices' array found in config")
                 
@@ -186,6 +283,40 @@ class Config:
         if 'password' in device and not isinstance(device['password'], str):
             raise ValueError("Device 'password' must be a string")
 
+        if 'baudrate' in device and (not isinstance(device['baudrate'], int) or isinstance(device['baudrate'], bool) or device['baudrate'] <= 0):
+            raise ValueError("Device 'baudrate' must be a positive integer")
+
+        if 'read_timeout' in device and (not isinstance(device['read_timeout'], (int, float)) or device['read_timeout'] <= 0):
+            raise ValueError("Device 'read_timeout' must be a positive number of seconds")
+
+        if 'flow_control' in device and device['flow_control'] not in ('none', 'rtscts', 'xonxoff', 'dsrdtr'):
+            raise ValueError("Device 'flow_control' must be one of: none, rtscts, xonxoff, dsrdtr")
+
+        if 'write_chunk_size' in device and (not isinstance(device['write_chunk_size'], int) or device['write_chunk_size'] <= 0):
+            raise ValueError("Device 'write_chunk_size' must be a positive integer")
+
+        if 'write_delay' in device and (not isinstance(device['write_delay'], (int, float)) or device['write_delay'] < 0):
+            raise ValueError("Device 'write_delay' must be a non-negative number of seconds")
+
+        if 'write_timeout' in device and (not isinstance(device['write_timeout'], (int, float)) or device['write_timeout'] <= 0):
+            raise ValueError("Device 'write_timeout' must be a positive number of seconds")
+
+        if 'write_verify' in device and not isinstance(device['write_verify'], bool):
+            raise ValueError("Device 'write_verify' must be true or false")
+
+        if 'compress' in device and not isinstance(device['compress'], bool):
+            raise ValueError("Device 'compress' must be true or false")
+
+        if 'groups' in device and (not isinstance(device['groups'], list) or
+                                   not all(isinstance(group, str) and group and ',' not in group for group in device['groups'])):
+            raise ValueError("Device 'groups' must be a list of group names without commas")
+
+        if 'tags' in device:
+            if not isinstance(device['tags'], dict) or not all(isinstance(value, str) for value in device['tags'].values()):
+                raise ValueError("Device 'tags' must be an object of tag names and string values")
+            if any(not tag or ',' in tag or '=' in tag for tag in device['tags']):
+                raise ValueError("Device tag names must not be empty or contain ',' or '='")
+
     def validate_command_alias_config(self, alias):
         """Validate command alias configuration structure."""
         if not isinstance(alias, dict):
@@ -4,34 +4,149 @@
 
 import re
 import time
+import queue
+import codecs
 import base64
 import serial
+import selectors
 import websocket
 import threading
 from urllib.parse import urlparse
 
 
+DEFAULT_BAUDRATE = 115200
+DEFAULT_READ_TIMEOUT = 1
+
+# pyserial settings for each flow_control value
+FLOW_CONTROL = {
+    'none': {'rtscts': False, 'xonxoff': False, 'dsrdtr': False},
+    'rtscts': {'rtscts': True, 'xonxoff': False, 'dsrdtr': False},
+    'xonxoff': {'rtscts': False, 'xonxoff': True, 'dsrdtr': False},
+    'dsrdtr': {'rtscts': False, 'xonxoff': False, 'dsrdtr': True},
+}
+
+# Rates tried by probe_baudrate(), fastest first
+PROBE_BAUDRATES = (921600, 460800, 230400, 115200, 57600, 38400, 19200, 9600)
+
+
+def probe_baudrate(port, rates=PROBE_BAUDRATES, flow_control='none', timeout=0.3, debug_options=None):
+    """
+    Find the fastest rate at which the board behind a serial port answers.
+
+    Each rate is tried by interrupting the board (Ctrl+C) and waiting for the
+    REPL prompt; at the wrong rate only garbage comes back. Rates the port or
+    bridge refuses to open at are skipped.
+
+    Returns:
+        int: the fastest working rate, or None if the board never answered
+    """
+    debug_options = debug_options or {}
+    verbose = debug_options.get('verbose') and not debug_options.get('quiet')
+
+    for rate in rates:
+        try:
+            with serial.Serial(port=port, baudrate=rate, timeout=timeout, **FLOW_CONTROL[flow_control]) as probe:
+                probe.reset_input_buffer()
+                probe.write(b'\x03\x03\x03')
+                probe.flush()
+                reply = b''
+                deadline = time.monotonic() + timeout
+                while b'>>> ' not in reply and time.monotonic() < deadline:
+                    reply += probe.read(max(1, probe.in_waiting))
+        except (serial.SerialException, ValueError, OSError) as e:
+            if verbose:
+                print(f"DEBUG: {port} can't be opened at {rate} bps: {e}")
+            continue
+
+        if b'>>> ' in reply:
+            if verbose:
+                print(f"DEBUG: Board on {port} answered at {rate} bps")
+            return rate
+        if verbose:
+            print(f"DEBUG: No prompt from {port} at {rate} bps (received {reply[-32:]!r})")
+
+    return None
+
+
 class CircuitPythonConnection:
-    def __init__(self, connection_string, password=None, debug_options=None):
+    def __init__(self, connection_string, password=None, debug_options=None, device_options=None):
         self.connection_string = connection_string
         self.password = password
         self.debug_options = debug_options or {}
+        
+        # Transport settings, usually from the device entry in config.json
+        device_options = device_options or {}
+        self.baudrate = device_options.get('baudrate') or DEFAULT_BAUDRATE
+        self.read_timeout = device_options.get('read_timeout', DEFAULT_READ_TIMEOUT)
+        self.flow_control = device_options.get('flow_control') or 'none'
+        self.write_chunk_size = device_options.get('write_chunk_size')
+        self.write_delay = device_options.get('write_delay', 0)
+        self.write_timeout = device_options.get('write_timeout')
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        
         self.connection = None
         self.connection_type = None
+        # Wakes us when the serial port has data, where the platform supports it
+        self.selector = None
         self.ws_messages = []
         self.ws_message_handlers = []
         self.ws_error_handlers = []
         self.ws_close_handlers = []
+        # Bytes received but not yet consumed by read_until()/read_data()
+        self.rx_buffer = bytearray()
+        # Keeps characters split across reads together for read_nonblock()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        # WebSocket messages that arrived before any message handler was registered
+        self.ws_pending = queue.Queue()
+        self.ws_handler_lock = threading.Lock()
         
         self.establish_connection()
 
     def write(self, data):
-        """Write data to the connection."""
+        """
+        Write data (str or bytes) to the connection.
+        
+        Data is split into write_chunk_size pieces with write_delay seconds
+        between them when those are configured for the device.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         self.debug(f"Writing {len(data)} bytes")
-        if self.connection_type == 'serial':
-            self.connection.write(data.encode('utf-8'))
-        else:
-            self.connection.send(data)
+        
+        chunk_size = self.write_chunk_size or len(data) or 1
+        start_time = time.monotonic()
+        for offset in range(0, len(data), chunk_size):
+            if offset and self.write_delay:
+                time.sleep(self.write_delay)
+            self.write_chunk(data[offset:offset + chunk_size])
+        
+        self.bytes_written += len(data)
+        self.write_seconds += time.monotonic() - start_time
+
+    def write_chunk(self, chunk):
+        """Write one chunk, resuming after partial writes."""
+        if self.connection_type != 'serial':
+            # Bytes go out unchanged so a chunk may end part way through a character
+            self.connection.send(chunk)
+            return
+        
+        while chunk:
+            try:
+                written = self.connection.write(chunk)
+            except serial.SerialTimeoutException:
+                raise RuntimeError(f"Timed out after {self.write_timeout} seconds writing to {self.connection_string}")
+            
+            if not isinstance(written, int) or written >= len(chunk):
+                return
+            self.debug(f"Partial write of {written} of {len(chunk)} bytes, resuming")
+            chunk = chunk[written:]
+
+    def write_rate(self):
+        """Average write throughput so far in bytes per second."""
+        if not self.write_seconds:
+            return 0.0
+        return self.bytes_written / self.write_seconds
 
     def flush(self):
         """Flush the connection buffer."""
@@ -42,23 +157,150 @@ class CircuitPythonConnection:
     def close(self):
         """Close the connection."""
         self.debug(f"Closing {self.connection_type} connection")
+        if self.selector:
+            self.selector.close()
+            self.selector = None
         if self.connection:
             if self.connection_type == 'serial':
                 self.connection.close()
             else:
                 self.connection.close()
 
+    def read_data(self, max_bytes=1024):
+        """
+        Read bytes from serial connection.
+        
+        Returns as soon as any data has arrived, or b'' once the read timeout
+        expires; waiting for data doesn't use the CPU.
+        """
+        if self.connection_type != 'serial':
+            raise RuntimeError("read_data not supported for WebSocket connections")
+        
+        if not self.rx_buffer:
+            if self.selector is None:
+                return self.connection.read(max_bytes)
+            self.rx_buffer.extend(self.read_ready(self.read_timeout))
+        data = bytes(self.rx_buffer[:max_bytes])
+        del self.rx_buffer[:max_bytes]
+        return data
+
     def read_nonblock(self, max_bytes=1024):
-        """Read data from serial connection (non-blocking)."""
+        """
+        Read text from serial connection, like read_data().
+        
+        A character split across two reads is returned whole with the second one.
+        """
         if self.connection_type == 'serial':
-            return self.connection.read(max_bytes).decode('utf-8', errors='ignore')
+            return self.text_decoder.decode(self.read_data(max_bytes))
         else:
             raise RuntimeError("read_nonblock not supported for WebSocket connections")
 
+    def read_until(self, terminator, timeout):
+        """
+        Read from the device until terminator is seen or timeout expires.
+        
+        Anything received after the terminator stays buffered for the next read.
+        
+        Returns:
+            bytes: Data consumed, ending with terminator unless the timeout expired
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self.rx_buffer.find(terminator)
+            if index >= 0:
+                end = index + len(terminator)
+                data = bytes(self.rx_buffer[:end])
+                del self.rx_buffer[:end]
+                return data
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                data = bytes(self.rx_buffer)
+                self.rx_buffer.clear()
+                self.debug(f"Timed out waiting for {terminator!r}")
+                return data
+            
+            self.rx_buffer.extend(self.receive(remaining))
+
+    def read_bytes(self, count, timeout):
+        """
+        Read exactly count bytes unless timeout expires first.
+        
+        A timeout of 0 only returns data that has already arrived.
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.rx_buffer) < count:
+            data = self.receive(max(0, deadline - time.monotonic()))
+            self.rx_buffer.extend(data)
+            if not data and time.monotonic() >= deadline:
+                break
+        
+        data = bytes(self.rx_buffer[:count])
+        del self.rx_buffer[:count]
+        return data
+
+    def read_available(self, timeout):
+        """Return buffered data, or wait up to timeout seconds for new data."""
+        if self.rx_buffer:
+            data = bytes(self.rx_buffer)
+            self.rx_buffer.clear()
+            return data
+        return self.receive(timeout)
+
+    def receive(self, timeout):
+        """Wait up to timeout seconds for data and return whatever arrived."""
+        if self.connection_type == 'serial':
+            if self.selector is not None:
+                return self.read_ready(timeout)
+            
+            saved_timeout = self.connection.timeout
+            try:
+                self.connection.timeout = timeout
+                data = self.connection.read(1)
+                waiting = self.connection.in_waiting
+                if data and waiting:
+                    data += self.connection.read(waiting)
+            finally:
+                self.connection.timeout = saved_timeout
+            return data
+        
+        try:
+            data = self.ws_pending.get(timeout=timeout)
+        except queue.Empty:
+            return b''
+        while True:
+            try:
+                data += self.ws_pending.get_nowait()
+            except queue.Empty:
+                return data
+
+    def read_ready(self, timeout):
+        """
+        Wait in select() until the serial port is readable, then read everything waiting.
+        
+        The read size follows in_waiting, so a burst of output is collected in one
+        read and a single byte is passed on without waiting for more.
+        """
+        if not self.selector.select(timeout):
+            return b''
+        # Readable with nothing waiting means a hangup; read(1) reports it
+        return self.connection.read(max(1, self.connection.in_waiting))
+
     def on_message(self, handler):
-        """Register a message handler for WebSocket connections."""
+        """Register a message handler for WebSocket connections; it is called with bytes."""
         if self.connection_type == 'websocket':
-            self.ws_message_handlers.append(handler)
+            with self.ws_handler_lock:
+                # Hand over anything received before the handler was registered
+                pending = bytes(self.rx_buffer)
+                self.rx_buffer.clear()
+                while True:
+                    try:
+                        pending += self.ws_pending.get_nowait()
+                    except queue.Empty:
+                        break
+                if pending:
+                    handler(pending)
+                self.ws_message_handlers.append(handler)
         else:
             raise RuntimeError("on_message only supported for WebSocket connections")
 
@@ -103,34 +345,38 @@ class CircuitPythonConnection:
             headers['Authorization'] = f"Basic {auth_string}"
             self.debug("Added basic auth header")
         
-        # Track connection status
+        # Track connection status; the callbacks run on the WebSocket thread and
+        # set connect_done once the outcome is known
         connection_error = None
         connection_established = False
+        connect_done = threading.Event()
         
         def on_error(ws, error):
             nonlocal connection_error
-            connection_error = error
             self.debug(f"WebSocket connection error: {error}")
+            error_str = str(error.args[0]) if hasattr(error, 'args') and len(error.args) > 0 else ''
             
             # Check for 401 unauthorized error
-            if hasattr(error, 'status_code') and error.status_code == 401:
-                connection_error = "Bad password - authentication failed"
-            elif hasattr(error, 'args') and len(error.args) > 0:
-                error_str = str(error.args[0])
-                if '401' in error_str or 'unauthorized' in error_str.lower():
-                    connection_error = "Bad password - authentication failed"
+            if getattr(error, 'status_code', None) == 401 or '401' in error_str or 'unauthorized' in error_str.lower():
+                error = "Bad password - authentication failed"
             # Check for connection refused error
-            elif isinstance(error, ConnectionRefusedError):
-                connection_error = "Connection refused"
-            elif hasattr(error, 'args') and len(error.args) > 0:
-                error_str = str(error.args[0])
-                if 'connection refused' in error_str.lower() or 'refused' in error_str.lower():
-                    connection_error = "Connection refused"
+            elif isinstance(error, ConnectionRefusedError) or 'refused' in error_str.lower():
+                error = "Connection refused"
+            
+            # Only wake the waiting thread once the error has been classified
+            connection_error = error
+            connect_done.set()
         
         def on_open(ws):
             nonlocal connection_established
             connection_established = True
             self.debug("WebSocket connection opened successfully")
+            connect_done.set()
+        
+        def on_close(ws, close_status_code, close_msg):
+            # A close before the connection opened means it failed
+            connect_done.set()
+            self._on_ws_close(ws, close_status_code, close_msg)
         
         try:
             self.debug("Attempting to connect to WebSocket")
@@ -142,7 +388,7 @@ class CircuitPythonConnection:
                 on_open=on_open,
                 on_message=self._on_ws_message,
                 on_error=on_error,
-                on_close=self._on_ws_close
+                on_close=on_close
             )
             
             # Start WebSocket in a separate thread
@@ -152,12 +398,10 @@ class CircuitPythonConnection:
             
             # Wait for connection to establish or fail
             timeout = 5  # 5 second timeout
-            start_time = time.time()
-            while not connection_established and connection_error is None:
-                if time.time() - start_time > timeout:
-                    connection_error = "Connection timeout"
-                    break
-                time.sleep(0.1)
+            if not connect_done.wait(timeout):
+                connection_error = "Connection timeout"
+            elif not connection_established and connection_error is None:
+                connection_error = "Connection closed before it was established"
             
             # Check for connection errors
             if connection_error:
@@ -226,32 +470,55 @@ class CircuitPythonConnection:
         
         try:
             self.debug(f"Attempting to open serial port '{self.connection_string}'")
-            self.debug("Serial port settings: 115200 bps, 8 data bits, 1 stop bit, no parity")
+            self.debug(f"Serial port settings: {self.baudrate} bps, 8 data bits, 1 stop bit, no parity, "
+                       f"flow control {self.flow_control}, read timeout {self.read_timeout}s")
             
             self.connection = serial.Serial(
                 port=self.connection_string,
-                baudrate=115200,
+                baudrate=self.baudrate,
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=1
+                timeout=self.read_timeout,
+                **FLOW_CONTROL[self.flow_control]
             )
             
+            if self.write_timeout:
+                self.connection.write_timeout = self.write_timeout
+            
+            self.selector = self.make_selector()
+            
             self.debug("Serial port opened successfully")
             if self.debug_options and self.debug_options.get('verbose'):
-                print(f"Opened serial port {self.connection_string} at 115200 bps")
+                print(f"Opened serial port {self.connection_string} at {self.baudrate} bps")
             
         except Exception as e:
             print(f"Error opening serial port: {e}")
             self.debug(f"Serial port error details: {type(e).__name__}: {e}")
             raise
 
-    def is_websocket_connection(self, connection_string):
+    def make_selector(self):
+        """Watch the serial port's file descriptor; None where ports have none (Windows)."""
+        try:
+            fd = self.connection.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        if not isinstance(fd, int):
+            return None
+        
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+        self.debug(f"Waiting for serial data with {type(selector).__name__}")
+        return selector
+
+    @staticmethod
+    def is_websocket_connection(connection_string):
         """Check if connection string looks like an IP address."""
         ip_pattern = r'^(\d{1,3}\.){3}\d{1,3}(:\d+)?$'
         return bool(re.match(ip_pattern, connection_string))
 
-    def parse_websocket_connection(self, connection_string):
+    @staticmethod
+    def parse_websocket_connection(connection_string):
         """Parse WebSocket connection string into host and port."""
         if ':' in connection_string:
             host, port = connection_string.split(':', 1)
@@ -263,13 +530,20 @@ class CircuitPythonConnection:
         return host, port
 
     def _on_ws_message(self, ws, message):
-        """Handle WebSocket message events."""
+        """Handle WebSocket message events; handlers are given the message as bytes."""
         self.debug(f"WebSocket message received: {message}")
-        for handler in self.ws_message_handlers:
-            try:
-                handler(message)
-            except Exception as e:
-                self.debug(f"Error in WebSocket message handler: {e}")
+        if isinstance(message, str):
+            # websocket-client has already decoded text frames
+            message = message.encode('utf-8')
+        with self.ws_handler_lock:
+            if not self.ws_message_handlers:
+                self.ws_pending.put(message)
+                return
+            for handler in self.ws_message_handlers:
+                try:
+                    handler(message)
+                except Exception as e:
+                    self.debug(f"Error in WebSocket message handler: {e}")
 
     def _on_ws_error(self, ws, error):
         """Handle WebSocket error events."""
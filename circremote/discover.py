@@ -0,0 +1,180 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Finding Web Workflow devices on a local network.
+
+Every address in a range is asked for /cp/version.json, which CircuitPython
+serves without a password. Hundreds of addresses are asked at once from
+one event loop with a short timeout each, so a /24 takes about as long as
+one timeout. Each board found is remembered in the device cache under its
+address, with its board_id and hostname.
+"""
+
+import json
+import asyncio
+import ipaddress
+
+
+VERSION_PATH = '/cp/version.json'
+
+DEFAULT_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 1.0
+
+# Larger ranges are almost certainly a mistake
+MAX_ADDRESSES = 65536
+
+# The most of a response we'll read; version.json is a few hundred bytes
+MAX_RESPONSE = 64 * 1024
+
+# Facts from version.json kept in the device cache
+FACTS = ('board_id', 'board_name', 'hostname', 'version', 'mcu_name', 'web_api_version')
+
+
+def parse_network(spec):
+    """
+    Parse a range to search, like 192.168.1.0/24 or 192.168.1.0/24:8080.
+
+    Returns:
+        tuple: (ipaddress network, port)
+
+    Raises:
+        ValueError: If spec isn't an IPv4 range or is larger than MAX_ADDRESSES
+    """
+    network, _, port = spec.partition(':')
+    try:
+        network = ipaddress.IPv4Network(network, strict=False)
+        port = int(port) if port else 80
+    except ValueError as e:
+        raise ValueError(f"Expected a range like 192.168.1.0/24, not '{spec}': {e}") from None
+    if network.num_addresses > MAX_ADDRESSES:
+        raise ValueError(f"{network} has {network.num_addresses} addresses; search at most a /16")
+    return network, port
+
+
+def dechunk(body):
+    """Undo chunked transfer encoding."""
+    data = bytearray()
+    while body:
+        size_line, _, body = body.partition(b'\r\n')
+        size = int(size_line.split(b';')[0], 16)
+        if size == 0:
+            break
+        data += body[:size]
+        body = body[size + 2:]
+    return bytes(data)
+
+
+def parse_response(response):
+    """
+    Get the JSON object out of an HTTP response to a version.json request.
+
+    Returns:
+        dict: The object, or None if the response isn't a successful JSON one
+    """
+    head, separator, body = response.partition(b'\r\n\r\n')
+    if not separator:
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    status = lines[0].split()
+    if len(status) < 2 or status[1] != '200':
+        return None
+    headers = {name.strip().lower(): value.strip()
+               for name, _, value in (line.partition(':') for line in lines[1:])}
+    try:
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = dechunk(body)
+        version = json.loads(body.decode('utf-8'))
+    except ValueError:
+        return None
+    return version if isinstance(version, dict) else None
+
+
+async def probe(host, port=80, timeout=DEFAULT_TIMEOUT):
+    """
+    Ask one address for its Web Workflow version.json.
+
+    Returns:
+        dict: The parsed version.json, or None if nothing answered like a CircuitPython board
+    """
+    async def ask():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f"GET {VERSION_PATH} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n"
+                         f"Connection: close\r\n\r\n".encode('ascii'))
+            await writer.drain()
+            response = bytearray()
+            while len(response) < MAX_RESPONSE:
+                data = await reader.read(MAX_RESPONSE - len(response))
+                if not data:
+                    break
+                response += data
+            return bytes(response)
+        finally:
+            writer.close()
+
+    try:
+        response = await asyncio.wait_for(ask(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    return parse_response(response)
+
+
+async def discover(network, port=80, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, on_found=None):
+    """
+    Ask every host address in network for version.json, concurrency at a time.
+
+    Args:
+        network: An ipaddress network, or a string like 192.168.1.0/24
+        on_found: Called with (address, version) as each board is found
+
+    Returns:
+        list: (address, version) pairs for the boards that answered, in address order;
+            address includes the port unless it's 80
+    """
+    if isinstance(network, str):
+        network = ipaddress.IPv4Network(network, strict=False)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def probe_one(host):
+        async with semaphore:
+            version = await probe(str(host), port, timeout)
+        if version is None:
+            return None
+        address = str(host) if port == 80 else f"{host}:{port}"
+        if on_found:
+            on_found(address, version)
+        return address, version
+
+    hosts = list(network.hosts()) or [network.network_address]
+    results = await asyncio.gather(*(probe_one(host) for host in hosts))
+    return [result for result in results if result is not None]
+
+
+def remember(cache, address, version):
+    """
+    Keep what version.json says about a board in the device cache, under its address.
+
+    Remember many boards inside cache.batch() to write the cache file once.
+    """
+    facts = {fact: version[fact] for fact in FACTS if fact in version}
+    cache.set(address, 'web_workflow', facts)
+    return facts
+
+
+def find_by_hostname(cache, hostname):
+    """
+    Find the address of a board discovered earlier from its hostname, with or without .local.
+
+    Returns:
+        str: The address, or None if no discovered board has that hostname
+    """
+    wanted = hostname.lower()
+    if wanted.endswith('.local'):
+        wanted = wanted[:-len('.local')]
+    for address in cache.load():
+        facts = cache.get(address, 'web_workflow')
+        if facts and str(facts.get('hostname', '')).lower() == wanted:
+            return address
+    return None
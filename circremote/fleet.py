@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Running one command on many devices at once.
+
+All the devices are driven from one event loop with circremote.aio, at
+most concurrency at a time, so a sweep of a fleet takes about as long as
+its slowest board rather than the sum of them all. Each device has its
+own time limit; one that fails or hangs doesn't hold up the others.
+"""
+
+import time
+import asyncio
+
+from .aio import run_code
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DEVICE_TIMEOUT = 60.0
+
+
+class FleetResult:
+    """How running the command went on one device."""
+
+    def __init__(self, device, ok, elapsed, output='', error=None):
+        self.device = device
+        self.ok = ok
+        self.elapsed = elapsed
+        self.output = output
+        self.error = error
+
+
+async def run_fleet(devices, code, timeout=10.0, concurrency=DEFAULT_CONCURRENCY,
+                    device_timeout=DEFAULT_DEVICE_TIMEOUT, cache=None, debug_options=None, on_output=None):
+    """
+    Run prepared command code on each device, several at a time.
+
+    Args:
+        devices: Device entries, each with at least 'name' and 'device'
+        timeout: Seconds to wait for each device's output (0 = wait indefinitely)
+        concurrency: Most devices to work on at once
+        device_timeout: Seconds each device gets in all, from connecting to
+            disconnecting (0 = no limit)
+        on_output: Called with (device entry, text) as each device's output arrives
+
+    Returns:
+        list: A FleetResult for each device, in the order given
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(device_info):
+        async with semaphore:
+            start = time.monotonic()
+            callback = (lambda text: on_output(device_info, text)) if on_output else None
+            run = run_code(device_info, code, timeout, cache, debug_options, callback)
+            try:
+                if device_timeout:
+                    output = await asyncio.wait_for(run, device_timeout)
+                else:
+                    output = await run
+            except asyncio.TimeoutError:
+                return FleetResult(device_info['name'], False, time.monotonic() - start,
+                                   error=f"No result after {device_timeout:g} seconds")
+            except Exception as e:
+                return FleetResult(device_info['name'], False, time.monotonic() - start,
+                                   error=str(e) or type(e).__name__)
+            return FleetResult(device_info['name'], True, time.monotonic() - start, output)
+
+    return await asyncio.gather(*(run_one(device_info) for device_info in devices))
+
+
+def summary_lines(results, elapsed):
+    """
+    Lay out fleet results as a table, one row per device, and a total.
+
+    Returns:
+        list: Lines of text
+    """
+    width = max([len('Device')] + [len(result.device) for result in results])
+    lines = [f"{'Device':<{width}}  Result  {'Time':>8}"]
+    for result in results:
+        row = f"{result.device:<{width}}  {'ok' if result.ok else 'failed':<6}  {result.elapsed:>6.1f} s"
+        if result.error:
+            row += f"  {result.error}"
+        lines.append(row)
+    failed = sum(1 for result in results if not result.ok)
+    lines.append(f"{len(results)} devices: {len(results) - failed} succeeded, {failed} failed in {elapsed:.1f} s")
+    return lines
@@ -0,0 +1,180 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Binary frames sent by device code alongside its ordinary print output.
+
+Printing a few hundred numbers as formatted text is slow on the device
+and bulky on the wire. Commands that call send_frame() get a small
+helper added ahead of their code which packs the numbers with struct
+and prints them as one line:
+
+    ***FRAME***<base64 of header + payload + CRC-32>
+
+The header is little-endian: channel (uint8), struct type code (uint8)
+and payload length in bytes (uint32). The CRC-32 covers the header and
+payload. The console only carries text, so frames are base64 encoded.
+FrameDemux picks those lines out of the output stream and decodes them.
+"""
+
+import re
+import struct
+import binascii
+from collections import namedtuple
+
+
+FRAME_PREFIX = '***FRAME***'
+
+HEADER = struct.Struct('<BBI')
+CHECKSUM = struct.Struct('<I')
+
+# struct type codes of the values a frame can carry
+TYPECODES = 'bBhHiIlLqQfd'
+
+Frame = namedtuple('Frame', 'channel typecode values')
+
+# Added ahead of command code that calls send_frame(); runs on the device
+DEVICE_HELPER = '''import struct as _frame_struct
+import binascii as _frame_binascii
+def send_frame(values, typecode='f', channel=0):
+    payload = _frame_struct.pack('<%d%s' % (len(values), typecode), *values)
+    header = _frame_struct.pack('<BBI', channel, ord(typecode), len(payload))
+    crc = _frame_binascii.crc32(payload, _frame_binascii.crc32(header)) & 0xffffffff
+    frame = header + payload + _frame_struct.pack('<I', crc)
+    print('***FRAME***' + _frame_binascii.b2a_base64(frame).decode().strip())
+'''
+
+USES_FRAMES = re.compile(r'\bsend_frame\s*\(')
+
+
+def add_device_helper(code):
+    """Put the send_frame() helper ahead of code that uses it; other code is returned as is."""
+    if not USES_FRAMES.search(code):
+        return code
+    return DEVICE_HELPER + code
+
+
+def encode_frame(values, typecode='f', channel=0):
+    """Encode values the way the device helper does, returning the line without its line ending."""
+    if typecode not in TYPECODES:
+        raise ValueError(f"Unsupported frame type code: {typecode!r}")
+    payload = struct.pack(f'<{len(values)}{typecode}', *values)
+    header = HEADER.pack(channel, ord(typecode), len(payload))
+    checksum = CHECKSUM.pack(binascii.crc32(header + payload))
+    return FRAME_PREFIX + binascii.b2a_base64(header + payload + checksum).decode('ascii').strip()
+
+
+def format_frame(frame):
+    """Show a frame as a line of text."""
+    if frame.typecode in 'fd':
+        values = ' '.join(f'{value:.6g}' for value in frame.values)
+    else:
+        values = ' '.join(str(value) for value in frame.values)
+    return f"frame {frame.channel} ({len(frame.values)} x {frame.typecode}): {values}\r\n"
+
+
+def decode_frame(encoded):
+    """
+    Decode the base64 part of a frame line.
+
+    Raises:
+        ValueError: If the frame is truncated, damaged or of an unknown type
+    """
+    try:
+        frame = binascii.a2b_base64(encoded)
+    except binascii.Error as e:
+        raise ValueError(f"Frame is not valid base64: {e}") from None
+
+    if len(frame) < HEADER.size + CHECKSUM.size:
+        raise ValueError(f"Frame is too short: {len(frame)} bytes")
+    channel, typecode, length = HEADER.unpack_from(frame)
+    if len(frame) != HEADER.size + length + CHECKSUM.size:
+        raise ValueError(f"Frame length is {len(frame)} bytes, header says {HEADER.size + length + CHECKSUM.size}")
+
+    body = frame[:-CHECKSUM.size]
+    checksum, = CHECKSUM.unpack_from(frame, len(body))
+    if binascii.crc32(body) != checksum:
+        raise ValueError("Frame checksum does not match")
+
+    typecode = chr(typecode)
+    if typecode not in TYPECODES:
+        raise ValueError(f"Unsupported frame type code: {typecode!r}")
+    size = struct.calcsize(f'<{typecode}')
+    if length % size:
+        raise ValueError(f"Frame payload of {length} bytes isn't a whole number of '{typecode}' values")
+    values = struct.unpack_from(f'<{length // size}{typecode}', frame, HEADER.size)
+    return Frame(channel, typecode, values)
+
+
+class FrameDemux:
+    """
+    Separate frames from ordinary output.
+
+    Ordinary output is passed on to output as soon as it arrives; only
+    the start of a line that could still turn out to be a frame is held
+    back. Each decoded frame is passed to on_frame, and damaged frames
+    are counted in damaged and dropped.
+    """
+
+    def __init__(self, output, on_frame):
+        self.output = output
+        self.on_frame = on_frame
+        self.buffer = ''
+        self.at_line_start = True
+        self.in_frame = False
+        self.frames = 0
+        self.damaged = 0
+
+    def write(self, text):
+        self.buffer += text
+        passed = []
+        while self.buffer:
+            if self.in_frame:
+                end = self.buffer.find('\n')
+                if end < 0:
+                    break
+                self.frame_line(self.buffer[:end])
+                self.buffer = self.buffer[end + 1:]
+                self.in_frame = False
+                self.at_line_start = True
+            elif self.at_line_start:
+                if self.buffer.startswith(FRAME_PREFIX):
+                    self.buffer = self.buffer[len(FRAME_PREFIX):]
+                    self.in_frame = True
+                elif FRAME_PREFIX.startswith(self.buffer):
+                    # Too little of the line to tell yet
+                    break
+                else:
+                    self.at_line_start = False
+            else:
+                end = self.buffer.find('\n')
+                if end < 0:
+                    passed.append(self.buffer)
+                    self.buffer = ''
+                else:
+                    passed.append(self.buffer[:end + 1])
+                    self.buffer = self.buffer[end + 1:]
+                    self.at_line_start = True
+
+        if passed:
+            self.output.write(''.join(passed))
+
+    def frame_line(self, encoded):
+        try:
+            frame = decode_frame(encoded.strip())
+        except ValueError:
+            self.damaged += 1
+            return
+        self.frames += 1
+        self.on_frame(frame)
+
+    def close(self):
+        """Handle whatever is left: a frame missing its line ending, or the start of a line."""
+        if self.in_frame:
+            self.frame_line(self.buffer)
+        elif self.buffer:
+            self.output.write(self.buffer)
+        self.buffer = ''
+        self.in_frame = False
+        self.output.close()
@@ -0,0 +1,163 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Facts about devices, gathered once and kept in the device cache.
+
+INVENTORY_CODE is a compact, machine-readable version of the info command:
+it prints one line holding the CircuitPython version, machine, board_id,
+the names in the board module, whether there's Wi-Fi and the libraries in
+/lib. The facts are stored under 'inventory' for each device in
+~/.circremote/cache.json, so questions like "which boards run 9.x and
+have Wi-Fi" can be answered without touching the hardware.
+"""
+
+import re
+import json
+import fnmatch
+
+
+INVENTORY_PREFIX = 'INVENTORY:'
+
+# Facts older than this are taken again
+INVENTORY_MAX_AGE = 24 * 60 * 60
+
+# Runs on the board
+INVENTORY_CODE = """import os, gc, json, board
+facts = {}
+uname = os.uname()
+version = uname.version.split(' on ')
+facts['version'] = version[0]
+facts['date'] = version[1] if len(version) > 1 else ''
+facts['machine'] = uname.machine
+facts['board_id'] = board.board_id
+facts['board'] = sorted([name for name in dir(board) if not name.startswith('_')])
+try:
+    import wifi
+    facts['wifi'] = True
+except ImportError:
+    facts['wifi'] = False
+libs = []
+try:
+    for name in os.listdir('/lib'):
+        for suffix in ('.mpy', '.py'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        libs.append(name)
+except OSError:
+    pass
+facts['libs'] = sorted(libs)
+try:
+    stat = os.statvfs('/')
+    facts['flash_size'] = stat[0] * stat[2]
+    facts['flash_free'] = stat[0] * stat[3]
+except (OSError, AttributeError):
+    pass
+gc.collect()
+try:
+    facts['memory_total'] = gc.mem_free() + gc.mem_alloc()
+except AttributeError:
+    pass
+print('INVENTORY:' + json.dumps(facts))
+"""
+
+# The module name in a requirements.txt line, without any version
+REQUIREMENT_NAME = re.compile(r'^\s*([A-Za-z0-9_.\-]+)')
+
+# The "Initialize I2C with fallback" block sensor commands start with, once its pins are filled in
+I2C_FALLBACK = re.compile(
+    r'^try:\n[ \t]+(\w+) = busio\.I2C\((board\.\w+), (board\.\w+)\)[ \t]*\n'
+    r'except[^\n]*:\n[ \t]+\1 = board\.I2C\(\)[ \t]*$',
+    re.MULTILINE
+)
+
+
+def parse_inventory(output):
+    """
+    Find the facts in the output of INVENTORY_CODE.
+
+    Returns:
+        dict: The facts, or None if the output doesn't hold them
+    """
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(INVENTORY_PREFIX):
+            try:
+                facts = json.loads(line[len(INVENTORY_PREFIX):])
+            except ValueError:
+                return None
+            return facts if isinstance(facts, dict) else None
+    return None
+
+
+def requirement_name(line):
+    """The library a requirements.txt line asks for, in the form it has in /lib."""
+    match = REQUIREMENT_NAME.match(line)
+    return match.group(1).lower().replace('-', '_') if match else None
+
+
+def missing_libraries(facts, requirements):
+    """List the requirements that aren't among the libraries the facts show in /lib."""
+    installed = {name.lower() for name in facts.get('libs', [])}
+    return [line for line in requirements if requirement_name(line) not in installed]
+
+
+def missing_pins(facts, values):
+    """List the board.NAME values that name something the board module doesn't have."""
+    names = set(facts.get('board', []))
+    return [value for value in values
+            if isinstance(value, str) and value.startswith('board.') and value[len('board.'):] not in names]
+
+
+def skip_pin_fallback(code, facts):
+    """
+    Replace the I2C fallback block in command code with the one branch the
+    board's facts say will work: the pins it was given if the board has
+    them, otherwise the board's default bus. Blocks the facts can't settle
+    are left as they are.
+    """
+    def choose(match):
+        bus, scl, sda = match.groups()
+        if not missing_pins(facts, (scl, sda)):
+            return f"{bus} = busio.I2C({scl}, {sda})"
+        if 'I2C' in facts.get('board', []):
+            return f"{bus} = board.I2C()"
+        return match.group(0)
+
+    return I2C_FALLBACK.sub(choose, code)
+
+
+def matches(facts, filters):
+    """
+    Check facts against filters, a list of (fact, pattern) pairs.
+
+    Patterns are shell-style, like 9.*; true and false match yes/no facts
+    such as wifi.
+    """
+    for fact, pattern in filters:
+        value = facts.get(fact)
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, list):
+            if not any(fnmatch.fnmatchcase(str(item), pattern) for item in value):
+                return False
+            continue
+        if value is None or not fnmatch.fnmatchcase(str(value), pattern):
+            return False
+    return True
+
+
+def find_devices(cache, names, filters=(), max_age=INVENTORY_MAX_AGE):
+    """
+    Look up the devices among names whose cached facts match filters.
+
+    Returns:
+        list: (name, facts) pairs; devices without fresh facts are left out
+    """
+    found = []
+    for name in names:
+        facts = cache.get(name, 'inventory', max_age=max_age)
+        if facts is not None and matches(facts, filters):
+            found.append((name, facts))
+    return found
@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+START_MARKER = "***START***"
+END_MARKER = "***END***"
+
+# Statements wrapped around every program so its output can be told apart from REPL chatter
+START_STATEMENT = f"print('{START_MARKER}')\r\n"
+END_STATEMENT = f"print('{END_MARKER}')\r\n"
+
+
+class MarkerScanner:
+    """
+    Pick a program's output out of a stream by its start and end markers.
+
+    Data is fed in as it arrives and only the few characters that could be
+    the beginning of a marker split across reads are held back, so the work
+    per chunk doesn't depend on how much output came before it. Works on
+    str or bytes; feed it the same type as the markers.
+    """
+
+    def __init__(self, start=START_MARKER, end=END_MARKER):
+        self.start = start
+        self.end = end
+        self.empty = start[:0]
+        self.carry = self.empty
+        self.found_start = False
+        self.found_end = False
+
+    def feed(self, data):
+        """
+        Scan the next piece of the stream.
+
+        Returns:
+            The part of data that lies between the markers (possibly empty)
+        """
+        if self.found_end:
+            return self.empty
+
+        data = self.carry + data
+        if not self.found_start:
+            index = data.find(self.start)
+            if index < 0:
+                self.carry = data[len(data) - self.partial_match(data, self.start):]
+                return self.empty
+            self.found_start = True
+            data = data[index + len(self.start):]
+
+        index = data.find(self.end)
+        if index >= 0:
+            self.found_end = True
+            self.carry = self.empty
+            return data[:index]
+
+        keep = self.partial_match(data, self.end)
+        self.carry = data[len(data) - keep:]
+        return data[:len(data) - keep]
+
+    def flush(self):
+        """Return output held back as a possible partial end marker, e.g. when giving up at a timeout."""
+        data = self.carry if self.found_start and not self.found_end else self.empty
+        self.carry = self.empty
+        return data
+
+    @staticmethod
+    def partial_match(data, marker):
+        """Length of the longest tail of data that is the beginning of marker."""
+        for length in range(min(len(marker) - 1, len(data)), 0, -1):
+            if data.endswith(marker[:length]):
+                return length
+        return 0
@@ -0,0 +1,208 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Metrics taken from command output, published for Prometheus.
+
+Commands declare the lines that carry readings in info.json:
+
+    "metrics": [
+        {
+            "name": "temperature_celsius",
+            "pattern": "^Temperature: (?P<value>-?[0-9.]+)",
+            "unit": "celsius",
+            "help": "Air temperature"
+        }
+    ]
+
+The patterns are compiled once. Each output line is matched as it
+arrives and the latest value of each metric is kept, labelled with the
+device and command. Metrics can be written as a node_exporter
+textfile-collector file, served over HTTP, or both.
+"""
+
+import os
+import re
+import time
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .output import LineOutput
+
+
+METRIC_NAME = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+
+# Rewrite the textfile at most this often; Prometheus scrapes far less often anyway
+TEXTFILE_INTERVAL = 1.0
+
+
+class Metric:
+    """One metric a command declares: its name and the pattern that finds its value in a line."""
+
+    def __init__(self, name, pattern, unit=None, help=None):
+        self.name = name
+        self.pattern = pattern
+        self.unit = unit
+        self.help = help or name
+
+
+def load_metrics(info_data, command):
+    """
+    Compile the metrics a command's info.json declares.
+
+    Returns:
+        list: Metric objects, empty if the command doesn't declare any
+
+    Raises:
+        ValueError: If a metric is missing its name or pattern, has an invalid name,
+            or its pattern doesn't compile or has no value group
+    """
+    if not info_data or not info_data.get('metrics'):
+        return []
+
+    metrics = []
+    for entry in info_data['metrics']:
+        name = entry.get('name')
+        if not name or not METRIC_NAME.match(name):
+            raise ValueError(f"Invalid metric name in '{command}': {name!r}")
+        if not entry.get('pattern'):
+            raise ValueError(f"Metric '{name}' in '{command}' has no pattern")
+        try:
+            pattern = re.compile(entry['pattern'])
+        except re.error as e:
+            raise ValueError(f"Metric '{name}' in '{command}' has an invalid pattern: {e}") from None
+        if 'value' not in pattern.groupindex:
+            raise ValueError(f"Metric '{name}' in '{command}' needs a (?P<value>...) group in its pattern")
+        metrics.append(Metric(name, pattern, entry.get('unit'), entry.get('help')))
+    return metrics
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """The latest value of each metric for each device, shared between the output and the HTTP server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = {}
+
+    def set(self, metric, labels, value):
+        with self.lock:
+            self.metrics[metric.name] = metric
+            self.values[(metric.name, labels)] = value
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self.lock:
+            lines = []
+            for name in sorted(self.metrics):
+                metric = self.metrics[name]
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} gauge")
+                for (value_name, labels), value in sorted(self.values.items()):
+                    if value_name != name:
+                        continue
+                    label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels)
+                    lines.append(f"{name}{{{label_text}}} {value!r}")
+            return '\n'.join(lines) + '\n' if lines else ''
+
+
+def write_textfile(registry, path):
+    """Write the metrics for the textfile collector, atomically so it never reads a partial file."""
+    path = Path(path)
+    # The collector reads every *.prom file in the directory, so the temporary file mustn't be one
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(registry.render())
+        # mkstemp makes the file readable only by us, and the collector usually runs as another user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class MetricsOutput(LineOutput):
+    """
+    Turn matching output lines into metrics.
+
+    Each line is tried against the command's patterns; the first that
+    matches sets its metric. With textfile_path, the textfile is rewritten
+    at most once a second while values change, and once more on close.
+    """
+
+    def __init__(self, metrics, registry, device, command, textfile_path=None):
+        super().__init__()
+        self.metrics = metrics
+        self.registry = registry
+        self.labels = (('command', command), ('device', device))
+        self.textfile_path = textfile_path
+        self.changed = False
+        self.last_written = 0.0
+
+    def emit(self, line, received):
+        for metric in self.metrics:
+            match = metric.pattern.search(line)
+            if not match:
+                continue
+            try:
+                value = float(match.group('value'))
+            except (TypeError, ValueError):
+                continue
+            self.registry.set(metric, self.labels, value)
+            self.changed = True
+            break
+
+        if self.changed and self.textfile_path and time.monotonic() - self.last_written >= TEXTFILE_INTERVAL:
+            self.write_textfile()
+
+    def write_textfile(self):
+        write_textfile(self.registry, self.textfile_path)
+        self.changed = False
+        self.last_written = time.monotonic()
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        if self.changed and self.textfile_path:
+            self.write_textfile()
+
+
+class MetricsServer:
+    """Serve the registry's metrics at http://127.0.0.1:port/metrics from a background thread."""
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='circremote-metrics', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,240 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import sys
+import json
+import time
+import threading
+
+from .frames import format_frame
+
+
+class TextOutput:
+    """Device output for the terminal, written and flushed as soon as it arrives."""
+
+    def __init__(self, stream=None):
+        # Without a stream, look sys.stdout up on each write so redirection still works
+        self._stream = stream
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    def write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def write_frame(self, frame):
+        self.write(format_frame(frame))
+
+    def close(self):
+        self.stream.flush()
+
+
+class CoalescingOutput:
+    """
+    Device output for the terminal, written in batches.
+
+    Fragments are collected and handed to a writer thread, which writes and
+    flushes them together interval seconds after the first one arrives, or
+    as soon as max_lines lines are waiting. Reading from the device never
+    waits for the terminal.
+    """
+
+    def __init__(self, stream=None, interval=0.05, max_lines=100):
+        # Without a stream, look sys.stdout up on each write so redirection still works
+        self._stream = stream
+        self.interval = interval
+        self.max_lines = max_lines
+        self.pending = []
+        self.pending_lines = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name='circremote-output', daemon=True)
+        self.thread.start()
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    def write(self, text):
+        with self.condition:
+            self.pending.append(text)
+            self.pending_lines += text.count('\n')
+            if len(self.pending) == 1 or self.pending_lines >= self.max_lines:
+                self.condition.notify()
+
+    def write_frame(self, frame):
+        self.write(format_frame(frame))
+
+    def run(self):
+        """Writer thread: wait for output, give more a moment to collect, then write it all at once."""
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.interval
+                while not self.closed and self.pending_lines < self.max_lines:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                text = ''.join(self.pending)
+                self.pending = []
+                self.pending_lines = 0
+                closed = self.closed
+
+            if text:
+                try:
+                    self.stream.write(text)
+                    self.stream.flush()
+                except OSError:
+                    # The terminal or pipe went away; there's nowhere left to show output
+                    return
+            if closed:
+                return
+
+    def close(self):
+        """Write whatever is still waiting and stop the writer thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+
+class LineOutput:
+    """
+    Base class for writers that handle device output a line at a time.
+
+    Subclasses override emit(line, received), which is called with each
+    complete line (without its line ending) and the time it arrived; the
+    default drops the line. close() may be called more than once; subclasses
+    that extend it return early once self.closed is set.
+    """
+
+    def __init__(self):
+        self.partial = ''
+        # Output starts right after ***START***, so the first line is the rest of the marker's line
+        self.marker_line = True
+        self.closed = False
+
+    def write(self, text):
+        received = time.time()
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            if self.marker_line:
+                self.marker_line = False
+                if not line:
+                    continue
+            self.emit(line, received)
+
+    def emit(self, line, received):
+        pass
+
+    def close(self):
+        """Handle any unfinished last line."""
+        if self.closed:
+            return
+        self.closed = True
+        line = self.partial.rstrip('\r')
+        self.partial = ''
+        if line:
+            self.emit(line, time.time())
+
+
+class JSONLinesOutput(LineOutput):
+    """
+    Device output as JSON Lines, one record per line the device printed.
+
+    Each record carries the time the line arrived at the host, the device and
+    command names and a sequence number:
+        {"time": 1723380000.123, "device": "sign-1", "command": "BME280", "seq": 0, "line": "..."}
+    Records are left to the stream's buffering rather than flushed one at a time.
+    """
+
+    def __init__(self, device, command, stream=None):
+        super().__init__()
+        self.device = device
+        self.command = command
+        self.stream = stream or sys.stdout
+        self.seq = 0
+
+    def emit(self, line, received):
+        record = {
+            'time': round(received, 6),
+            'device': self.device,
+            'command': self.command,
+            'seq': self.seq,
+            'line': line,
+        }
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.seq += 1
+
+    def write_frame(self, frame):
+        """Write a frame from the device as a record of its own."""
+        record = {
+            'time': round(time.time(), 6),
+            'device': self.device,
+            'command': self.command,
+            'seq': self.seq,
+            'channel': frame.channel,
+            'typecode': frame.typecode,
+            'values': list(frame.values),
+        }
+        self.stream.write(json.dumps(record) + '\n')
+        self.seq += 1
+
+    def close(self):
+        """Write any unfinished last line and flush."""
+        if self.closed:
+            return
+        super().close()
+        self.stream.flush()
+
+
+class TeeOutput:
+    """Pass device output on to several writers."""
+
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def write(self, text):
+        for output in self.outputs:
+            output.write(text)
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
+
+
+class PrefixedOutput(LineOutput):
+    """
+    Put a prefix, like the device name, ahead of each line and pass it on.
+
+    Several of these can share one output; each passes on whole lines only,
+    so lines from different devices don't run into each other. Closing
+    passes on an unfinished last line but leaves the shared output open.
+    """
+
+    def __init__(self, output, prefix):
+        super().__init__()
+        self.output = output
+        self.prefix = prefix
+
+    def emit(self, line, received):
+        self.output.write(f"{self.prefix}{line}\r\n")
+
+
+OUTPUT_FORMATS = ('text', 'jsonl')
+
+
+def make_output(output_format, device, command, stream=None, unbuffered=False):
+    """Return the output writer for a --format choice; unbuffered text is written as soon as it arrives."""
+    if output_format == 'jsonl':
+        return JSONLinesOutput(device, command, stream)
+    if unbuffered:
+        return TextOutput(stream)
+    return CoalescingOutput(stream)
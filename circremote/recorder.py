@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import re
+import time
+import sqlite3
+
+from .output import LineOutput
+
+
+# A reading is a line like "Temperature: 21.5°C", "CO2: 412 ppm" or "  PM2.5: 3.20"
+READING = re.compile(
+    r'^\s*(?P<name>[A-Za-z][\w .()/%-]*?)\s*:\s*'
+    r'(?P<value>[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)'
+    r'\s*(?P<unit>[^\s\d]\S*)?\s*$'
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    time REAL NOT NULL,
+    device TEXT NOT NULL,
+    command TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_device_name_time ON readings (device, name, time);
+"""
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_BATCH_SIZE = 1000
+
+
+def parse_reading(line):
+    """
+    Pick a reading out of a line of sensor output.
+
+    Returns:
+        tuple: (name, value, unit), with unit None if there isn't one, or None if the line isn't a reading
+    """
+    match = READING.match(line)
+    if not match:
+        return None
+    return match.group('name'), float(match.group('value')), match.group('unit')
+
+
+class Recorder(LineOutput):
+    """
+    Records sensor readings from device output in a SQLite database.
+
+    Rows are kept in memory and written in one transaction every
+    flush_interval seconds, or sooner once batch_size rows are waiting. The
+    database uses write-ahead logging, so commits don't wait for a full
+    sync and several circremote processes can record to the same file.
+    """
+
+    def __init__(self, path, device, command, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__()
+        self.device = device
+        self.command = command
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+        # Other processes recording to the same file may hold the write lock briefly
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def emit(self, line, received):
+        reading = parse_reading(line)
+        if reading is None:
+            return
+
+        name, value, unit = reading
+        self.rows.append((received, self.device, self.command, name, value, unit))
+        if len(self.rows) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write waiting rows in a single transaction."""
+        if self.rows:
+            with self.db:
+                self.db.executemany(
+                    'INSERT INTO readings (time, device, command, name, value, unit) VALUES (?, ?, ?, ?, ?, ?)',
+                    self.rows
+                )
+            self.rows = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Write any remaining rows and close the database."""
+        if self.closed:
+            return
+        super().close()
+        self.flush()
+        self.db.close()
@@ -0,0 +1,246 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import struct
+
+
+CTRL_A = "\x01"
+CTRL_B = "\x02"
+CTRL_C = "\x03"
+CTRL_D = "\x04"
+
+FRIENDLY_PROMPT = b">>> "
+RAW_REPL_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+RAW_REPL_OK = b"OK"
+
+RAW_PASTE_REQUEST = "\x05A\x01"
+RAW_PASTE_SUPPORTED = b"R\x01"
+RAW_PASTE_UNSUPPORTED = b"R\x00"
+RAW_PASTE_WINDOW_INCREMENT = b"\x01"
+RAW_PASTE_END = b"\x04"
+
+# Plain raw REPL has no flow control, so pace the upload like mpremote does
+RAW_REPL_CHUNK_SIZE = 256
+RAW_REPL_CHUNK_DELAY = 0.01
+
+
+def drive(connection, steps):
+    """
+    Carry out the I/O requested by protocol steps on a blocking connection.
+
+    Steps are generators that yield (method, *args) requests, answered with the
+    result of calling that method on the connection, and return their result.
+    """
+    try:
+        request = next(steps)
+        while True:
+            method, *args = request
+            if method == 'sleep':
+                result = time.sleep(*args)
+            else:
+                result = getattr(connection, method)(*args)
+            request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+class RawREPLProtocol:
+    """
+    The CircuitPython raw REPL protocol, independent of how I/O is done.
+
+    Each *_steps() method is a generator that yields the reads and writes it
+    needs (see drive()), so RawREPL and the asyncio AsyncRawREPL share one
+    implementation of the handshake and the raw-paste state machine.
+
+    Each step waits for the response the board actually sends instead of
+    sleeping for a fixed time. The timeout only bounds how long we wait for
+    a board that never answers, after which we carry on as before.
+    """
+
+    def __init__(self, timeout=0.5, flow_timeout=5.0, debug_options=None):
+        self.timeout = timeout
+        self.flow_timeout = flow_timeout
+        self.debug_options = debug_options or {}
+        # Set by paste() when the board clearly answered that it can't do raw-paste
+        self.raw_paste_refused = False
+
+    def interrupt_steps(self):
+        """Stop whatever is running (Ctrl+C x3) and wait for the REPL prompt."""
+        self.debug("Sending 3 Ctrl+C characters (\\x03)")
+        start_time = time.monotonic()
+        yield ('write', CTRL_C * 3)
+        yield ('flush',)
+        found = yield from self.wait_for_steps(FRIENDLY_PROMPT)
+        self.debug(f"Interrupt {'acknowledged' if found else 'not acknowledged'} after {self.elapsed(start_time)}")
+        return found
+
+    def enter_steps(self):
+        """Enter raw REPL mode (Ctrl+A) and wait for the raw REPL banner and prompt."""
+        self.debug("Sending Ctrl+A character (\\x01)")
+        start_time = time.monotonic()
+        yield ('write', CTRL_A)
+        yield ('flush',)
+        found = yield from self.wait_for_steps(RAW_REPL_BANNER)
+        self.debug(f"Raw REPL {'entered' if found else 'banner not seen'} after {self.elapsed(start_time)}")
+        return found
+
+    def execute_steps(self):
+        """Tell the board to run the code sent so far (Ctrl+D) and wait for it to accept it."""
+        self.debug("Sending Ctrl+D character (\\x04)")
+        start_time = time.monotonic()
+        yield ('write', CTRL_D)
+        yield ('flush',)
+        found = yield from self.wait_for_steps(RAW_REPL_OK)
+        self.debug(f"Code {'accepted' if found else 'not acknowledged'} after {self.elapsed(start_time)}")
+        return found
+
+    def run_code_steps(self, code, raw_paste=True):
+        """
+        Upload code and run it, using raw-paste mode when the board supports it.
+        
+        Returns:
+            bool: True if the code was sent with raw-paste mode
+        """
+        if raw_paste and (yield from self.paste_steps(code)):
+            return True
+        
+        yield from self.write_paced_steps(code)
+        yield from self.execute_steps()
+        return False
+
+    def paste_steps(self, code):
+        """
+        Upload code with the raw-paste protocol (Ctrl+E) and let the board run it.
+        
+        The board grants a window of bytes and sends \\x01 each time another
+        window may be sent, so the upload never overruns its input buffer.
+        
+        Returns:
+            bool: False if raw-paste mode wasn't used; the board is then still
+                  at the raw REPL prompt and nothing was sent. raw_paste_refused
+                  tells whether the board said it doesn't support raw-paste or
+                  simply didn't answer in time.
+        """
+        self.debug("Requesting raw-paste mode (Ctrl+E)")
+        self.raw_paste_refused = False
+        yield ('write', RAW_PASTE_REQUEST)
+        yield ('flush',)
+        
+        # Give a slow link as long to answer as flow control gets, so a late R\x01
+        # doesn't leave the board in raw-paste mode while we send plain raw REPL input
+        response = yield ('read_bytes', 2, self.flow_timeout)
+        if response == RAW_PASTE_UNSUPPORTED:
+            self.debug("Board does not support raw-paste mode")
+            self.raw_paste_refused = True
+            return False
+        if response != RAW_PASTE_SUPPORTED:
+            # Older firmware treats the request as ordinary input and re-prints the banner
+            if response and RAW_REPL_BANNER.startswith(response) and \
+                    (yield from self.wait_for_steps(RAW_REPL_BANNER[len(response):])):
+                self.debug("Board did not understand raw-paste request")
+                self.raw_paste_refused = True
+            else:
+                self.debug(f"No clear answer to raw-paste request (response: {response!r})")
+            return False
+        
+        window_size = struct.unpack('<H', (yield ('read_bytes', 2, self.timeout)))[0]
+        self.debug(f"Raw-paste mode accepted, window size {window_size} bytes")
+        
+        data = code.encode('utf-8')
+        window_remain = window_size
+        offset = 0
+        start_time = time.monotonic()
+        while offset < len(data):
+            # Only block for flow control once the window is used up
+            flow = yield ('read_bytes', 1, self.flow_timeout if window_remain == 0 else 0)
+            if flow == RAW_PASTE_WINDOW_INCREMENT:
+                window_remain += window_size
+                continue
+            elif flow == RAW_PASTE_END:
+                # Board aborted the upload; acknowledge and let it report the error
+                self.debug("Board ended raw-paste upload early")
+                yield ('write', CTRL_D)
+                return True
+            elif flow:
+                raise RuntimeError(f"Unexpected data from board during raw-paste upload: {flow!r}")
+            elif window_remain == 0:
+                raise RuntimeError("Timed out waiting for the board during raw-paste upload")
+            
+            chunk = data[offset:offset + window_remain]
+            yield ('write', chunk)
+            window_remain -= len(chunk)
+            offset += len(chunk)
+        
+        yield ('write', CTRL_D)
+        yield ('flush',)
+        acknowledgement = yield ('read_until', RAW_PASTE_END, self.flow_timeout)
+        if not acknowledgement.endswith(RAW_PASTE_END):
+            raise RuntimeError(f"Board did not acknowledge raw-paste upload (response: {acknowledgement!r})")
+        
+        self.debug(f"Raw-paste upload of {len(data)} bytes complete after {self.elapsed(start_time)}")
+        return True
+
+    def write_paced_steps(self, code):
+        """Upload code in plain raw REPL mode, in small paced chunks."""
+        data = code.encode('utf-8')
+        self.debug(f"Sending {len(data)} bytes in plain raw REPL mode")
+        for offset in range(0, len(data), RAW_REPL_CHUNK_SIZE):
+            if offset:
+                yield ('sleep', RAW_REPL_CHUNK_DELAY)
+            yield ('write', data[offset:offset + RAW_REPL_CHUNK_SIZE])
+        yield ('flush',)
+
+    def exit_steps(self):
+        """Leave raw REPL mode (Ctrl+B)."""
+        self.debug("Sending Ctrl+B character (\\x02)")
+        yield ('write', CTRL_B)
+        yield ('flush',)
+
+    def wait_for_steps(self, expected):
+        """Wait until expected arrives from the board, up to the fallback timeout."""
+        data = yield ('read_until', expected, self.timeout)
+        if self.debug_options.get('verbose'):
+            self.debug(f"Received during handshake: {data!r}")
+        return data.endswith(expected)
+
+    def elapsed(self, start_time):
+        return f"{(time.monotonic() - start_time) * 1000:.1f} ms"
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
+
+
+class RawREPL(RawREPLProtocol):
+    """Drive the CircuitPython raw REPL over a blocking CircuitPythonConnection."""
+
+    def __init__(self, connection, timeout=0.5, flow_timeout=5.0, debug_options=None):
+        super().__init__(timeout, flow_timeout, debug_options)
+        self.connection = connection
+
+    def interrupt(self):
+        return drive(self.connection, self.interrupt_steps())
+
+    def enter(self):
+        return drive(self.connection, self.enter_steps())
+
+    def execute(self):
+        return drive(self.connection, self.execute_steps())
+
+    def run_code(self, code, raw_paste=True):
+        return drive(self.connection, self.run_code_steps(code, raw_paste))
+
+    def paste(self, code):
+        return drive(self.connection, self.paste_steps(code))
+
+    def write_paced(self, code):
+        return drive(self.connection, self.write_paced_steps(code))
+
+    def exit(self):
+        return drive(self.connection, self.exit_steps())
+
+    def wait_for(self, expected):
+        return drive(self.connection, self.wait_for_steps(expected))
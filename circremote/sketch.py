@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import math
+
+
+class QuantileSketch:
+    """
+    Summary of a stream of numbers in a fixed amount of memory.
+
+    Values are counted in logarithmically sized bins, so any quantile is
+    within relative_accuracy of the true value (the DDSketch approach).
+    A sensor reading's range needs a few hundred bins at most; if there
+    are ever more than max_bins, the bins nearest zero are combined.
+    Sketches can be merged, which is how sliding windows are built from
+    the sketches of their panes.
+    """
+
+    # Values closer to zero than this are counted as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, magnitude):
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def bin_value(self, key):
+        """The value a bin stands for, within relative_accuracy of everything counted in it."""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value):
+        if value > self.MIN_VALUE:
+            bins = self.positive
+            key = self.key(value)
+        elif value < -self.MIN_VALUE:
+            bins = self.negative
+            key = self.key(-value)
+        else:
+            bins = None
+            self.zero += 1
+
+        if bins is not None:
+            bins[key] = bins.get(key, 0) + 1
+            if len(bins) > self.max_bins:
+                self.collapse(bins)
+
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def collapse(self, bins):
+        """Fold the bin nearest zero into the next one up to stay within max_bins."""
+        lowest, second = sorted(bins)[:2]
+        bins[second] += bins.pop(lowest)
+
+    def merge(self, other):
+        """Add everything other has counted to this sketch."""
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+            while len(bins) > self.max_bins:
+                self.collapse(bins)
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile, e.g. 0.99 for the 99th percentile.
+
+        Returns:
+            float: The estimate, or 0.0 if nothing has been added
+        """
+        if not self.count:
+            return 0.0
+        # The extremes are known exactly
+        if fraction <= 0:
+            return self.min
+        if fraction >= 1:
+            return self.max
+
+        rank = fraction * (self.count - 1)
+        seen = 0
+        # Most negative values first, then zero, then positive values from the smallest
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return max(self.min, -self.bin_value(key))
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self.max, self.bin_value(key))
+        return self.max
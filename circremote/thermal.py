@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Thermal camera frames from the MLX90640 command's streaming mode.
+
+Frames arrive as 768 16-bit integers, 24 rows of 32 pixels in hundredths
+of a degree C, half the size of sending floats. Frames of floats in °C
+are accepted too. They can be shown in the terminal as a colour image or
+saved to a .npy file.
+"""
+
+import sys
+import time
+import struct
+from array import array
+from collections import deque
+
+
+ROWS = 24
+COLUMNS = 32
+
+# xterm 256 colour palette entries from cold to hot
+PALETTE = [16, 17, 18, 19, 20, 21, 57, 93, 129, 165, 201, 200, 199, 198, 197, 196,
+           202, 208, 214, 220, 226, 227, 228, 229, 230, 231]
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128
+
+
+def frame_celsius(frame):
+    """Return a thermal frame's pixels in °C; integer frames are in hundredths of a degree."""
+    if frame.typecode in 'fd':
+        return frame.values
+    return [value / 100 for value in frame.values]
+
+
+def render_frame(values, columns=COLUMNS):
+    """
+    Draw a frame as a colour image using ANSI escapes, scaled from its coldest to hottest pixel.
+
+    Each character cell shows two rows of pixels: the upper half block is
+    coloured with the upper pixel and its background with the lower one.
+    Pixels are two characters wide so the image keeps its shape.
+    """
+    low = min(values)
+    span = (max(values) - low) or 1.0
+    colours = [PALETTE[int((value - low) / span * (len(PALETTE) - 1))] for value in values]
+
+    lines = []
+    for top in range(0, len(values) // columns, 2):
+        upper = colours[top * columns:(top + 1) * columns]
+        lower = colours[(top + 1) * columns:(top + 2) * columns] or upper
+        cells = ''.join(f'\x1b[38;5;{fg};48;5;{bg}m▀▀' for fg, bg in zip(upper, lower))
+        lines.append(cells + '\x1b[0m\r\n')
+    return ''.join(lines)
+
+
+class FrameRate:
+    """Frames per second over the last few frames and over the whole run."""
+
+    def __init__(self, window=16):
+        self.recent = deque(maxlen=window)
+        self.first = None
+        self.count = 0
+
+    def add(self, when=None):
+        when = time.monotonic() if when is None else when
+        if self.first is None:
+            self.first = when
+        self.recent.append(when)
+        self.count += 1
+
+    def current(self):
+        """Frames per second over the last few frames, or 0 before there are two."""
+        if len(self.recent) < 2 or self.recent[-1] == self.recent[0]:
+            return 0.0
+        return (len(self.recent) - 1) / (self.recent[-1] - self.recent[0])
+
+    def average(self):
+        """Frames per second since the first frame, or 0 before there are two."""
+        if self.count < 2 or self.recent[-1] == self.first:
+            return 0.0
+        return (self.count - 1) / (self.recent[-1] - self.first)
+
+
+class NpyWriter:
+    """
+    Write frames to a .npy file as they arrive, as one (frames, rows, columns) float32 array.
+
+    The header has a fixed size so the frame count can be filled in when
+    the file is closed; nothing is kept in memory. NumPy isn't needed to
+    write the file, only to load it with numpy.load().
+    """
+
+    def __init__(self, path, shape=(ROWS, COLUMNS)):
+        self.path = path
+        self.shape = tuple(shape)
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.file.write(self.header())
+
+    def header(self):
+        descr = '<f4' if sys.byteorder == 'little' else '>f4'
+        shape = ', '.join(str(size) for size in (self.count,) + self.shape)
+        text = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({shape}), }}"
+        padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(text) - 1
+        return NPY_MAGIC + struct.pack('<H', NPY_HEADER_SIZE - len(NPY_MAGIC) - 2) + (text + ' ' * padding + '\n').encode('latin1')
+
+    def write(self, values):
+        expected = 1
+        for size in self.shape:
+            expected *= size
+        if len(values) != expected:
+            raise ValueError(f"Frames saved to {self.path} have {expected} values, got {len(values)}")
+        self.file.write(array('f', values).tobytes())
+        self.count += 1
+
+    def close(self):
+        """Fill in the frame count and close the file."""
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(self.header())
+        self.file.close()
+
+
+class ThermalOutput:
+    """
+    Device output with thermal frames shown as a colour image, saved to .npy, or both.
+
+    Text is passed on to output. Each frame redraws the image in place,
+    with the temperature range and frames per second underneath, unless
+    text was printed since the last one.
+    """
+
+    def __init__(self, output, view=True, npy_path=None):
+        self.output = output
+        self.view = view
+        self.npy = NpyWriter(npy_path) if npy_path else None
+        self.rate = FrameRate()
+        self.drawn_lines = 0
+
+    def write(self, text):
+        self.output.write(text)
+        self.drawn_lines = 0
+
+    def write_frame(self, frame):
+        self.rate.add()
+        values = frame_celsius(frame)
+        if self.npy:
+            self.npy.write(values)
+        if not self.view:
+            return
+
+        image = render_frame(values)
+        status = (f"min {min(values):.1f} °C  max {max(values):.1f} °C  "
+                  f"{self.rate.current():.1f} frames/s\x1b[K\r\n")
+        # Move back up over the last image so the new one replaces it
+        redraw = f'\x1b[{self.drawn_lines}A' if self.drawn_lines else ''
+        self.output.write(redraw + image + status)
+        self.drawn_lines = image.count('\n') + 1
+
+    def close(self):
+        if self.npy:
+            self.npy.close()
+        self.output.close()
@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Device timestamps on each line of output, for measuring latency.
+
+With timestamps on, a small helper added ahead of the command code
+replaces print() so each line starts with the device's
+time.monotonic_ns():
+
+    @81234567890 Temperature: 21.5°C
+
+TimestampDemux strips the prefix, pairing each device time with the host
+time the line arrived. The device and host clocks have different zero
+points and run at slightly different rates, so estimate_clock() fits
+both from the lines that arrived fastest and reports how much later
+than those each line landed.
+"""
+
+import re
+import time
+from array import array
+
+
+DEVICE_HELPER = '''import time as _clock_time
+_clock_print = print
+_clock_line_start = [True]
+def print(*args, **kwargs):
+    if _clock_line_start[0]:
+        _clock_print('@%d ' % _clock_time.monotonic_ns(), end='')
+    _clock_print(*args, **kwargs)
+    _clock_line_start[0] = kwargs.get('end', '\\n').endswith('\\n')
+'''
+
+TIMESTAMP = re.compile(r'@(\d+) ')
+PARTIAL_TIMESTAMP = re.compile(r'@\d*$')
+
+
+def add_device_helper(code):
+    """Put the timestamping print() ahead of code."""
+    return DEVICE_HELPER + code
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def estimate_clock(samples):
+    """
+    Estimate how the device clock maps to the host clock.
+
+    samples is a list of (device_seconds, host_seconds) pairs. The
+    fastest line in each half of the run gives the drift; the offset is
+    then set so the fastest line overall has no latency. Latency is
+    measured from that fastest line, since the time a line takes on its
+    fastest trip can't be told apart from the offset.
+
+    Returns:
+        tuple: (offset seconds, drift as a fraction, list of latencies in seconds)
+    """
+    if not samples:
+        return 0.0, 0.0, []
+
+    start = samples[0][0]
+    points = [(device - start, host - device) for device, host in samples]
+
+    drift = 0.0
+    half = len(points) // 2
+    if half >= 2:
+        # Which line was fastest depends on the drift, so refine the two together a few times
+        for _ in range(3):
+            early = min(points[:half], key=lambda point: point[1] - drift * point[0])
+            late = min(points[half:], key=lambda point: point[1] - drift * point[0])
+            if late[0] == early[0]:
+                break
+            drift = (late[1] - early[1]) / (late[0] - early[0])
+
+    offset = min(delta - drift * elapsed for elapsed, delta in points)
+    latencies = [delta - drift * elapsed - offset for elapsed, delta in points]
+    return offset, drift, latencies
+
+
+class TimestampDemux:
+    """
+    Strip device timestamps from output, keeping each one with the host time its line arrived.
+
+    Text is passed on to output as soon as it arrives, apart from the
+    start of a line that could still be a timestamp. Lines without a
+    timestamp are passed on as they are.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.buffer = ''
+        self.at_line_start = True
+        # Seconds, as two flat arrays so a long run doesn't make an object per line
+        self.device_times = array('d')
+        self.host_times = array('d')
+
+    def write(self, text):
+        received = time.monotonic()
+        self.buffer += text
+        passed = []
+        while self.buffer:
+            if self.at_line_start:
+                match = TIMESTAMP.match(self.buffer)
+                if match:
+                    self.device_times.append(int(match.group(1)) / 1e9)
+                    self.host_times.append(received)
+                    self.buffer = self.buffer[match.end():]
+                elif PARTIAL_TIMESTAMP.match(self.buffer):
+                    # Too little of the line to tell yet
+                    break
+                self.at_line_start = False
+            else:
+                end = self.buffer.find('\n')
+                if end < 0:
+                    passed.append(self.buffer)
+                    self.buffer = ''
+                else:
+                    passed.append(self.buffer[:end + 1])
+                    self.buffer = self.buffer[end + 1:]
+                    self.at_line_start = True
+
+        if passed:
+            self.output.write(''.join(passed))
+
+    def samples(self):
+        return list(zip(self.device_times, self.host_times))
+
+    def report(self):
+        """
+        Describe the clock estimate and line latency percentiles.
+
+        Returns:
+            list: Lines of text, empty if there weren't enough timestamped lines
+        """
+        if len(self.device_times) < 2:
+            return []
+        offset, drift, latencies = estimate_clock(self.samples())
+        ordered = sorted(latencies)
+        span = self.device_times[-1] - self.device_times[0]
+        return [
+            f"Device clock: {drift * 1e6:+.1f} ppm against the host over {span:.1f} seconds",
+            f"Line latency over {len(ordered)} lines, beyond the fastest line: "
+            f"p50 {percentile(ordered, 0.5) * 1000:.1f} ms, p90 {percentile(ordered, 0.9) * 1000:.1f} ms, "
+            f"p99 {percentile(ordered, 0.99) * 1000:.1f} ms, max {ordered[-1] * 1000:.1f} ms",
+        ]
+
+    def close(self):
+        if self.buffer:
+            self.output.write(self.buffer)
+            self.buffer = ''
+        self.output.close()
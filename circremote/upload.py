@@ -0,0 +1,245 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+import zlib
+import binascii
+import time
+
+from .frames import add_device_helper as add_frame_helper
+from .markers import START_STATEMENT, END_STATEMENT
+from .repl import drive
+from .timestamps import add_device_helper as add_timestamp_helper
+
+
+# Re-check boards cached as lacking raw-paste mode this often, in case the firmware was upgraded
+RAW_PASTE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Re-check whether a board has zlib this often, in case the firmware changed
+ZLIB_MAX_AGE = 7 * 24 * 60 * 60
+
+# Runs on the board: reports whether it can decompress zlib data
+ZLIB_PROBE = """try:
+    import zlib, binascii
+    zlib.decompress
+    print('ZLIB:1')
+except Exception:
+    print('ZLIB:0')
+"""
+
+# Runs on the board: decompresses the program and runs it
+ZLIB_BOOTSTRAP = """import zlib,binascii
+exec(zlib.decompress(binascii.a2b_base64({data!r}),15).decode())
+"""
+
+# Runs on the board: reads numbered, CRC-checked base64 chunks from the console,
+# acknowledges each one and runs the reassembled program once it sees "E".
+RECEIVER_STUB = """import sys,binascii
+_b=[]
+while True:
+    _l=sys.stdin.readline().strip()
+    if not _l:
+        continue
+    if _l=='E':
+        break
+    _i=-1
+    _ok=False
+    try:
+        _i,_c,_d=_l.split(' ')
+        _i=int(_i)
+        _d=binascii.a2b_base64(_d)
+        _ok=binascii.crc32(_d)&0xffffffff==int(_c) and _i<=len(_b)
+    except Exception:
+        pass
+    if _ok and _i==len(_b):
+        _b.append(_d)
+    print(('A' if _ok else 'N')+str(_i))
+exec(b''.join(_b).decode())
+"""
+
+
+
+def build_payload(code, timestamps=False):
+    """
+    Turn prepared command code into the program sent to the board.
+
+    The send_frame() helper is added if the code uses it, and the
+    timestamping print() helper if timestamps is set. Lines end in CRLF and
+    the code is wrapped in the start and end marker statements, with the
+    end marker always on a line of its own.
+    """
+    code = add_frame_helper(code)
+    if timestamps:
+        code = add_timestamp_helper(code)
+    if not code.endswith('\n'):
+        code += '\n'
+    return START_STATEMENT + code.replace('\n', '\r\n') + END_STATEMENT
+
+def send_program(connection, repl, payload, device_info, cache, debug_options=None):
+    """
+    Upload payload and start it running, using what we know about the device.
+
+    Returns:
+        bool: True if raw-paste mode was used
+    """
+    return drive(connection, send_program_steps(repl, payload, device_info, cache, debug_options))
+
+
+def send_program_steps(repl, payload, device_info, cache, debug_options=None):
+    """
+    Protocol steps (see repl.drive()) for send_program().
+
+    Raw-paste mode is only tried if the device isn't already known to lack it,
+    and the result is remembered in the device cache. A board is only recorded
+    as lacking it when it says so, not when it is merely slow to answer.
+    """
+    device_name = device_info['name']
+    cached = cache.get(device_name, 'raw_paste', max_age=RAW_PASTE_MAX_AGE)
+    try_raw_paste = cached is not False
+
+    if device_info.get('compress'):
+        payload = yield from compress_steps(repl, payload, device_name, cache)
+
+    if device_info.get('write_verify'):
+        uploader = VerifiedUpload(
+            repl.connection,
+            repl,
+            chunk_size=device_info.get('write_chunk_size', 512),
+            debug_options=debug_options
+        )
+        used_raw_paste = yield from uploader.run_code_steps(payload, raw_paste=try_raw_paste)
+    else:
+        used_raw_paste = yield from repl.run_code_steps(payload, raw_paste=try_raw_paste)
+
+    if try_raw_paste and not used_raw_paste and repl.raw_paste_refused:
+        cache.set(device_name, 'raw_paste', False)
+    elif used_raw_paste and cached is None:
+        cache.set(device_name, 'raw_paste', True)
+
+    return used_raw_paste
+
+
+def compress_payload(payload):
+    """
+    Wrap payload in a bootstrap that decompresses and runs it on the board.
+
+    Returns:
+        str: The bootstrap, or payload itself if compressing wouldn't make it smaller
+    """
+    compressed = zlib.compress(payload.replace('\r\n', '\n').encode('utf-8'), 9)
+    data = binascii.b2a_base64(compressed, newline=False)
+    bootstrap = ZLIB_BOOTSTRAP.format(data=data).replace('\n', '\r\n')
+    return bootstrap if len(bootstrap) < len(payload.encode('utf-8')) else payload
+
+
+def compress_steps(repl, payload, device_name, cache):
+    """
+    Protocol steps (see repl.drive()) that compress payload if the board can decompress it.
+
+    Whether the board has zlib is asked once and remembered in the device cache.
+
+    Returns:
+        str: The payload to send
+    """
+    supported = cache.get(device_name, 'zlib', max_age=ZLIB_MAX_AGE)
+    if supported is None:
+        repl.debug("Checking whether the board has zlib")
+        yield from repl.run_code_steps(ZLIB_PROBE.replace('\n', '\r\n'), raw_paste=False)
+        response = yield ('read_until', b'\x04>', repl.flow_timeout)
+        if b'ZLIB:1' in response:
+            supported = True
+        elif b'ZLIB:0' in response:
+            supported = False
+        if supported is not None:
+            cache.set(device_name, 'zlib', supported)
+
+    if not supported:
+        repl.debug("Board can't decompress zlib data, sending code uncompressed")
+        return payload
+
+    compressed = compress_payload(payload)
+    repl.debug(f"Compressed {len(payload.encode('utf-8'))} bytes of code to {len(compressed)} bytes")
+    return compressed
+
+
+class VerifiedUpload:
+    """
+    Upload code in checksummed chunks that the board acknowledges one at a time.
+
+    The raw REPL has no way to report a damaged upload, so a small receiver
+    runs on the board first. It checks the CRC32 of every chunk and asks for
+    it again if it doesn't match, so only the bad chunk is resent.
+    """
+
+    def __init__(self, connection, repl, chunk_size=512, retries=5, timeout=2.0, debug_options=None):
+        self.connection = connection
+        self.repl = repl
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.debug_options = debug_options or {}
+        self.retransmissions = 0
+
+    def run_code(self, code, raw_paste=True):
+        """
+        Start the receiver, send code through it and let the board run it.
+
+        Returns:
+            bool: True if the receiver itself was sent with raw-paste mode
+        """
+        return drive(self.connection, self.run_code_steps(code, raw_paste))
+
+    def run_code_steps(self, code, raw_paste=True):
+        """Protocol steps (see repl.drive()) for run_code()."""
+        self.debug("Starting verified upload receiver on the board")
+        used_raw_paste = yield from self.repl.run_code_steps(RECEIVER_STUB.replace('\n', '\r\n'), raw_paste=raw_paste)
+
+        data = code.encode('utf-8')
+        start_time = time.monotonic()
+        for index, offset in enumerate(range(0, len(data), self.chunk_size)):
+            yield from self.send_chunk_steps(index, data[offset:offset + self.chunk_size])
+        yield ('write', "E\r\n")
+        yield ('flush',)
+
+        elapsed = time.monotonic() - start_time
+        rate = len(data) / elapsed if elapsed else 0
+        self.debug(f"Verified upload of {len(data)} bytes complete in {elapsed * 1000:.1f} ms "
+                   f"({rate:.0f} bytes/s, {self.retransmissions} chunks resent)")
+        return used_raw_paste
+
+    def send_chunk_steps(self, index, chunk):
+        """Send one chunk until the board acknowledges it."""
+        line = f"{index} {binascii.crc32(chunk) & 0xffffffff} {binascii.b2a_base64(chunk, newline=False).decode('ascii')}\r\n"
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retransmissions += 1
+                self.debug(f"Resending chunk {index} (attempt {attempt + 1})")
+            yield ('write', line)
+            yield ('flush',)
+            if (yield from self.wait_for_ack_steps(index)):
+                return
+
+        raise RuntimeError(f"Board did not accept chunk {index} after {self.retries + 1} attempts")
+
+    def wait_for_ack_steps(self, index):
+        """Wait for the board to acknowledge a chunk; False means resend it."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.debug(f"No acknowledgement for chunk {index}")
+                return False
+
+            reply = (yield ('read_until', b'\n', remaining)).strip()
+            if reply == f"A{index}".encode('ascii'):
+                return True
+            if reply.startswith(b'N'):
+                self.debug(f"Board reported a damaged chunk: {reply!r}")
+                return False
+            # Anything else is an echo of an earlier acknowledgement or noise
+
+    def debug(self, message):
+        """Print debug message if verbose mode is enabled."""
+        if self.debug_options.get('verbose') and not self.debug_options.get('quiet'):
+            print(f"DEBUG: {message}")
@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Finding CircuitPython boards on USB by their serial numbers.
+
+Port names like /dev/ttyACM0 change when boards are plugged in a
+different order or re-enumerate after a reset. A device can be given as
+usb:SERIAL_NUMBER instead, in the config file or on the command line.
+The port each serial number was last seen on is kept in the device cache
+under usb:SERIAL_NUMBER. If that port still exists and, where the system
+can say, still belongs to that board, it's used right away. Only
+otherwise are the serial ports listed again, waiting a few seconds for a
+board that's re-enumerating after a reset.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+from serial.tools import list_ports
+
+
+USB_PREFIX = 'usb:'
+
+# USB vendor IDs of boards that run CircuitPython
+CIRCUITPYTHON_VIDS = {
+    0x239A: 'Adafruit',
+    0x2E8A: 'Raspberry Pi',
+    0x303A: 'Espressif',
+    0x2886: 'Seeed Studio',
+    0x1B4F: 'SparkFun',
+    0x1209: 'pid.codes',
+}
+
+# These vendors' IDs are also on MicroPython boards, USB-JTAG bridges and debug
+# probes, so a port with one only counts with a PID CircuitPython uses or
+# CircuitPython in its product or interface name
+SHARED_VIDS = {0x2E8A, 0x303A}
+
+# Espressif gives its own boards' CircuitPython builds PIDs from 0x7000
+CIRCUITPYTHON_PIDS = {
+    0x303A: range(0x7000, 0x7100),
+}
+
+# How long to keep looking for a board that isn't connected, in case it's restarting
+RESOLVE_WAIT = 3.0
+POLL_INTERVAL = 0.25
+
+UsbBoard = namedtuple('UsbBoard', ['port', 'serial_number', 'vid', 'pid', 'manufacturer', 'product', 'location'])
+
+
+def is_circuitpython(port_info):
+    """Check whether a serial port looks like a CircuitPython board's console."""
+    interface = port_info.interface or ''
+    # With usb_cdc.data enabled a board has a second port, which isn't the REPL
+    if 'CDC2' in interface or 'data' in interface.lower():
+        return False
+    if 'CircuitPython' in f"{port_info.product or ''} {interface}":
+        return True
+    if port_info.vid in SHARED_VIDS:
+        return port_info.pid is not None and port_info.pid in CIRCUITPYTHON_PIDS.get(port_info.vid, ())
+    return port_info.vid in CIRCUITPYTHON_VIDS
+
+
+def list_boards():
+    """
+    List the CircuitPython boards connected over USB.
+
+    Returns:
+        list: A UsbBoard for each board's console port, sorted by port
+    """
+    boards = {}
+    for info in sorted(list_ports.comports(), key=lambda info: (info.location or '', info.device)):
+        if not is_circuitpython(info):
+            continue
+        boards.setdefault(info.serial_number or info.device, UsbBoard(
+            info.device, info.serial_number, info.vid, info.pid, info.manufacturer, info.product, info.location
+        ))
+    return sorted(boards.values(), key=lambda board: board.port)
+
+
+def port_serial_number(port):
+    """
+    Read the serial number of the USB device behind a port from sysfs on Linux.
+
+    Returns:
+        str: The serial number, or None where the system can't say
+    """
+    name = os.path.basename(os.path.realpath(port))
+    try:
+        device = os.path.realpath(f'/sys/class/tty/{name}/device')
+        with open(os.path.join(os.path.dirname(device), 'serial')) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def port_matches(port, serial_number):
+    """Check whether port is still where the board with serial_number is, without listing every port."""
+    if not os.path.exists(port):
+        return False
+    found = port_serial_number(port)
+    return found is None or found.casefold() == serial_number.casefold()
+
+
+def remember(cache, board):
+    """Record the port a board was seen on."""
+    if board.serial_number:
+        cache.set(USB_PREFIX + board.serial_number, 'port', board.port)
+
+
+def forget(cache, serial_number):
+    """Drop the recorded port for a board, for example because it's about to reset."""
+    cache.delete(USB_PREFIX + serial_number, 'port')
+
+
+def resolve(serial_number, cache, wait=RESOLVE_WAIT):
+    """
+    Find the port of the board with a USB serial number.
+
+    Returns:
+        str: The port
+
+    Raises:
+        RuntimeError: If no board with that serial number turns up within wait seconds
+    """
+    port = cache.get(USB_PREFIX + serial_number, 'port')
+    if port and port_matches(port, serial_number):
+        return port
+
+    deadline = time.monotonic() + wait
+    while True:
+        for board in list_boards():
+            if board.serial_number and board.serial_number.casefold() == serial_number.casefold():
+                remember(cache, board)
+                return board.port
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"No CircuitPython board with USB serial number {serial_number} is connected")
+        time.sleep(POLL_INTERVAL)
+
+
+def resolve_device_info(device_info, cache, wait=RESOLVE_WAIT):
+    """
+    Fill in the port for a device given as usb:SERIAL_NUMBER.
+
+    Returns:
+        dict: device_info itself for other devices, or a copy with 'device'
+              set to the port and 'usb_serial' to the serial number
+    """
+    if not device_info['device'].startswith(USB_PREFIX):
+        return device_info
+    serial_number = device_info['device'][len(USB_PREFIX):]
+    return dict(device_info, device=resolve(serial_number, cache, wait), usb_serial=serial_number)
@@ -9,6 +9,7 @@ from pathlib import Path
 from unittest.mock import Mock, patch
 from argparse import Namespace
 
+from circremote.cache import DeviceCache
 from circremote.cli import CLI
 from circremote.config import Config
 from circremote.connection import CircuitPythonConnection
@@ -82,6 +83,12 @@ def cli_instance():
     return CLI(options)
 
 
+@pytest.fixture
+def cache(tmp_path):
+    """Return a DeviceCache kept in a temporary directory."""
+    return DeviceCache(path=tmp_path / 'cache.json')
+
+
 @pytest.fixture
 def mock_serial_connection():
     """Mock serial connection for testing."""
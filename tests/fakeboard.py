@@ -0,0 +1,181 @@
+"""
+A fake CircuitPython board for tests that drive the REPL protocol, and
+a stand-in for the outputs device output is written to.
+"""
+
+import re
+import time
+import struct
+import binascii
+
+
+class FakeBoard:
+    """
+    Just enough of the CircuitPython REPL to run the markers and print statements
+    of a program: the friendly and raw REPL, raw-paste mode with its flow
+    control (or a board without it), and the verified upload receiver.
+    """
+
+    def __init__(self, raw_paste=True, window_size=64, delay=0.0, mode='friendly'):
+        self.raw_paste = raw_paste
+        self.window_size = window_size
+        self.delay = delay
+        self.mode = mode
+        # When set, programs keep running until interrupted with Ctrl+C
+        self.hang = False
+        self.code = bytearray()
+        # Every byte of program code received, across runs
+        self.received = bytearray()
+        self.chunks = []
+
+    def receive(self, data):
+        """Take bytes from the host and return the board's reply."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        reply = bytearray()
+        for byte in data:
+            reply += self.receive_byte(bytes([byte]))
+        return bytes(reply)
+
+    def receive_byte(self, byte):
+        if self.mode == 'receiving':
+            return self.receive_line(byte)
+        if self.mode == 'paste':
+            if byte == b'\x04':
+                self.mode = 'raw'
+                return b'\x04' + self.run()
+            self.code += byte
+            self.received += byte
+            self.allowance -= 1
+            assert self.allowance >= 0, "host overran the raw-paste window"
+            if len(self.code) % self.window_size == 0:
+                self.allowance += self.window_size
+                return b'\x01'
+            return b''
+        if self.mode == 'paste-request':
+            self.pending += byte
+            if len(self.pending) < 2:
+                return b''
+            if not self.raw_paste:
+                self.mode = 'raw'
+                return b'R\x00'
+            self.mode = 'paste'
+            self.code = bytearray()
+            self.allowance = self.window_size
+            return b'R\x01' + struct.pack('<H', self.window_size)
+        if byte == b'\x03':
+            if self.mode == 'running':
+                self.mode = 'raw'
+                return b'\x04Traceback (most recent call last):\r\nKeyboardInterrupt\r\n\x04>'
+            self.mode = 'friendly'
+            return b'\r\n>>> '
+        if byte == b'\x01':
+            self.mode = 'raw'
+            self.code = bytearray()
+            return b'raw REPL; CTRL-B to exit\r\n>'
+        if byte == b'\x02':
+            self.mode = 'friendly'
+            return b'\r\n>>> '
+        if self.mode == 'raw':
+            if byte == b'\x05':
+                self.mode = 'paste-request'
+                self.pending = b''
+                return b''
+            if byte == b'\x04':
+                return b'OK' + self.run()
+            self.code += byte
+            self.received += byte
+        return b''
+
+    def receive_line(self, byte):
+        """Act like the verified upload receiver stub."""
+        self.line += byte
+        if byte != b'\n':
+            return b''
+        line, self.line = self.line.strip().decode(), b''
+        if line == 'E':
+            self.mode = 'raw'
+            self.code = bytearray(b''.join(self.chunks))
+            return self.run()
+        index, crc, data = line.split(' ')
+        data = binascii.a2b_base64(data)
+        if binascii.crc32(data) != int(crc):
+            return f"N{index}\r\n".encode()
+        self.chunks.append(data)
+        return f"A{index}\r\n".encode()
+
+    def run(self):
+        if self.delay:
+            time.sleep(self.delay)
+        if b'a2b_base64' in self.code:
+            self.mode = 'receiving'
+            self.chunks = []
+            self.line = b''
+            self.code = bytearray()
+            return b''
+        output = ''.join(
+            value.encode().decode('unicode_escape') + '\r\n'
+            for value in re.findall(r"print\('((?:[^'\\]|\\.)*)'\)", self.code.decode('utf-8'))
+        )
+        self.code = bytearray()
+        if self.hang:
+            self.mode = 'running'
+            return output.encode('utf-8')
+        return output.encode('utf-8') + b'\x04\x04>'
+
+
+class FakeConnection:
+    """Blocking connection to a FakeBoard with the read methods of CircuitPythonConnection."""
+
+    def __init__(self, board):
+        self.board = board
+        self.rx = bytearray()
+        self.tx = bytearray()
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.written.append(data)
+        self.tx += data
+        self.rx += self.board.receive(data)
+
+    def flush(self):
+        pass
+
+    def read_bytes(self, count, timeout):
+        data = bytes(self.rx[:count])
+        del self.rx[:count]
+        return data
+
+    def read_until(self, expected, timeout):
+        index = self.rx.find(expected)
+        end = index + len(expected) if index >= 0 else len(self.rx)
+        data = bytes(self.rx[:end])
+        del self.rx[:end]
+        return data
+
+    def read_available(self, timeout):
+        data = bytes(self.rx)
+        self.rx.clear()
+        if not data:
+            time.sleep(timeout)
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+class Collector:
+    """An output that keeps what's written to it."""
+
+    def __init__(self):
+        self.text = ''
+        self.closed = False
+
+    def write(self, text):
+        self.text += text
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,179 @@
+"""
+Unit tests for the persistent connection agent.
+"""
+
+import os
+import stat
+import time
+import socket
+import threading
+import pytest
+from unittest.mock import patch
+
+from circremote.agent import Agent, AgentClient, DeviceSession
+from circremote.cache import DeviceCache
+from tests.fakeboard import FakeBoard, FakeConnection
+
+
+class FakeBoardConnection(FakeConnection):
+    """Stand-in for a CircuitPythonConnection to a board without raw-paste support."""
+
+    opened = []
+
+    def __init__(self, device, password=None, debug_options=None, device_options=None):
+        super().__init__(FakeBoard(raw_paste=False))
+        self.device = device
+        FakeBoardConnection.opened.append(self)
+
+
+@pytest.fixture
+def fake_board():
+    FakeBoardConnection.opened = []
+    with patch('circremote.agent.CircuitPythonConnection', FakeBoardConnection):
+        yield FakeBoardConnection
+
+
+@pytest.fixture
+def running_agent(tmp_path, fake_board):
+    agent = Agent(str(tmp_path / 'agent.sock'))
+    agent.cache = DeviceCache(path=tmp_path / 'cache.json')
+    thread = threading.Thread(target=agent.serve_forever, daemon=True)
+    thread.start()
+    while not agent.socket_path.exists():
+        time.sleep(0.01)
+    yield agent
+    agent.server.shutdown()
+    thread.join(2)
+
+
+def run_job(agent, device_info, timeout=2.0):
+    """Submit a job and collect its output."""
+    client = AgentClient(str(agent.socket_path))
+    client.submit(device_info, "print('hello')\r\n", timeout)
+    output = ''
+    while not client.done:
+        output += client.read_nonblock()
+    with pytest.raises(EOFError):
+        client.read_nonblock()
+    client.close()
+    return client, output
+
+
+class TestAgent:
+    """Test the Agent and AgentClient classes."""
+
+    def test_reuses_warm_connection(self, running_agent, fake_board):
+        """Test a second job skips opening and interrupting the board."""
+        device_info = {'name': 'test', 'device': '/dev/ttyACM0'}
+
+        first, output = run_job(running_agent, device_info)
+        assert first.warm is False
+        assert 'hello' in output
+        assert output.endswith('\x04>')
+
+        second, output = run_job(running_agent, device_info)
+        assert second.warm is True
+        assert 'hello' in output
+
+        assert len(fake_board.opened) == 1
+        assert fake_board.opened[0].tx.count(b'\x03\x03\x03') == 1
+
+    def test_socket_is_private(self, running_agent):
+        """Test only the owner can use the agent socket."""
+        mode = stat.S_IMODE(os.stat(running_agent.socket_path).st_mode)
+        assert mode == 0o600
+
+    def test_socket_created_private(self, tmp_path):
+        """Test the socket is private from the moment it's bound, whatever the umask."""
+        import socketserver
+        modes = []
+        server_bind = socketserver.ThreadingUnixStreamServer.server_bind
+        
+        def spy_bind(server):
+            server_bind(server)
+            modes.append(stat.S_IMODE(os.stat(server.server_address).st_mode) & 0o077)
+            raise KeyboardInterrupt
+        
+        umask = os.umask(0o022)
+        try:
+            with patch.object(socketserver.ThreadingUnixStreamServer, 'server_bind', spy_bind):
+                with pytest.raises(KeyboardInterrupt):
+                    Agent(str(tmp_path / 'agent.sock')).serve_forever()
+            assert os.umask(0o022) == 0o022
+        finally:
+            os.umask(umask)
+        assert modes == [0]
+
+    def test_removes_stale_socket(self, tmp_path, fake_board):
+        """Test a socket file left behind by a dead agent is replaced."""
+        socket_path = tmp_path / 'agent.sock'
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(str(socket_path))
+        stale.close()
+
+        agent = Agent(str(socket_path))
+        thread = threading.Thread(target=agent.serve_forever, daemon=True)
+        thread.start()
+        while agent.server is None:
+            time.sleep(0.01)
+        assert agent.is_running()
+        agent.server.shutdown()
+        thread.join(2)
+        assert not socket_path.exists()
+
+    def test_connection_error_reported(self, running_agent):
+        """Test a device that can't be opened is reported to the client."""
+        client = AgentClient(str(running_agent.socket_path))
+        with patch('circremote.agent.CircuitPythonConnection', side_effect=RuntimeError("no such port")):
+            with pytest.raises(RuntimeError, match="no such port"):
+                client.submit({'name': 'test', 'device': '/dev/missing'}, "print(1)\r\n", 1.0)
+        client.close()
+
+    def test_client_without_agent(self, tmp_path):
+        """Test submitting without a running agent fails."""
+        client = AgentClient(str(tmp_path / 'missing.sock'))
+        with pytest.raises(OSError):
+            client.submit({'name': 'test', 'device': '/dev/ttyACM0'}, "print(1)\r\n", 1.0)
+
+
+class TestDeviceSession:
+    """Test the DeviceSession class."""
+
+    @pytest.fixture(autouse=True)
+    def cache(self, tmp_path):
+        self.cache = DeviceCache(path=tmp_path / 'cache.json')
+
+    def run(self, session, device_info, timeout=1.0, cancelled=lambda: False):
+        output = bytearray()
+        session.run(device_info, "print('hello')\r\n", timeout, self.cache,
+                    lambda warm: None, output.extend, cancelled)
+        return bytes(output)
+
+    def test_reconnects_when_device_changes(self, fake_board):
+        """Test a new port path closes the old connection."""
+        session = DeviceSession({'name': 'test', 'device': '/dev/ttyACM0'})
+        self.run(session, {'name': 'test', 'device': '/dev/ttyACM0'})
+        self.run(session, {'name': 'test', 'device': '/dev/ttyACM1'})
+
+        assert [c.device for c in fake_board.opened] == ['/dev/ttyACM0', '/dev/ttyACM1']
+        assert fake_board.opened[0].closed
+
+    def test_interrupts_unfinished_run(self, fake_board):
+        """Test a run still going at the timeout is interrupted and the board reused."""
+        session = DeviceSession({'name': 'test', 'device': '/dev/ttyACM0'})
+        session.open()
+        session.connection.board.hang = True
+        session.idle = False
+
+        self.run(session, {'name': 'test', 'device': '/dev/ttyACM0'}, timeout=0.2)
+
+        assert session.connection.tx.endswith(b'\x03')
+        assert session.idle is True
+
+    def test_abandoned_run_not_emitted(self, fake_board):
+        """Test output is not passed on once the client has gone away."""
+        session = DeviceSession({'name': 'test', 'device': '/dev/ttyACM0'})
+        output = self.run(session, {'name': 'test', 'device': '/dev/ttyACM0'}, cancelled=lambda: True)
+
+        assert output == b''
+        assert session.idle is True
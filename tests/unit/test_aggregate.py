@@ -0,0 +1,83 @@
+"""
+Unit tests for windowed aggregation of readings.
+"""
+
+from unittest.mock import patch
+
+from circremote.aggregate import WindowAggregator
+from tests.fakeboard import Collector
+
+
+def feed(aggregator, timed_text):
+    """Write each piece of text at the given time."""
+    for when, text in timed_text:
+        with patch('circremote.output.time.time', return_value=when):
+            aggregator.write(text)
+
+
+class TestWindowAggregator:
+    """Test the WindowAggregator class."""
+
+    def test_tumbling(self):
+        """Test one summary per reading per window, replacing the readings."""
+        output = Collector()
+        aggregator = WindowAggregator(output, 60)
+        feed(aggregator, [
+            (6000.0, "\r\nTemperature: 21.0°C\r\nCO2: 400 ppm\r\n-----\r\n"),
+            (6030.0, "Temperature: 23.0°C\r\nCO2: 420 ppm\r\n-----\r\n"),
+            (6061.0, "Temperature: 30.0°C\r\n"),
+        ])
+        
+        lines = output.text.splitlines()
+        assert len(lines) == 2
+        assert "Temperature: n=2 min=21 mean=22 max=23" in lines[0]
+        assert lines[0].endswith("°C")
+        assert "CO2: n=2 min=400 mean=410 max=420" in lines[1]
+        assert "p50=" in lines[1] and "p99=" in lines[1]
+        
+        aggregator.close()
+        assert "Temperature: n=1 min=30" in output.text.splitlines()[-1]
+        assert output.closed
+
+    def test_close_twice(self):
+        """Test closing again, as after an interruption, doesn't summarise the last window twice."""
+        output = Collector()
+        aggregator = WindowAggregator(output, 60)
+        feed(aggregator, [(6000.0, "\r\nTemperature: 21.0°C\r\n")])
+        
+        aggregator.close()
+        aggregator.close()
+        assert len(output.text.splitlines()) == 1
+
+    def test_sliding(self):
+        """Test sliding windows overlap by the slide step."""
+        output = Collector()
+        aggregator = WindowAggregator(output, 60, 30)
+        feed(aggregator, [
+            (6000.0, "\r\nHumidity: 40%\r\n"),
+            (6030.0, "Humidity: 50%\r\n"),
+            (6060.0, "Humidity: 60%\r\n"),
+            (6090.0, "Humidity: 70%\r\n"),
+        ])
+        
+        counts = [line.split('n=')[1].split()[0] for line in output.text.splitlines()]
+        means = [line.split('mean=')[1].split()[0] for line in output.text.splitlines()]
+        assert counts == ['1', '2', '2']
+        assert means == ['40', '45', '55']
+
+    def test_gap(self):
+        """Test a long gap doesn't write empty windows."""
+        output = Collector()
+        aggregator = WindowAggregator(output, 10, 5)
+        feed(aggregator, [
+            (1000.0, "\r\nHumidity: 40%\r\n"),
+            (90000.0, "Humidity: 50%\r\n"),
+        ])
+        assert len(output.text.splitlines()) == 2
+
+    def test_other_lines_passed_on(self):
+        """Test lines that aren't readings, like errors, still show; separators don't."""
+        output = Collector()
+        aggregator = WindowAggregator(output, 60)
+        feed(aggregator, [(6000.0, "\r\nSCD40 CO2 Sensor\r\n=====\r\nError reading sensor data: timeout\r\n")])
+        assert output.text == "SCD40 CO2 Sensor\r\nError reading sensor data: timeout\r\n"
@@ -0,0 +1,230 @@
+"""
+Unit tests for the asyncio connection and run_command().
+"""
+
+import os
+import json
+import inspect
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+import pytest
+
+from websocket import ABNF
+
+from circremote.aio import (
+    AsyncCircuitPythonConnection, AsyncRawREPL, run_command, prepare_code, WEBSOCKET_GUID,
+)
+from circremote.config import Config
+from circremote.upload import build_payload
+from tests.fakeboard import FakeBoard
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs pseudo-terminals")
+
+
+def serve_pty(board):
+    """Run board behind a pseudo-terminal in a thread; returns the port name."""
+    master, slave = os.openpty()
+    os.set_blocking(master, True)
+
+    def serve():
+        try:
+            while True:
+                data = os.read(master, 4096)
+                if not data:
+                    return
+                reply = board.receive(data)
+                if reply:
+                    os.write(master, reply)
+        except OSError:
+            return
+
+    threading.Thread(target=serve, daemon=True).start()
+    return os.ttyname(slave)
+
+
+async def serve_websocket(board, password=None):
+    """Run board behind a Web Workflow style WebSocket server; returns (server, port)."""
+    async def handle(reader, writer):
+        request = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+        headers = dict((name.strip().lower(), value.strip())
+                       for name, _, value in (line.partition(':') for line in request.split('\r\n')[1:] if line))
+        if password and headers.get('authorization') != 'Basic ' + base64.b64encode(f":{password}".encode()).decode():
+            writer.write(b'HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\n\r\n')
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                length = head[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('>H', await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('>Q', await reader.readexactly(8))[0]
+                mask = await reader.readexactly(4)
+                payload = ABNF.mask(mask, await reader.readexactly(length))
+                if head[0] & 0x0f == 0x8:
+                    break
+                reply = board.receive(payload)
+                if reply:
+                    writer.write(bytes([0x81, len(reply)]) + reply if len(reply) < 126
+                                 else bytes([0x81, 126]) + struct.pack('>H', len(reply)) + reply)
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = Config()
+    config.devices = {}
+    config.command_aliases = {}
+    config.search_paths = []
+    return config
+
+
+class TestAsyncConnection:
+    """Test the AsyncCircuitPythonConnection class."""
+
+    def test_serial_read_until(self):
+        """Test serial data arrives through the event loop."""
+        port = serve_pty(FakeBoard())
+
+        async def main():
+            async with AsyncCircuitPythonConnection(port) as connection:
+                await connection.write('\x03')
+                assert await connection.read_until(b'>>> ', 1.0) == b'\r\n>>> '
+                assert await connection.read_available(0.05) == b''
+
+        asyncio.run(main())
+
+    def test_raw_repl_handshake(self):
+        """Test the async raw REPL drives the same handshake as the blocking one."""
+        port = serve_pty(FakeBoard(raw_paste=False))
+
+        async def main():
+            async with AsyncCircuitPythonConnection(port) as connection:
+                repl = AsyncRawREPL(connection)
+                assert await repl.interrupt()
+                assert await repl.enter()
+                assert await repl.run_code("print('hi')\r\n") is False
+                assert await connection.read_until(b'\x04>', 1.0) == b'hi\r\n\x04\x04>'
+
+        asyncio.run(main())
+
+    def test_async_repl_mirrors_repl(self):
+        """Test AsyncRawREPL has an async counterpart of every RawREPL method."""
+        from circremote.repl import RawREPL
+        methods = [name for name in vars(RawREPL) if not name.startswith('_')]
+        assert all(inspect.iscoroutinefunction(getattr(AsyncRawREPL, name)) for name in methods)
+
+    def test_read_timeout(self):
+        """Test read_available() waits the device's read_timeout by default."""
+        port = serve_pty(FakeBoard())
+
+        async def main():
+            async with AsyncCircuitPythonConnection(port, device_options={'read_timeout': 0.1}) as connection:
+                start_time = time.monotonic()
+                assert await connection.read_available() == b''
+                assert 0.08 < time.monotonic() - start_time < 0.5
+
+        asyncio.run(main())
+
+    def test_websocket_bad_password(self):
+        """Test a 401 from the Web Workflow is reported as a bad password."""
+        async def main():
+            server, port = await serve_websocket(FakeBoard(), password='secret')
+            async with server:
+                connection = AsyncCircuitPythonConnection(f"127.0.0.1:{port}", password='wrong')
+                with pytest.raises(RuntimeError, match="Bad password"):
+                    await connection.open()
+
+        asyncio.run(main())
+
+
+class TestRunCommand:
+    """Test run_command()."""
+
+    def test_prepare_code(self):
+        """Test template variables are filled from arguments and info.json defaults."""
+        info_data = {'variables': [{'name': 'sda', 'default': 'board.SDA'}, {'name': 'address'}]}
+        code = "i2c = I2C({{ sda }})\nsensor = S(i2c, {{address}})\n"
+
+        assert prepare_code(code, info_data, {'address': '0x76'}, 'test') == \
+            "i2c = I2C(board.SDA)\nsensor = S(i2c, 0x76)\n"
+        with pytest.raises(ValueError, match="address"):
+            prepare_code(code, info_data, {}, 'test')
+        with pytest.raises(ValueError, match="scl"):
+            prepare_code(code, info_data, {'scl': 'board.SCL', 'address': '1'}, 'test')
+
+    def test_run_command_serial(self, tmp_path, config, cache):
+        """Test a command directory runs over serial and its output comes back."""
+        command_dir = tmp_path / 'sensor'
+        command_dir.mkdir()
+        (command_dir / 'code.py').write_text("print('temperature {{ scale }}')\n")
+        (command_dir / 'info.json').write_text(json.dumps({'variables': [{'name': 'scale', 'default': 'C'}]}))
+        board = FakeBoard()
+        port = serve_pty(board)
+        seen = []
+
+        output = asyncio.run(run_command(port, str(command_dir), {'scale': 'F'}, timeout=2.0,
+                                         config=config, cache=cache, on_output=seen.append))
+
+        assert output == '\r\ntemperature F\r\n'
+        # The program is built the same way as the CLI builds it
+        assert board.received.decode() == build_payload("print('temperature F')\n")
+        assert ''.join(seen) == output
+        assert cache.get(port, 'raw_paste') is True
+
+    def test_run_command_websocket(self, tmp_path, config, cache):
+        """Test a command runs over the Web Workflow WebSocket."""
+        code_file = tmp_path / 'hello.py'
+        code_file.write_text("print('hello')\n")
+
+        async def main():
+            server, port = await serve_websocket(FakeBoard(raw_paste=False), password='secret')
+            config.devices = {'web': {'name': 'web', 'device': f"127.0.0.1:{port}", 'password': 'secret'}}
+            async with server:
+                return await run_command('web', str(code_file), timeout=2.0, config=config, cache=cache)
+
+        assert asyncio.run(main()) == '\r\nhello\r\n'
+        assert cache.get('web', 'raw_paste') is False
+
+    def test_run_command_write_verify(self, tmp_path, config, cache):
+        """Test write_verify sends the code through the verified upload receiver."""
+        code_file = tmp_path / 'hello.py'
+        code_file.write_text("print('verified')\n")
+        board = FakeBoard()
+        port = serve_pty(board)
+        config.devices = {'checked': {'name': 'checked', 'device': port, 'write_verify': True, 'write_chunk_size': 8}}
+
+        output = asyncio.run(run_command('checked', str(code_file), timeout=2.0, config=config, cache=cache))
+
+        assert output == '\r\nverified\r\n'
+        assert len(board.chunks) > 1
+
+    def test_run_command_concurrent(self, tmp_path, config, cache):
+        """Test one event loop runs commands on several boards at once."""
+        code_file = tmp_path / 'slow.py'
+        code_file.write_text("print('done')\n")
+        ports = [serve_pty(FakeBoard(delay=0.3)) for _ in range(4)]
+
+        async def main():
+            return await asyncio.gather(*(
+                run_command(port, str(code_file), timeout=5.0, config=config, cache=cache) for port in ports
+            ))
+
+        start_time = time.monotonic()
+        assert asyncio.run(main()) == ['\r\ndone\r\n'] * 4
+        # Four 0.3 second runs overlap instead of taking 1.2 seconds in turn
+        assert time.monotonic() - start_time < 1.0
@@ -0,0 +1,114 @@
+"""
+Unit tests for the DeviceCache class.
+"""
+
+import json
+import time
+from unittest.mock import patch
+
+from circremote.cache import DeviceCache
+
+
+class TestDeviceCache:
+    """Test the DeviceCache class."""
+
+    def test_default_path(self, tmp_path):
+        """Test the cache lives in ~/.circremote by default."""
+        with patch('pathlib.Path.home', return_value=tmp_path):
+            cache = DeviceCache()
+        assert cache.cache_path == tmp_path / '.circremote' / 'cache.json'
+
+    def test_get_missing(self, tmp_path):
+        """Test missing entries return the default."""
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        assert cache.get('dev1', 'raw_paste') is None
+        assert cache.get('dev1', 'raw_paste', default=True) is True
+
+    def test_set_and_reload(self, tmp_path):
+        """Test values persist across cache instances."""
+        cache_path = tmp_path / 'cache.json'
+        DeviceCache(path=cache_path).set('dev1', 'raw_paste', False)
+        
+        assert DeviceCache(path=cache_path).get('dev1', 'raw_paste') is False
+        data = json.loads(cache_path.read_text())
+        assert data['devices']['dev1']['raw_paste']['value'] is False
+
+    def test_max_age(self, tmp_path):
+        """Test entries older than max_age are ignored."""
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        cache.set('dev1', 'baudrate', 921600)
+        cache.data['dev1']['baudrate']['updated'] = time.time() - 120
+        
+        assert cache.get('dev1', 'baudrate', max_age=60) is None
+        assert cache.get('dev1', 'baudrate', max_age=300) == 921600
+
+    def test_delete(self, tmp_path):
+        """Test deleting one key or a whole device."""
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        cache.set('dev1', 'a', 1)
+        cache.set('dev1', 'b', 2)
+        cache.delete('dev1', 'a')
+        assert cache.get('dev1', 'a') is None
+        assert cache.get('dev1', 'b') == 2
+        
+        cache.delete('dev1')
+        assert cache.devices() == []
+
+    def test_corrupt_file(self, tmp_path):
+        """Test a damaged cache file is treated as empty."""
+        cache_path = tmp_path / 'cache.json'
+        cache_path.write_text('{not json')
+        
+        cache = DeviceCache(path=cache_path)
+        assert cache.get('dev1', 'raw_paste') is None
+        cache.set('dev1', 'raw_paste', True)
+        assert DeviceCache(path=cache_path).get('dev1', 'raw_paste') is True
+
+    def test_shared_between_threads(self, tmp_path):
+        """Test values set from several threads at once are all kept."""
+        import threading
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        
+        def fill(device):
+            for n in range(50):
+                cache.set(device, f'key{n}', n)
+        
+        threads = [threading.Thread(target=fill, args=(f'device{n}',)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        reloaded = DeviceCache(path=tmp_path / 'cache.json')
+        assert sorted(reloaded.devices()) == [f'device{n}' for n in range(8)]
+        assert all(reloaded.get(f'device{n}', 'key49') == 49 for n in range(8))
+
+    def test_concurrent_processes_merge(self, tmp_path):
+        """Test saving keeps entries another process wrote since this cache was loaded."""
+        cache_path = tmp_path / 'cache.json'
+        first = DeviceCache(path=cache_path)
+        second = DeviceCache(path=cache_path)
+        first.set('dev1', 'a', 1)
+        second.get('dev1', 'a')
+        
+        first.set('dev2', 'b', 2)
+        second.set('dev3', 'c', 3)
+        second.delete('dev1', 'a')
+        
+        reloaded = DeviceCache(path=cache_path)
+        assert reloaded.get('dev1', 'a') is None
+        assert reloaded.get('dev2', 'b') == 2
+        assert reloaded.get('dev3', 'c') == 3
+        assert second.get('dev2', 'b') == 2
+
+    def test_batch_saves_once(self, tmp_path):
+        """Test changes made in a batch are written together when it ends."""
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        with patch.object(cache, 'save', wraps=cache.save) as save:
+            with cache.batch():
+                for n in range(10):
+                    cache.set(f'dev{n}', 'a', n)
+                assert not (tmp_path / 'cache.json').exists()
+        
+        assert save.call_count == 1
+        assert DeviceCache(path=tmp_path / 'cache.json').get('dev9', 'a') == 9
@@ -0,0 +1,102 @@
+"""
+Unit tests for capturing device output to disk.
+"""
+
+import gzip
+from unittest.mock import patch
+
+from circremote.capture import Capture, segment_paths, read_segment, tail, replay
+
+
+def lines_output(start, count):
+    return ''.join(f"reading {n}\r\n" for n in range(start, start + count))
+
+
+class TestCapture:
+    """Test the Capture class."""
+
+    def test_memory_ceiling(self, tmp_path):
+        """Test memory stays under the limit and older lines spill to compressed segments."""
+        capture = Capture(tmp_path, memory_limit=1000, segment_size=5000)
+        capture.write("\r\n")
+        for start in range(0, 5000, 100):
+            capture.write(lines_output(start, 100))
+            assert capture.recent_size <= 1000
+        
+        assert len(segment_paths(tmp_path)) > 1
+        assert capture.tail(3) == ["reading 4997", "reading 4998", "reading 4999"]
+        capture.close()
+        
+        assert list(replay(tmp_path)) == [f"reading {n}" for n in range(5000)]
+
+    def test_segments_named_by_first_line(self, tmp_path):
+        """Test each segment is named after the number of its first line."""
+        capture = Capture(tmp_path, memory_limit=0, segment_size=100)
+        capture.write("\r\n" + lines_output(0, 50))
+        capture.close()
+        
+        for path in segment_paths(tmp_path):
+            assert read_segment(path)[0] == f"reading {int(path.stem)}"
+
+    def test_tail_reads_only_newest_segments(self, tmp_path):
+        """Test tail doesn't decompress segments it doesn't need."""
+        capture = Capture(tmp_path, memory_limit=0, segment_size=100)
+        capture.write("\r\n" + lines_output(0, 200))
+        capture.close()
+        
+        oldest = segment_paths(tmp_path)[0]
+        oldest.write_bytes(b'not gzip')
+        assert tail(tmp_path, 5) == [f"reading {n}" for n in range(195, 200)]
+
+    def test_tail_from_memory_and_disk(self, tmp_path):
+        """Test tail joins the lines on disk with those still in memory."""
+        capture = Capture(tmp_path, memory_limit=50)
+        capture.write("\r\n" + lines_output(0, 20))
+        assert len(capture.recent) < 10
+        assert capture.tail(10) == [f"reading {n}" for n in range(10, 20)]
+        capture.close()
+
+    def test_running_capture_readable(self, tmp_path):
+        """Test another process can read the newest lines of a capture that's still running."""
+        capture = Capture(tmp_path, flush_interval=0)
+        capture.write("\r\n" + lines_output(0, 20))
+        
+        assert tail(tmp_path, 3) == ["reading 17", "reading 18", "reading 19"]
+        capture.close()
+
+    def test_flush_interval(self, tmp_path):
+        """Test the segment is flushed once flush_interval has passed, not after every line."""
+        with patch('circremote.capture.time.monotonic', return_value=100.0) as monotonic:
+            capture = Capture(tmp_path, flush_interval=1.0)
+            capture.write("\r\n" + lines_output(0, 5))
+            assert tail(tmp_path, 1) == []
+            
+            monotonic.return_value = 101.0
+            capture.write(lines_output(5, 1))
+            assert tail(tmp_path, 1) == ["reading 5"]
+        capture.close()
+
+    def test_continues_existing_capture(self, tmp_path):
+        """Test a new run adds to a capture directory, carrying on the line numbers."""
+        first = Capture(tmp_path)
+        first.write("\r\n" + lines_output(0, 10))
+        first.close()
+        second = Capture(tmp_path)
+        second.write("\r\n" + lines_output(10, 10))
+        second.close()
+        
+        assert [path.stem for path in segment_paths(tmp_path)] == ['000000000000', '000000000010']
+        assert list(replay(tmp_path)) == [f"reading {n}" for n in range(20)]
+
+    def test_truncated_segment(self, tmp_path):
+        """Test a segment cut short gives the lines that could be read."""
+        path = tmp_path / '000000000000.gz'
+        data = gzip.compress(lines_output(0, 1000).replace('\r', '').encode())
+        path.write_bytes(data[:len(data) // 2])
+        
+        lines = read_segment(path)
+        assert lines == [f"reading {n}" for n in range(len(lines))]
+
+    def test_tail_zero(self, tmp_path):
+        """Test asking for no lines."""
+        assert tail(tmp_path, 0) == []
@@ -761,4 +761,311 @@ class TestCLI:
         config = Config(options)
         
         # Verify the config path is set to our custom file
-        assert config.config_path == config_file 
\ No newline at end of file
+        assert config.config_path == config_file 
+
+    def test_apply_serial_settings_command_line(self, cli_instance, tmp_path):
+        """Test command line serial settings override the device entry."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        cli_instance.cache.set('uart', 'baudrate', 460800)
+        options = Namespace(verbose=False, quiet=True, baudrate=921600, flow_control='rtscts', probe_baud=False)
+        
+        device_info = cli_instance.apply_serial_settings(
+            {'name': 'uart', 'device': '/dev/ttyUSB0', 'baudrate': 9600}, options)
+        
+        assert device_info['baudrate'] == 921600
+        assert device_info['flow_control'] == 'rtscts'
+
+    def test_apply_serial_settings_probe(self, cli_instance, tmp_path):
+        """Test a probed rate is cached and used on later runs."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        device = {'name': 'uart', 'device': '/dev/ttyUSB0'}
+        
+        options = Namespace(verbose=False, quiet=True, baudrate=None, flow_control=None, probe_baud=True)
+        with patch('circremote.cli.probe_baudrate', return_value=460800) as mock_probe:
+            assert cli_instance.apply_serial_settings(device, options)['baudrate'] == 460800
+            mock_probe.assert_called_once()
+        
+        options.probe_baud = False
+        with patch('circremote.cli.probe_baudrate') as mock_probe:
+            assert cli_instance.apply_serial_settings(device, options)['baudrate'] == 460800
+            mock_probe.assert_not_called()
+        assert 'baudrate' not in device
+
+    def test_apply_serial_settings_websocket(self, cli_instance, tmp_path, capsys):
+        """Test WebSocket devices are never probed."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        options = Namespace(verbose=False, quiet=True, baudrate=None, flow_control=None, probe_baud=True)
+        with patch('circremote.cli.probe_baudrate') as mock_probe:
+            device_info = cli_instance.apply_serial_settings({'name': 'web', 'device': '192.168.1.100'}, options)
+            mock_probe.assert_not_called()
+        assert 'baudrate' not in device_info
+        assert "--probe-baud only applies to serial devices" in capsys.readouterr().out
+
+    def test_apply_serial_settings_probe_with_baudrate(self, cli_instance, tmp_path, capsys):
+        """Test --probe-baud warns instead of probing when a rate is already set."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        options = Namespace(verbose=False, quiet=True, baudrate=None, flow_control=None, probe_baud=True)
+        with patch('circremote.cli.probe_baudrate') as mock_probe:
+            device_info = cli_instance.apply_serial_settings(
+                {'name': 'uart', 'device': '/dev/ttyUSB0', 'baudrate': 9600}, options)
+            mock_probe.assert_not_called()
+        assert device_info['baudrate'] == 9600
+        assert "--probe-baud ignored" in capsys.readouterr().out
+
+    def test_apply_serial_settings_timeouts(self, cli_instance, tmp_path):
+        """Test --read-timeout and --write-timeout override the device entry."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        options = Namespace(verbose=False, quiet=True, baudrate=None, flow_control=None, probe_baud=False,
+                            read_timeout=0.25, write_timeout=3.0)
+        
+        device_info = cli_instance.apply_serial_settings(
+            {'name': 'uart', 'device': '/dev/ttyUSB0', 'read_timeout': 2}, options)
+        assert device_info['read_timeout'] == 0.25
+        assert device_info['write_timeout'] == 3.0
+        
+        options.read_timeout = 0
+        with pytest.raises(SystemExit):
+            cli_instance.apply_serial_settings({'name': 'uart', 'device': '/dev/ttyUSB0'}, options)
+
+    def test_monitor_websocket_output_signalled(self, cli_instance, capsys):
+        """Test WebSocket monitoring ends as soon as the END marker arrives."""
+        import threading
+        import time
+        connection = Mock()
+        connection.on_message.side_effect = lambda handler: threading.Timer(
+            0.05, handler, (b"***START***\r\n21.5\r\n***END***\r\n",)).start()
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        start_time = time.monotonic()
+        cli_instance.monitor_websocket_output(connection, options)
+        
+        assert time.monotonic() - start_time < 1
+        assert "21.5" in capsys.readouterr().out
+
+    def test_monitor_websocket_output_closed(self, cli_instance):
+        """Test WebSocket monitoring ends when the connection closes."""
+        import threading
+        import time
+        connection = Mock()
+        connection.on_close.side_effect = lambda handler: threading.Timer(0.05, handler, (1000, "bye")).start()
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        start_time = time.monotonic()
+        cli_instance.monitor_websocket_output(connection, options)
+        
+        assert time.monotonic() - start_time < 1
+
+    def test_monitor_serial_output_split_markers(self, cli_instance, capsys):
+        """Test markers split across reads are found and only the output is shown."""
+        connection = Mock()
+        connection.read_data.side_effect = [b"OK***STA", b"RT***\r\nhello\r\n***E", b"ND***\r\n\x04\x04>"]
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        cli_instance.monitor_serial_output(connection, options)
+        
+        assert capsys.readouterr().out == "\r\nhello\r\n"
+        assert connection.read_data.call_count == 3
+
+    def test_monitor_serial_output_flushes_on_eof(self, cli_instance, capsys):
+        """Test output that looked like the start of ***END*** is shown when the output ends without it."""
+        connection = Mock()
+        connection.read_data.side_effect = [b"***START***\r\nrating ***", EOFError()]
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        cli_instance.monitor_serial_output(connection, options)
+        
+        assert capsys.readouterr().out == "\r\nrating ***"
+
+    def test_monitor_websocket_output_flushes_on_close(self, cli_instance, capsys):
+        """Test held back output is shown when the WebSocket closes before ***END***."""
+        import threading
+        connection = Mock()
+        
+        def on_message(handler):
+            handler(b"***START***\r\n5 stars: ***E")
+            threading.Timer(0.05, connection.on_close.call_args[0][0], (1000, "bye")).start()
+        connection.on_message.side_effect = on_message
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        cli_instance.monitor_websocket_output(connection, options)
+        
+        assert capsys.readouterr().out == "\r\n5 stars: ***E"
+
+    def test_monitor_serial_output_split_character(self, cli_instance, capsys):
+        """Test a multi-byte character split across reads is shown whole."""
+        connection = Mock()
+        reading = "***START***\r\n21.5 °C\r\n***END***\r\n".encode('utf-8')
+        split = reading.index('°'.encode('utf-8')) + 1
+        connection.read_data.side_effect = [reading[:split], reading[split:]]
+        options = Namespace(verbose=False, quiet=False, timeout=5.0)
+        
+        cli_instance.monitor_serial_output(connection, options)
+        
+        assert capsys.readouterr().out == "\r\n21.5 °C\r\n"
+
+    def test_monitor_serial_output_jsonl(self, cli_instance, capsys):
+        """Test --format jsonl writes a record per output line."""
+        from circremote.output import JSONLinesOutput
+        connection = Mock()
+        connection.read_data.side_effect = [b"***START***\r\n21.5 C\r\n22", b".0 C\r\n***END***\r\n"]
+        options = Namespace(verbose=False, quiet=True, timeout=5.0)
+        cli_instance.output = JSONLinesOutput('sign-1', 'BME280', sys.stdout)
+        
+        cli_instance.monitor_serial_output(connection, options)
+        cli_instance.output.close()
+        
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [(line['seq'], line['line']) for line in lines] == [(0, '21.5 C'), (1, '22.0 C')]
+        assert all(line['device'] == 'sign-1' and line['command'] == 'BME280' for line in lines)
+
+    def test_parse_options_format_jsonl(self, cli_instance):
+        """Test --format jsonl rejects -v."""
+        options, remaining = cli_instance.parse_options(['--format', 'jsonl', 'sign-1', 'BME280'])
+        assert options.output_format == 'jsonl'
+        assert options.quiet is False
+        
+        with pytest.raises(SystemExit):
+            cli_instance.parse_options(['-v', '--format', 'jsonl', 'sign-1', 'BME280'])
+
+    def test_run_jsonl_stdout_is_records(self, cli_instance, capsys):
+        """Test warnings and messages go to stderr with --format jsonl, leaving only records on stdout."""
+        connection = Mock(connection_type='serial')
+        connection.read_data.side_effect = [b"***START***\r\nx: 0.1\r\ny: 0.2\r\n***END***\r\n"]
+        
+        with patch.object(cli_instance, 'run_on_device', return_value=connection), \
+             patch.object(cli_instance, 'handle_circup_installation', side_effect=lambda *args: print("circup")):
+            cli_instance.run(['--format', 'jsonl', '-y', '/dev/ttyFAKE', 'ADXL335'])
+        
+        captured = capsys.readouterr()
+        records = [json.loads(line) for line in captured.out.splitlines()]
+        assert [record['line'] for record in records] == ['x: 0.1', 'y: 0.2']
+        assert "WARNING: This module has not been tested" in captured.err
+        assert "circup" in captured.err
+
+    def test_run_fleet_jsonl_stdout_is_records(self, cli_instance, capsys):
+        """Test a fleet run with --format jsonl keeps its warnings and summary off stdout."""
+        async def fake_run_code(device_info, code, timeout, cache, debug_options, on_output):
+            on_output(f"\r\nhello from {device_info['name']}\r\n")
+            return ''
+        
+        with patch('circremote.fleet.run_code', fake_run_code), pytest.raises(SystemExit) as exit_info:
+            cli_instance.run(['--format', 'jsonl', '-y', 'a,b', 'ADXL335'])
+        
+        assert exit_info.value.code == 0
+        captured = capsys.readouterr()
+        records = [json.loads(line) for line in captured.out.splitlines()]
+        assert sorted((record['device'], record['line']) for record in records) == [
+            ('a', 'hello from a'), ('b', 'hello from b')]
+        assert "2 devices: 2 succeeded, 0 failed" in captured.err
+
+    def test_add_recorder(self, cli_instance, tmp_path, capsys):
+        """Test --record records readings while the output is still shown."""
+        import sqlite3
+        from circremote.output import TextOutput
+        path = tmp_path / 'bench.db'
+        options = Namespace(verbose=False, quiet=False, record=str(path), record_interval=5.0)
+        
+        output = cli_instance.add_recorder(TextOutput(), {'name': 'sign-1'}, 'SCD40', options)
+        output.write("\r\nCO2: 412 ppm\r\n")
+        output.close()
+        
+        assert capsys.readouterr().out == "\r\nCO2: 412 ppm\r\n"
+        db = sqlite3.connect(str(path))
+        assert db.execute('SELECT device, name, value FROM readings').fetchall() == [('sign-1', 'CO2', 412.0)]
+        db.close()
+
+    def test_add_recorder_bad_interval(self, cli_instance, tmp_path):
+        """Test a --record-interval of 0 is rejected."""
+        from circremote.output import TextOutput
+        options = Namespace(verbose=False, quiet=False, record=str(tmp_path / 'bench.db'), record_interval=0)
+        
+        with pytest.raises(SystemExit):
+            cli_instance.add_recorder(TextOutput(), {'name': 'sign-1'}, 'SCD40', options)
+
+    def test_show_capture_tail(self, cli_instance, tmp_path, capsys):
+        """Test --capture DIR --tail N shows the last lines of a capture."""
+        from circremote.capture import Capture
+        capture = Capture(tmp_path, memory_limit=0, segment_size=50)
+        capture.write("\r\n" + ''.join(f"line {n}\r\n" for n in range(100)))
+        capture.close()
+        
+        options = Namespace(verbose=False, quiet=False, capture=str(tmp_path), tail=2, replay=False)
+        cli_instance.show_capture(options)
+        assert capsys.readouterr().out == "line 98\nline 99\n"
+
+    def test_show_capture_missing(self, cli_instance, tmp_path):
+        """Test a capture directory that doesn't exist is an error."""
+        options = Namespace(verbose=False, quiet=False, capture=str(tmp_path / 'none'), tail=10, replay=False)
+        with pytest.raises(SystemExit):
+            cli_instance.show_capture(options)
+
+    def test_run_fleet(self, cli_instance, tmp_path, capsys):
+        """Test a comma-separated device list runs the command on each, prefixed, with a summary."""
+        code_file = tmp_path / 'hello.py'
+        code_file.write_text("print('hello')\n")
+        
+        async def fake_run_code(device_info, code, timeout, cache, debug_options, on_output):
+            on_output(f"\r\nhello from {device_info['name']}\r\n")
+            return ''
+        
+        with patch('circremote.fleet.run_code', fake_run_code), pytest.raises(SystemExit) as exit_info:
+            cli_instance.run(['-U', 'a,bb,a', str(code_file)])
+        
+        assert exit_info.value.code == 0
+        out = capsys.readouterr().out
+        assert "a  | hello from a\r\n" in out
+        assert "bb | hello from bb\r\n" in out
+        assert "2 devices: 2 succeeded, 0 failed" in out
+
+    def test_run_fleet_single_device_option(self, cli_instance, tmp_path, capsys):
+        """Test options that only make sense for one device are refused with several."""
+        with pytest.raises(SystemExit) as exit_info:
+            cli_instance.run(['--record', str(tmp_path / 'r.db'), 'a,b', 'info'])
+        assert exit_info.value.code == 1
+        assert "--record can only be used with one device" in capsys.readouterr().out
+
+    def test_run_fleet_tag_selector(self, cli_instance, capsys):
+        """Test a tag selector runs the command on the devices with those tags."""
+        cli_instance.config.devices = {
+            'a': {'name': 'a', 'device': '/dev/ttyACM0', 'tags': {'site': 'lab1'}},
+            'b': {'name': 'b', 'device': '/dev/ttyACM1', 'tags': {'site': 'lab2'}},
+        }
+        cli_instance.config.index_devices()
+        options = Namespace(verbose=False, quiet=True, compress=False)
+        
+        assert cli_instance.is_fleet('tag:site=lab1')
+        assert not cli_instance.is_fleet('a')
+        assert [device['name'] for device in cli_instance.resolve_devices('tag:site=lab1', options)] == ['a']
+
+    def test_run_inventory(self, cli_instance, tmp_path, capsys):
+        """Test inventory asks only the devices without fresh facts and shows them all."""
+        from circremote.cache import DeviceCache
+        cli_instance.cache = DeviceCache(path=tmp_path / 'cache.json')
+        cli_instance.cache.set('known', 'inventory', {'board_id': 'qtpy', 'version': '8.2.10', 'wifi': False, 'libs': []})
+        asked = []
+        
+        async def fake_run_code(device_info, code, timeout, cache, debug_options, on_output):
+            asked.append(device_info['name'])
+            return '\r\nINVENTORY:{"board_id": "feather_s3", "version": "9.2.1", "wifi": true, "libs": ["a"]}\r\n'
+        
+        with patch('circremote.fleet.run_code', fake_run_code), pytest.raises(SystemExit) as exit_info:
+            cli_instance.run(['inventory', 'known,new'])
+        
+        assert exit_info.value.code == 0
+        assert asked == ['new']
+        assert cli_instance.cache.get('new', 'inventory')['board_id'] == 'feather_s3'
+        assert capsys.readouterr().out.splitlines() == [
+            "Device  Board       CircuitPython  Wi-Fi  Libraries",
+            "known   qtpy        8.2.10         no     0",
+            "new     feather_s3  9.2.1          yes    1",
+        ]
+        
+        with pytest.raises(SystemExit):
+            cli_instance.run(['inventory', '--cached', '--where', 'version=9.*', '--format', 'jsonl', 'known,new'])
+        assert json.loads(capsys.readouterr().out)['device'] == 'new'
+        assert asked == ['new']
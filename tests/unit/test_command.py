@@ -0,0 +1,73 @@
+"""
+Unit tests for finding commands and filling in their templates.
+"""
+
+import json
+import pytest
+
+from circremote.command import load_command, prepare_code, fill_template, template_variables
+from circremote.config import Config
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = Config()
+    config.devices = {}
+    config.command_aliases = {}
+    config.search_paths = []
+    return config
+
+
+class TestCommand:
+    """Test the command helpers shared by the CLI and the asyncio API."""
+
+    def test_load_command_directory(self, tmp_path, config):
+        """Test a command directory is found by path and its info.json read."""
+        (tmp_path / 'code.py').write_text("print(1)\n")
+        (tmp_path / 'info.json').write_text(json.dumps({'description': 'test'}))
+        
+        code, info_data = load_command(str(tmp_path), config)
+        assert code == "print(1)\n"
+        assert info_data == {'description': 'test'}
+
+    def test_load_command_alias_and_search_path(self, tmp_path, config):
+        """Test aliases are followed and search paths come before built-in commands."""
+        (tmp_path / 'BME280').mkdir()
+        (tmp_path / 'BME280' / 'code.py').write_text("print('mine')\n")
+        config.search_paths = [str(tmp_path)]
+        config.command_aliases = {'weather': 'BME280'}
+        
+        assert load_command('weather', config) == ("print('mine')\n", None)
+
+    def test_load_command_builtin(self, config):
+        """Test built-in commands are found by name."""
+        code, info_data = load_command('BME280', config)
+        assert code
+        assert info_data is not None
+
+    def test_load_command_missing(self, config):
+        """Test an unknown command raises FileNotFoundError."""
+        with pytest.raises(FileNotFoundError):
+            load_command('no-such-command', config)
+        with pytest.raises(FileNotFoundError):
+            load_command('./no/such/file.py', config)
+
+    def test_fill_template(self):
+        """Test values are inserted literally, backslashes included."""
+        code = "path = '{{ path }}'\nx = {{x}} + {{ x }}\n"
+        assert template_variables(code) == ['path', 'x']
+        assert fill_template(code, {'path': 'C:\\new', 'x': '1'}) == "path = 'C:\\new'\nx = 1 + 1\n"
+
+    def test_prepare_code_defaults(self):
+        """Test info.json defaults fill in variables that weren't given."""
+        info_data = {'variables': [{'name': 'address', 'default': 0x76}]}
+        assert prepare_code("s = S({{ address }})", info_data, {}, 'test') == "s = S(118)"
+
+    def test_prepare_code_bool_variable(self):
+        """Test bool variables become True or False however they're written, and other values are refused."""
+        info_data = {'variables': [{'name': 'stream', 'type': 'bool', 'default': 'False'}]}
+        assert prepare_code("if {{ stream }}:", info_data, {}, 'test') == "if False:"
+        assert prepare_code("if {{ stream }}:", info_data, {'stream': 'true'}, 'test') == "if True:"
+        assert prepare_code("if {{ stream }}:", info_data, {'stream': '1'}, 'test') == "if True:"
+        with pytest.raises(ValueError, match="true or false"):
+            prepare_code("if {{ stream }}:", info_data, {'stream': 'maybe'}, 'test')
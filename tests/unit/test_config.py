@@ -107,6 +107,30 @@ class TestConfig:
         with pytest.raises(ValueError):
             config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'password': 123})
 
+    def test_validate_device_write_settings(self):
+        config = Config()
+        config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'write_chunk_size': 64,
+                                       'write_delay': 0.005, 'write_timeout': 2, 'write_verify': True})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'write_chunk_size': 0})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'write_delay': -1})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'write_timeout': '2'})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'write_verify': 'yes'})
+
+    def test_validate_device_serial_settings(self):
+        config = Config()
+        config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'baudrate': 921600,
+                                       'read_timeout': 0.5, 'flow_control': 'rtscts'})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'baudrate': '115200'})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'read_timeout': -1})
+        with pytest.raises(ValueError):
+            config.validate_device_config({'name': 'dev', 'device': '/dev/ttyUSB0', 'flow_control': 'cts'})
+
     def test_validate_command_alias_config(self):
         config = Config()
         # Valid alias
@@ -334,4 +358,68 @@ class TestConfig:
         options = Namespace(verbose=True)  # No circup attribute
         
         config.options = options
-        assert config.get_circup_path() == '/opt/homebrew/bin/circup' 
\ No newline at end of file
+        assert config.get_circup_path() == '/opt/homebrew/bin/circup' 
+
+class TestDeviceSelection:
+    """Test device groups, tags and selectors."""
+
+    @pytest.fixture
+    def config(self, tmp_path):
+        config_data = {'devices': [
+            {'name': 'sign-1', 'device': '/dev/ttyACM0', 'groups': ['signs'],
+             'tags': {'site': 'lab1', 'board': 'feather-s3'}},
+            {'name': 'sign-2', 'device': '10.0.1.2', 'groups': ['signs', 'wifi'],
+             'tags': {'site': 'lab2', 'board': 'feather-s3'}},
+            {'name': 'bench', 'device': '/dev/ttyACM1', 'groups': ['wifi'],
+             'tags': {'site': 'lab1', 'board': 'qtpy'}},
+        ]}
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps(config_data))
+        config_path.chmod(0o600)
+        from argparse import Namespace
+        return Config(Namespace(config=str(config_path), verbose=False))
+
+    def test_groups(self, config):
+        """Test group members come back in config file order."""
+        assert config.find_group('wifi') == ['sign-2', 'bench']
+        assert config.find_group('nope') is None
+
+    def test_tags(self, config):
+        """Test devices are found by all of their tags."""
+        assert config.find_tagged({'site': 'lab1'}) == ['sign-1', 'bench']
+        assert config.find_tagged({'site': 'lab1', 'board': 'feather-s3'}) == ['sign-1']
+        assert config.find_tagged({'site': 'lab3'}) == []
+
+    def test_select_devices(self, config):
+        """Test each kind of selector."""
+        assert config.select_devices('tag:site=lab1,board=feather-s3') == ['sign-1']
+        assert config.select_devices('group:signs') == ['sign-1', 'sign-2']
+        assert config.select_devices('wifi,sign-1,/dev/ttyUSB0,bench') == ['sign-2', 'bench', 'sign-1', '/dev/ttyUSB0']
+
+    def test_select_devices_errors(self, config):
+        """Test malformed and empty selections are reported."""
+        with pytest.raises(ValueError, match="Tag selectors"):
+            config.select_devices('tag:site')
+        with pytest.raises(ValueError, match="No group named 'nope'"):
+            config.select_devices('group:nope')
+        with pytest.raises(ValueError, match="No devices match"):
+            config.select_devices('tag:site=lab3')
+
+    def test_many_devices(self):
+        """Test a tag lookup only walks the devices with the rarest tag."""
+        config = Config()
+        config.devices = {f'board-{n}': {'name': f'board-{n}', 'device': f'/dev/tty{n}',
+                                         'tags': {'site': f'lab{n % 10}', 'rack': str(n % 1000)}}
+                          for n in range(10000)}
+        config.index_devices()
+        assert config.find_tagged({'site': 'lab3', 'rack': '123'}) == [f'board-{n}' for n in range(123, 10000, 1000)]
+
+    def test_validate(self):
+        """Test groups and tags are checked when the config is loaded."""
+        config = Config()
+        with pytest.raises(ValueError, match="'groups'"):
+            config.validate_device_config({'name': 'a', 'device': 'b', 'groups': 'signs'})
+        with pytest.raises(ValueError, match="'tags'"):
+            config.validate_device_config({'name': 'a', 'device': 'b', 'tags': {'rack': 4}})
+        with pytest.raises(ValueError, match="tag names"):
+            config.validate_device_config({'name': 'a', 'device': 'b', 'tags': {'a=b': 'c'}})
@@ -2,13 +2,16 @@
 Unit tests for the CircuitPythonConnection class.
 """
 
+import os
+import time
 import pytest
 import serial
+import threading
 import websocket
 from unittest.mock import Mock, patch, MagicMock
 from argparse import Namespace
 
-from circremote.connection import CircuitPythonConnection
+from circremote.connection import CircuitPythonConnection, probe_baudrate
 
 
 class TestCircuitPythonConnection:
@@ -28,13 +31,106 @@ class TestCircuitPythonConnection:
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=1
+                timeout=1,
+                rtscts=False,
+                xonxoff=False,
+                dsrdtr=False
             )
 
+    def test_init_serial_connection_settings(self):
+        """Test serial line settings from the device entry."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial.return_value = Mock()
+            
+            CircuitPythonConnection('/dev/ttyUSB0', device_options={
+                'baudrate': 921600, 'read_timeout': 0.2, 'flow_control': 'rtscts'
+            })
+            
+            kwargs = mock_serial.call_args.kwargs
+            assert kwargs['baudrate'] == 921600
+            assert kwargs['timeout'] == 0.2
+            assert kwargs['rtscts'] is True
+            assert kwargs['xonxoff'] is False
+
+    def test_probe_baudrate(self):
+        """Test the probe picks the fastest rate that gets a prompt back."""
+        def open_port(port, baudrate, timeout, **flow):
+            if baudrate == 921600:
+                raise serial.SerialException("unsupported rate")
+            probe = MagicMock()
+            probe.__enter__.return_value = probe
+            probe.in_waiting = 0
+            probe.read.return_value = b'\r\n>>> ' if baudrate == 230400 else b'\xfe\x00'
+            return probe
+        
+        with patch('serial.Serial', side_effect=open_port) as mock_serial:
+            assert probe_baudrate('/dev/ttyUSB0', timeout=0.01) == 230400
+            tried = [call.kwargs['baudrate'] for call in mock_serial.call_args_list]
+            assert tried == [921600, 460800, 230400]
+
+    def test_probe_baudrate_no_answer(self):
+        """Test the probe gives up when the board never answers."""
+        probe = MagicMock()
+        probe.__enter__.return_value = probe
+        probe.in_waiting = 0
+        probe.read.return_value = b''
+        with patch('serial.Serial', return_value=probe):
+            assert probe_baudrate('/dev/ttyUSB0', rates=(115200, 9600), timeout=0.01) is None
+
     def test_init_websocket_connection(self):
         """Test initialization of WebSocket connection."""
         pytest.skip("WebSocket connection tests require complex mocking")
 
+    def test_websocket_connect_signalled(self):
+        """Test connecting returns as soon as the WebSocket thread reports the open."""
+        class FakeWebSocketApp:
+            def __init__(self, url, header, on_open, on_message, on_error, on_close):
+                self.on_open = on_open
+            
+            def run_forever(self):
+                self.on_open(self)
+        
+        with patch('websocket.WebSocketApp', FakeWebSocketApp):
+            start_time = time.monotonic()
+            connection = CircuitPythonConnection('192.168.1.100')
+            assert connection.connection_type == 'websocket'
+            assert time.monotonic() - start_time < 0.05
+
+    def test_websocket_connect_closed_early(self, capsys):
+        """Test a socket that closes before opening fails straight away."""
+        class FakeWebSocketApp:
+            def __init__(self, url, header, on_open, on_message, on_error, on_close):
+                self.on_close = on_close
+            
+            def run_forever(self):
+                self.on_close(self, None, None)
+        
+        with patch('websocket.WebSocketApp', FakeWebSocketApp):
+            start_time = time.monotonic()
+            with pytest.raises(RuntimeError, match="closed before"):
+                CircuitPythonConnection('192.168.1.100')
+            assert time.monotonic() - start_time < 1
+
+    def test_websocket_connect_bad_password(self, capsys):
+        """Test a 401 is reported as a bad password even if classifying it is slow."""
+        class SlowUnauthorized(Exception):
+            @property
+            def status_code(self):
+                time.sleep(0.1)
+                return 401
+        
+        class FakeWebSocketApp:
+            def __init__(self, url, header, on_open, on_message, on_error, on_close):
+                self.on_error = on_error
+            
+            def run_forever(self):
+                self.on_error(self, SlowUnauthorized("Handshake status 401"))
+        
+        with patch('websocket.WebSocketApp', FakeWebSocketApp):
+            with pytest.raises(RuntimeError, match="Bad password"):
+                CircuitPythonConnection('192.168.1.100', password='wrong')
+        assert "check your password" in capsys.readouterr().out
+
     def test_init_websocket_connection_with_password(self):
         """Test initialization of WebSocket connection with password."""
         pytest.skip("WebSocket connection tests require complex mocking")
@@ -80,6 +176,58 @@ class TestCircuitPythonConnection:
             assert result == ''
             mock_serial_instance.read.assert_called_once_with(1024)
 
+    @pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs a pseudo-terminal")
+    def test_read_nonblock_serial_event_driven(self):
+        """Test serial reads wake up as soon as data arrives instead of polling."""
+        master, slave = os.openpty()
+        try:
+            connection = CircuitPythonConnection(os.ttyname(slave), device_options={'read_timeout': 0.2})
+            assert connection.selector is not None
+            
+            threading.Timer(0.05, os.write, (master, b'hello\r\n')).start()
+            start_time = time.monotonic()
+            assert connection.read_nonblock(1024) == 'hello\r\n'
+            assert time.monotonic() - start_time < 0.15
+            
+            # Nothing arrives: wait out the read timeout and return nothing
+            start_time = time.monotonic()
+            assert connection.read_nonblock(1024) == ''
+            assert time.monotonic() - start_time >= 0.15
+            
+            # A burst larger than max_bytes is kept for the next read
+            os.write(master, b'x' * 3000)
+            time.sleep(0.05)
+            assert connection.read_nonblock(1024) == 'x' * 1024
+            assert len(connection.rx_buffer) == 3000 - 1024
+            connection.close()
+            assert connection.selector is None
+        finally:
+            os.close(master)
+            os.close(slave)
+
+    def test_read_nonblock_serial_split_character(self):
+        """Test a multi-byte character split across reads is decoded whole."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.read.side_effect = [b'21.5 \xc2', b'\xb0C']
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            
+            assert connection.read_nonblock(1024) == '21.5 '
+            assert connection.read_nonblock(1024) == '°C'
+
+    def test_read_data_serial(self):
+        """Test read_data returns the bytes as read."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.read.return_value = b'\xb5g/m\xc2\xb3'
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            
+            assert connection.read_data(1024) == b'\xb5g/m\xc2\xb3'
+
     def test_read_nonblock_websocket_raises_error(self):
         """Test that read_nonblock raises error for WebSocket connections."""
         pytest.skip("WebSocket connection tests require complex mocking")
@@ -208,4 +356,92 @@ class TestCircuitPythonConnection:
             
             for connection_spec, expected in test_cases:
                 host, port = connection.parse_websocket_connection(connection_spec)
-                assert (host, port) == expected, f"Expected {expected} for '{connection_spec}', got ({host}, {port})" 
\ No newline at end of file
+                assert (host, port) == expected, f"Expected {expected} for '{connection_spec}', got ({host}, {port})" 
+
+    def test_read_until_serial(self):
+        """Test read_until stops at the terminator and keeps the rest buffered."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.timeout = 1
+            mock_serial_instance.in_waiting = 0
+            mock_serial_instance.read.side_effect = [b'raw REPL; CTRL', b'-B to exit\r\n>OK', b'']
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            result = connection.read_until(b'raw REPL; CTRL-B to exit\r\n>', 1.0)
+            
+            assert result == b'raw REPL; CTRL-B to exit\r\n>'
+            assert connection.read_nonblock(1024) == 'OK'
+            assert mock_serial_instance.timeout == 1
+
+    def test_read_until_serial_timeout(self):
+        """Test read_until returns what it has when the terminator never arrives."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.timeout = 1
+            mock_serial_instance.in_waiting = 0
+            mock_serial_instance.read.return_value = b''
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            connection.rx_buffer.extend(b'partial')
+            result = connection.read_until(b'>>> ', 0.05)
+            
+            assert result == b'partial'
+            assert not connection.rx_buffer
+
+    def test_write_serial_chunked(self):
+        """Test writes are split into configured chunks with pacing."""
+        with patch('serial.Serial') as mock_serial, patch('time.sleep') as mock_sleep:
+            mock_serial_instance = Mock()
+            mock_serial_instance.write.side_effect = lambda data: len(data)
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0', device_options={
+                'write_chunk_size': 4,
+                'write_delay': 0.01
+            })
+            connection.write('0123456789')
+            
+            chunks = [call.args[0] for call in mock_serial_instance.write.call_args_list]
+            assert chunks == [b'0123', b'4567', b'89']
+            assert mock_sleep.call_count == 2
+            assert connection.bytes_written == 10
+
+    def test_write_serial_partial_write_resumes(self):
+        """Test a partial write is resumed from where it stopped."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.write.side_effect = [3, 7]
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            connection.write('0123456789')
+            
+            chunks = [call.args[0] for call in mock_serial_instance.write.call_args_list]
+            assert chunks == [b'0123456789', b'3456789']
+
+    def test_write_serial_timeout(self):
+        """Test a write timeout is reported clearly."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial_instance = Mock()
+            mock_serial_instance.write.side_effect = serial.SerialTimeoutException('Write timeout')
+            mock_serial.return_value = mock_serial_instance
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0', device_options={'write_timeout': 2})
+            
+            assert mock_serial_instance.write_timeout == 2
+            with pytest.raises(RuntimeError, match="Timed out after 2 seconds"):
+                connection.write('data')
+
+    def test_write_rate(self):
+        """Test write throughput tracking."""
+        with patch('serial.Serial') as mock_serial:
+            mock_serial.return_value = Mock()
+            
+            connection = CircuitPythonConnection('/dev/ttyUSB0')
+            assert connection.write_rate() == 0.0
+            
+            connection.bytes_written = 1000
+            connection.write_seconds = 0.5
+            assert connection.write_rate() == 2000.0
@@ -0,0 +1,167 @@
+"""
+Unit tests for finding Web Workflow devices.
+"""
+
+import json
+import time
+import socket
+import asyncio
+import threading
+import pytest
+from argparse import Namespace
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from circremote.discover import (
+    discover, probe, parse_network, parse_response, dechunk, remember, find_by_hostname
+)
+
+
+VERSION = {
+    'web_api_version': 4, 'version': '9.2.1', 'build_date': '2024-11-20',
+    'board_name': 'Adafruit Feather ESP32-S3', 'mcu_name': 'ESP32S3', 'board_id': 'adafruit_feather_esp32s3',
+    'creator_id': 9114, 'creation_id': 33042, 'hostname': 'cpy-feather-abc123', 'port': 80, 'ip': '127.0.0.1',
+}
+
+
+def serve_version(version=VERSION, chunked=False, status=200):
+    """Run a stub Web Workflow server on 127.0.0.1 in a thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            body = json.dumps(version).encode()
+            if self.path != '/cp/version.json' or status != 200:
+                self.send_error(status if status != 200 else 404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for start in range(0, len(body), 50):
+                    chunk = body[start:start + 50]
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestProbe:
+    """Test asking one address for version.json."""
+
+    @pytest.mark.parametrize('chunked', [False, True])
+    def test_finds_board(self, chunked):
+        """Test a board's version.json is read, with or without chunked encoding."""
+        server = serve_version(chunked=chunked)
+        try:
+            assert asyncio.run(probe('127.0.0.1', server.server_address[1])) == VERSION
+        finally:
+            server.shutdown()
+
+    def test_not_a_board(self):
+        """Test an HTTP server without version.json isn't taken for a board."""
+        server = serve_version(status=404)
+        try:
+            assert asyncio.run(probe('127.0.0.1', server.server_address[1])) is None
+        finally:
+            server.shutdown()
+
+    def test_silent_host(self):
+        """Test a host that accepts the connection but never answers is given up on after the timeout."""
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        try:
+            start_time = time.monotonic()
+            assert asyncio.run(probe('127.0.0.1', listener.getsockname()[1], timeout=0.2)) is None
+            assert time.monotonic() - start_time < 1.0
+        finally:
+            listener.close()
+
+
+class TestDiscover:
+    """Test searching a range of addresses."""
+
+    def test_finds_board_in_range(self):
+        """Test only the address with a board is found, quickly, with its port."""
+        server = serve_version()
+        port = server.server_address[1]
+        found = []
+        try:
+            start_time = time.monotonic()
+            results = asyncio.run(discover('127.0.0.0/28', port, timeout=0.5,
+                                           on_found=lambda address, version: found.append(address)))
+        finally:
+            server.shutdown()
+        
+        assert time.monotonic() - start_time < 2.0
+        assert results == [(f'127.0.0.1:{port}', VERSION)]
+        assert found == [f'127.0.0.1:{port}']
+
+    def test_parse_network(self):
+        """Test ranges with and without a port, and ones that are refused."""
+        network, port = parse_network('192.168.1.17/24')
+        assert str(network) == '192.168.1.0/24' and port == 80
+        assert parse_network('10.0.0.0/30:8080')[1] == 8080
+        with pytest.raises(ValueError, match="at most a /16"):
+            parse_network('10.0.0.0/8')
+        with pytest.raises(ValueError, match="Expected a range"):
+            parse_network('not-a-network')
+
+
+class TestResponses:
+    """Test reading HTTP responses."""
+
+    def test_dechunk(self):
+        assert dechunk(b"4\r\nWiki\r\n5;x=y\r\npedia\r\n0\r\n\r\n") == b"Wikipedia"
+
+    def test_parse_response(self):
+        """Test only successful JSON object responses are accepted."""
+        assert parse_response(b'HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\n{"a": 1}') == {'a': 1}
+        assert parse_response(b'HTTP/1.1 401 Unauthorized\r\n\r\n{"a": 1}') is None
+        assert parse_response(b'HTTP/1.1 200 OK\r\n\r\n<html>') is None
+        assert parse_response(b'SSH-2.0-OpenSSH_9.6\r\n') is None
+
+
+class TestRemember:
+    """Test keeping discovered boards in the device cache."""
+
+    def test_remember_and_find(self, cache):
+        """Test a discovered board is kept under its address and found by hostname."""
+        facts = remember(cache, '192.168.1.50', VERSION)
+        assert facts['board_id'] == 'adafruit_feather_esp32s3'
+        assert 'creator_id' not in facts
+        assert cache.get('192.168.1.50', 'web_workflow') == facts
+        assert find_by_hostname(cache, 'cpy-feather-abc123.local') == '192.168.1.50'
+        assert find_by_hostname(cache, 'CPY-FEATHER-ABC123') == '192.168.1.50'
+        assert find_by_hostname(cache, 'other') is None
+
+    def test_cli_discover(self, cli_instance, cache, capsys):
+        """Test circremote discover lists and remembers what it finds."""
+        server = serve_version()
+        port = server.server_address[1]
+        cli_instance.cache = cache
+        try:
+            with patch.object(cache, 'save', wraps=cache.save) as save, pytest.raises(SystemExit) as exit_info:
+                cli_instance.run(['discover', f'127.0.0.0/30:{port}'])
+        finally:
+            server.shutdown()
+        assert save.call_count == 1
+        
+        assert exit_info.value.code == 0
+        out = capsys.readouterr().out
+        assert f"127.0.0.1:{port}  cpy-feather-abc123  adafruit_feather_esp32s3  9.2.1" in out
+        assert "Found 1 Web Workflow devices among 4 addresses" in out
+        assert cli_instance.resolve_device('cpy-feather-abc123.local', Namespace(verbose=False)) == \
+            {'name': 'cpy-feather-abc123.local', 'device': f'127.0.0.1:{port}'}
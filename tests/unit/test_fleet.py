@@ -0,0 +1,85 @@
+"""
+Unit tests for running a command on many devices at once.
+"""
+
+import time
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from circremote.fleet import FleetResult, run_fleet, summary_lines
+
+
+async def fake_run_code(device_info, code, timeout, cache, debug_options, on_output):
+    """Stand-in for aio.run_code that takes device_info['delay'] seconds."""
+    await asyncio.sleep(device_info.get('delay', 0.0))
+    if device_info.get('error'):
+        raise OSError(device_info['error'])
+    if on_output:
+        on_output(f"\r\n{code} on {device_info['name']}\r\n")
+    return f"\r\n{code} on {device_info['name']}\r\n"
+
+
+def devices(*names, **settings):
+    return [dict({'name': name, 'device': name}, **settings) for name in names]
+
+
+class TestRunFleet:
+    """Test run_fleet()."""
+
+    @pytest.fixture(autouse=True)
+    def fake_boards(self):
+        with patch('circremote.fleet.run_code', fake_run_code):
+            yield
+
+    def test_runs_on_every_device_at_once(self):
+        """Test devices run together, so the sweep takes about as long as one device."""
+        seen = []
+        start_time = time.monotonic()
+        results = asyncio.run(run_fleet(devices('a', 'b', 'c', 'd', delay=0.2), 'info',
+                                        on_output=lambda device_info, text: seen.append((device_info['name'], text))))
+        
+        assert time.monotonic() - start_time < 0.6
+        assert [result.device for result in results] == ['a', 'b', 'c', 'd']
+        assert all(result.ok for result in results)
+        assert results[1].output == "\r\ninfo on b\r\n"
+        assert sorted(seen) == [(name, f"\r\ninfo on {name}\r\n") for name in 'abcd']
+
+    def test_concurrency_limit(self):
+        """Test no more than concurrency devices are worked on at once."""
+        start_time = time.monotonic()
+        asyncio.run(run_fleet(devices('a', 'b', 'c', 'd', delay=0.2), 'info', concurrency=2))
+        assert time.monotonic() - start_time >= 0.4
+
+    def test_failure_doesnt_stop_others(self):
+        """Test a device that fails is reported and the rest still run."""
+        fleet = devices('a', 'c') + devices('b', error='could not open port')
+        results = asyncio.run(run_fleet(fleet, 'info'))
+        
+        assert [result.ok for result in results] == [True, True, False]
+        assert results[2].error == 'could not open port'
+
+    def test_device_timeout(self):
+        """Test a device that takes too long is given up on without holding up the others."""
+        fleet = devices('fast') + devices('stuck', delay=5.0)
+        start_time = time.monotonic()
+        results = asyncio.run(run_fleet(fleet, 'info', device_timeout=0.2))
+        
+        assert time.monotonic() - start_time < 1.0
+        assert results[0].ok
+        assert not results[1].ok
+        assert results[1].error == 'No result after 0.2 seconds'
+
+
+class TestSummaryLines:
+    """Test summary_lines()."""
+
+    def test_table(self):
+        """Test each device gets a row and the totals come last."""
+        results = [FleetResult('sign-1', True, 1.25), FleetResult('b', False, 10.0, error='No answer')]
+        assert summary_lines(results, 10.5) == [
+            "Device  Result      Time",
+            "sign-1  ok         1.2 s",
+            "b       failed    10.0 s  No answer",
+            "2 devices: 1 succeeded, 1 failed in 10.5 s",
+        ]
@@ -0,0 +1,134 @@
+"""
+Unit tests for binary frames from device code.
+"""
+
+import io
+import contextlib
+
+import pytest
+
+from circremote.frames import (
+    Frame, FrameDemux, FRAME_PREFIX, DEVICE_HELPER, add_device_helper, encode_frame, decode_frame, format_frame
+)
+from tests.fakeboard import Collector
+
+
+def run_device_helper(code):
+    """Run code with the device helper under CPython and return what it prints."""
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        exec(add_device_helper(code), {})
+    return printed.getvalue()
+
+
+def demux(chunks):
+    output = Collector()
+    frames = []
+    demuxer = FrameDemux(output, frames.append)
+    for chunk in chunks:
+        demuxer.write(chunk)
+    demuxer.close()
+    return output.text, frames, demuxer
+
+
+class TestFrames:
+    """Test encoding and decoding frames."""
+
+    @pytest.mark.parametrize("values,typecode", [
+        ((1.5, -2.25, 30.0), 'f'),
+        ((1, -2, 300), 'h'),
+        ((0, 255), 'B'),
+        ((), 'f'),
+    ])
+    def test_round_trip(self, values, typecode):
+        """Test frames decode to the values encoded."""
+        line = encode_frame(values, typecode, channel=3)
+        assert line.startswith(FRAME_PREFIX)
+        assert decode_frame(line[len(FRAME_PREFIX):]) == Frame(3, typecode, values)
+
+    def test_device_helper(self):
+        """Test frames from the device helper decode on the host."""
+        printed = run_device_helper("send_frame([20.5, 21.0, 21.5], 'f', 1)")
+        assert printed.strip() == encode_frame([20.5, 21.0, 21.5], 'f', 1)
+
+    def test_device_helper_only_when_used(self):
+        """Test code that doesn't send frames is left alone."""
+        assert add_device_helper("print('hello')") == "print('hello')"
+        assert add_device_helper("send_frame(data)").startswith(DEVICE_HELPER)
+
+    def test_damaged(self):
+        """Test damaged frames are rejected."""
+        encoded = encode_frame([1.0, 2.0])[len(FRAME_PREFIX):]
+        damaged = encoded[:8] + ('A' if encoded[8] != 'A' else 'B') + encoded[9:]
+        with pytest.raises(ValueError, match="checksum"):
+            decode_frame(damaged)
+        with pytest.raises(ValueError):
+            decode_frame(encoded[:-8])
+        with pytest.raises(ValueError):
+            decode_frame("not base64!")
+
+    def test_unsupported_typecode(self):
+        """Test only numeric struct type codes are accepted."""
+        with pytest.raises(ValueError):
+            encode_frame([b'x'], 's')
+
+    def test_format_frame(self):
+        """Test frames shown as text."""
+        assert format_frame(Frame(0, 'f', (20.5, 21.0))) == "frame 0 (2 x f): 20.5 21\r\n"
+        assert format_frame(Frame(1, 'h', (1, -2))) == "frame 1 (2 x h): 1 -2\r\n"
+
+
+class TestFrameDemux:
+    """Test the FrameDemux class."""
+
+    STREAM = ("\r\nMLX90640 ready\r\n"
+              + encode_frame([20.5, 21.0], 'f') + "\r\n"
+              + "frame rate 2 Hz\r\n"
+              + encode_frame([1, 2, 3], 'H', 1) + "\r\n"
+              + "done ***")
+
+    def test_demux(self):
+        """Test frames are taken out and everything else passed on."""
+        text, frames, demuxer = demux([self.STREAM])
+        assert text == "\r\nMLX90640 ready\r\nframe rate 2 Hz\r\ndone ***"
+        assert frames == [Frame(0, 'f', (20.5, 21.0)), Frame(1, 'H', (1, 2, 3))]
+        assert demuxer.frames == 2
+        assert demuxer.output.closed
+
+    @pytest.mark.parametrize("split", range(1, 60))
+    def test_split_anywhere(self, split):
+        """Test frames and text split across writes."""
+        text, frames, demuxer = demux([self.STREAM[:split], self.STREAM[split:]])
+        assert text == "\r\nMLX90640 ready\r\nframe rate 2 Hz\r\ndone ***"
+        assert len(frames) == 2
+
+    def test_one_character_at_a_time(self):
+        """Test feeding the stream a character at a time."""
+        text, frames, demuxer = demux(list(self.STREAM))
+        assert text == "\r\nMLX90640 ready\r\nframe rate 2 Hz\r\ndone ***"
+        assert len(frames) == 2
+
+    def test_text_not_held_back(self):
+        """Test ordinary output is passed on before its line ends."""
+        output = Collector()
+        demuxer = FrameDemux(output, None)
+        demuxer.write("\r\nprogress: 50%")
+        assert output.text == "\r\nprogress: 50%"
+
+    def test_prefix_mid_line_is_text(self):
+        """Test the frame prefix only counts at the start of a line."""
+        text, frames, demuxer = demux(["\r\nsee ***FRAME***abc\r\n"])
+        assert text == "\r\nsee ***FRAME***abc\r\n"
+        assert frames == []
+
+    def test_damaged_frame_counted(self):
+        """Test damaged frames are dropped and counted."""
+        text, frames, demuxer = demux(["\r\n***FRAME***AAAA\r\nok\r\n"])
+        assert text == "\r\nok\r\n"
+        assert frames == []
+        assert demuxer.damaged == 1
+
+    def test_frame_without_line_ending(self):
+        """Test a last frame without its line ending is decoded on close."""
+        text, frames, demuxer = demux(["\r\n" + encode_frame([7], 'B')])
+        assert frames == [Frame(0, 'B', (7,))]
@@ -0,0 +1,98 @@
+"""
+Unit tests for device inventories.
+"""
+
+import sys
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+from circremote.cache import DeviceCache
+from circremote.inventory import (
+    INVENTORY_CODE, INVENTORY_MAX_AGE, parse_inventory, requirement_name, missing_libraries,
+    missing_pins, matches, find_devices, skip_pin_fallback
+)
+from circremote.command import read_info, prepare_code
+
+
+COMMANDS_DIR = Path(__file__).parent.parent.parent / 'circremote' / 'commands'
+
+FACTS = {
+    'version': '9.2.1', 'date': '2024-11-20', 'machine': 'Adafruit Feather ESP32-S3 with ESP32S3',
+    'board_id': 'adafruit_feather_esp32s3', 'board': ['I2C', 'SCL', 'SDA', 'board_id'],
+    'wifi': True, 'libs': ['adafruit_bme280', 'adafruit_bus_device'],
+}
+
+
+class TestInventoryCode:
+    """Test the code that runs on the board."""
+
+    def test_prints_facts(self, capsys):
+        """Test the inventory code prints one line that parses back into the facts."""
+        board = types.SimpleNamespace(board_id='test_board', SDA=1, SCL=2)
+        with patch.dict(sys.modules, {'board': board}), \
+                patch('os.listdir', return_value=['adafruit_bme280.mpy', 'adafruit_bus_device', 'code.py']):
+            exec(INVENTORY_CODE, {})
+        
+        facts = parse_inventory(capsys.readouterr().out)
+        assert facts['board_id'] == 'test_board'
+        assert facts['board'] == ['SCL', 'SDA', 'board_id']
+        assert facts['libs'] == ['adafruit_bme280', 'adafruit_bus_device', 'code']
+        assert facts['wifi'] is False
+
+    def test_parse_without_facts(self):
+        """Test output without an inventory line, or a damaged one, gives None."""
+        assert parse_inventory("\r\nTraceback (most recent call last):\r\n") is None
+        assert parse_inventory("\r\nINVENTORY:{\"version\r\n") is None
+
+
+class TestFacts:
+    """Test answering questions from the facts."""
+
+    def test_requirement_name(self):
+        """Test requirements.txt lines give the names libraries have in /lib."""
+        assert requirement_name("adafruit_bme280") == 'adafruit_bme280'
+        assert requirement_name("adafruit-circuitpython-bme280>=2.6") == 'adafruit_circuitpython_bme280'
+
+    def test_missing_libraries(self):
+        """Test only the requirements not in /lib are listed."""
+        assert missing_libraries(FACTS, ['adafruit_bme280']) == []
+        assert missing_libraries(FACTS, ['adafruit_bme280', 'adafruit_sht31d']) == ['adafruit_sht31d']
+
+    def test_missing_pins(self):
+        """Test board names the board doesn't have are found, and other values ignored."""
+        assert missing_pins(FACTS, ['board.SDA', 'board.IO1', '0x76', None]) == ['board.IO1']
+
+    def test_skip_pin_fallback(self):
+        """Test the I2C fallback block becomes the branch the facts say will work."""
+        code = prepare_code((COMMANDS_DIR / 'BME280' / 'code.py').read_text(),
+                            read_info(COMMANDS_DIR / 'BME280'), {}, 'BME280')
+        assert "except:\n    i2c = board.I2C()" in code
+        
+        skipped = skip_pin_fallback(code, FACTS)
+        assert "\ni2c = busio.I2C(board.SCL, board.SDA)\n" in skipped
+        assert "board.I2C()" not in skipped
+        
+        no_pins = dict(FACTS, board=['I2C', 'IO1', 'IO2'])
+        assert "\ni2c = board.I2C()\n" in skip_pin_fallback(code, no_pins)
+        assert skip_pin_fallback(code, dict(FACTS, board=['IO1', 'IO2'])) == code
+
+    def test_matches(self):
+        """Test shell-style patterns against strings, yes/no facts and lists."""
+        assert matches(FACTS, [('version', '9.*'), ('wifi', 'true')])
+        assert not matches(FACTS, [('version', '8.*')])
+        assert not matches(FACTS, [('wifi', 'false')])
+        assert matches(FACTS, [('libs', 'adafruit_bme*')])
+        assert not matches(FACTS, [('flash_free', '*')])
+
+    def test_find_devices(self, tmp_path):
+        """Test devices are found from cached facts, leaving out old and missing ones."""
+        cache = DeviceCache(path=tmp_path / 'cache.json')
+        cache.set('sign-1', 'inventory', FACTS)
+        cache.set('sign-2', 'inventory', dict(FACTS, version='8.2.10'))
+        cache.set('old', 'inventory', FACTS)
+        cache.load()['old']['inventory']['updated'] -= INVENTORY_MAX_AGE + 1
+        
+        names = ['sign-1', 'sign-2', 'old', 'unknown']
+        assert [name for name, facts in find_devices(cache, names, [('version', '9.*')])] == ['sign-1']
+        assert [name for name, facts in find_devices(cache, names)] == ['sign-1', 'sign-2']
@@ -0,0 +1,73 @@
+"""
+Unit tests for the streaming marker scanner.
+"""
+
+import pytest
+
+from circremote.markers import MarkerScanner, START_MARKER, END_MARKER
+
+
+STREAM = "\x04OK>>> junk***START***\r\n21.5 C\r\n**bold**\r\n***END***\r\n\x04\x04>"
+
+
+def scan(chunks, scanner=None):
+    scanner = scanner or MarkerScanner()
+    return ''.join(scanner.feed(chunk) for chunk in chunks), scanner
+
+
+class TestMarkerScanner:
+    """Test the MarkerScanner class."""
+
+    def test_single_chunk(self):
+        """Test markers and output in one piece."""
+        output, scanner = scan([STREAM])
+        assert output == "\r\n21.5 C\r\n**bold**\r\n"
+        assert scanner.found_start and scanner.found_end
+
+    @pytest.mark.parametrize("split", range(1, len(STREAM)))
+    def test_split_anywhere(self, split):
+        """Test a marker split across two reads is still found."""
+        output, scanner = scan([STREAM[:split], STREAM[split:]])
+        assert output == "\r\n21.5 C\r\n**bold**\r\n"
+        assert scanner.found_end
+
+    def test_one_character_at_a_time(self):
+        """Test feeding the stream a character at a time."""
+        output, scanner = scan(list(STREAM))
+        assert output == "\r\n21.5 C\r\n**bold**\r\n"
+
+    def test_bytes(self):
+        """Test scanning bytes with bytes markers."""
+        scanner = MarkerScanner(START_MARKER.encode(), END_MARKER.encode())
+        data = STREAM.encode()
+        output = b''.join(scanner.feed(data[i:i + 3]) for i in range(0, len(data), 3))
+        assert output == b"\r\n21.5 C\r\n**bold**\r\n"
+
+    def test_output_passed_on_as_it_arrives(self):
+        """Test output is returned straight away, not held until the end marker."""
+        scanner = MarkerScanner()
+        assert scanner.feed("***START***\r\nline 1\r\n") == "\r\nline 1\r\n"
+        assert scanner.feed("line 2\r\n*") == "line 2\r\n"
+        assert scanner.feed("not a marker\r\n") == "*not a marker\r\n"
+
+    def test_nothing_after_end(self):
+        """Test data after the end marker is ignored."""
+        scanner = MarkerScanner()
+        scanner.feed("***START***a***END***")
+        assert scanner.feed("more") == ""
+
+    def test_flush(self):
+        """Test held back output can be recovered when the stream stops."""
+        scanner = MarkerScanner()
+        assert scanner.feed("***START***50%***") == "50%"
+        assert scanner.flush() == "***"
+
+    def test_bounded_memory(self):
+        """Test the held back data stays small however much output goes by."""
+        scanner = MarkerScanner()
+        scanner.feed("noise " * 1000)
+        assert len(scanner.carry) < len(START_MARKER)
+        scanner.feed(START_MARKER)
+        for _ in range(1000):
+            scanner.feed("x" * 100 + "**")
+            assert len(scanner.carry) < len(END_MARKER)
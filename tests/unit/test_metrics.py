@@ -0,0 +1,145 @@
+"""
+Unit tests for metrics taken from command output.
+"""
+
+import os
+import json
+import stat
+import urllib.request
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from circremote.metrics import MetricsOutput, MetricsRegistry, MetricsServer, load_metrics, write_textfile
+
+
+COMMANDS_DIR = Path(__file__).parent.parent.parent / 'circremote' / 'commands'
+
+SHT31D_OUTPUT = (
+    "\r\nSHT31-D Temperature & Humidity Sensor\r\n"
+    "Heater: False\r\n"
+    "Temperature: 21.5°C\r\n"
+    "Humidity: 40.2%\r\n"
+    "Comfort Level: Comfortable\r\n"
+    "------------------------------\r\n"
+    "Temperature: 21.7°C\r\n"
+)
+
+
+def sht31d_metrics():
+    return load_metrics(json.loads((COMMANDS_DIR / 'SHT31D' / 'info.json').read_text()), 'SHT31D')
+
+
+class TestLoadMetrics:
+    """Test the load_metrics function."""
+
+    def test_builtin(self):
+        """Test the SHT31D command's metrics compile."""
+        assert [metric.name for metric in sht31d_metrics()] == ['temperature_celsius', 'relative_humidity_percent']
+
+    def test_none(self):
+        """Test commands without metrics."""
+        assert load_metrics(None, 'ls') == []
+        assert load_metrics({'description': 'List files'}, 'ls') == []
+
+    @pytest.mark.parametrize("entry,message", [
+        ({'name': 'bad name', 'pattern': '(?P<value>.*)'}, "Invalid metric name"),
+        ({'name': 'temp'}, "no pattern"),
+        ({'name': 'temp', 'pattern': '(unclosed'}, "invalid pattern"),
+        ({'name': 'temp', 'pattern': 'Temperature: ([0-9.]+)'}, "value"),
+    ])
+    def test_invalid(self, entry, message):
+        """Test mistakes in info.json are reported."""
+        with pytest.raises(ValueError, match=message):
+            load_metrics({'metrics': [entry]}, 'SHT31D')
+
+
+class TestMetricsOutput:
+    """Test the MetricsOutput class."""
+
+    def test_latest_values(self):
+        """Test matching lines set their metric to the latest value."""
+        registry = MetricsRegistry()
+        output = MetricsOutput(sht31d_metrics(), registry, 'sign-1', 'SHT31D')
+        output.write(SHT31D_OUTPUT)
+        output.close()
+        
+        text = registry.render()
+        assert '# TYPE temperature_celsius gauge' in text
+        assert 'temperature_celsius{command="SHT31D",device="sign-1"} 21.7' in text
+        assert 'relative_humidity_percent{command="SHT31D",device="sign-1"} 40.2' in text
+        assert '21.5' not in text
+
+    def test_textfile(self, tmp_path):
+        """Test the textfile is written, and rewritten at most once a second."""
+        path = tmp_path / 'sign-1.prom'
+        registry = MetricsRegistry()
+        output = MetricsOutput(sht31d_metrics(), registry, 'sign-1', 'SHT31D', path)
+        with patch('circremote.metrics.time.monotonic', return_value=1000.0):
+            output.write("\r\nTemperature: 21.5°C\r\n")
+            assert '21.5' in path.read_text()
+            output.write("Temperature: 21.6°C\r\n")
+            assert '21.6' not in path.read_text()
+        output.close()
+        
+        assert '21.6' in path.read_text()
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_label_escaping(self):
+        """Test device names are escaped in labels."""
+        registry = MetricsRegistry()
+        output = MetricsOutput(sht31d_metrics(), registry, 'lab "A"', 'SHT31D')
+        output.write("\r\nTemperature: 20°C\r\n")
+        assert 'device="lab \\"A\\""' in registry.render()
+
+
+class TestMetricsServer:
+    """Test the MetricsServer class."""
+
+    def test_serves_metrics(self):
+        """Test metrics are served at /metrics and nothing else is."""
+        registry = MetricsRegistry()
+        output = MetricsOutput(sht31d_metrics(), registry, 'sign-1', 'SHT31D')
+        output.write("\r\nHumidity: 40.2%\r\n")
+        server = MetricsServer(registry, 0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+                assert response.headers['Content-Type'].startswith('text/plain')
+                assert 'relative_humidity_percent{command="SHT31D",device="sign-1"} 40.2' in response.read().decode()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://127.0.0.1:{server.port}/", timeout=5)
+        finally:
+            server.close()
+
+
+class TestWriteTextfile:
+    """Test the write_textfile function."""
+
+    def test_empty_registry(self, tmp_path):
+        """Test an empty registry writes an empty textfile."""
+        path = tmp_path / 'empty.prom'
+        write_textfile(MetricsRegistry(), path)
+        assert path.read_text() == ''
+
+    def test_readable_by_collector(self, tmp_path):
+        """Test the textfile can be read by other users, like the node_exporter's."""
+        path = tmp_path / 'circremote.prom'
+        write_textfile(MetricsRegistry(), path)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+    def test_temporary_file_not_collected(self, tmp_path):
+        """Test the file being written doesn't end in .prom, so the collector never reads it half-written."""
+        path = tmp_path / 'circremote.prom'
+        written = []
+        real_replace = os.replace
+        
+        def replace(source, destination):
+            written.append(os.path.basename(source))
+            real_replace(source, destination)
+        
+        with patch('circremote.metrics.os.replace', replace):
+            write_textfile(MetricsRegistry(), path)
+        
+        assert len(written) == 1 and not written[0].endswith('.prom')
+        assert [entry.name for entry in tmp_path.iterdir()] == ['circremote.prom']
@@ -0,0 +1,225 @@
+"""
+Unit tests for the device output writers.
+"""
+
+import io
+import json
+from unittest.mock import patch
+
+import time
+
+from circremote.output import TextOutput, CoalescingOutput, JSONLinesOutput, PrefixedOutput, make_output
+
+
+class CountingStream(io.StringIO):
+    """A StringIO that counts flushes."""
+
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestTextOutput:
+    """Test the TextOutput class."""
+
+    def test_write(self):
+        """Test text is written as is and flushed."""
+        stream = CountingStream()
+        output = TextOutput(stream)
+        output.write("\r\n21.5 C\r\n")
+        assert stream.getvalue() == "\r\n21.5 C\r\n"
+        assert stream.flushes == 1
+
+
+class SlowStream(CountingStream):
+    """A stream that takes a while to write, like a slow terminal."""
+
+    def write(self, text):
+        time.sleep(0.05)
+        return super().write(text)
+
+
+class TestCoalescingOutput:
+    """Test the CoalescingOutput class."""
+
+    def test_fragments_written_together(self):
+        """Test fragments arriving together are written with one flush."""
+        stream = CountingStream()
+        output = CoalescingOutput(stream, interval=0.5)
+        for n in range(50):
+            output.write(f"{n} ")
+        output.close()
+        
+        assert stream.getvalue() == ''.join(f"{n} " for n in range(50))
+        assert stream.flushes == 1
+
+    def test_interval(self):
+        """Test output is shown after the interval without waiting for more."""
+        stream = CountingStream()
+        output = CoalescingOutput(stream, interval=0.01)
+        output.write("21.5 C\r\n")
+        
+        deadline = time.monotonic() + 2
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.getvalue() == "21.5 C\r\n"
+        output.close()
+
+    def test_max_lines(self):
+        """Test enough lines are written without waiting for the interval."""
+        stream = CountingStream()
+        output = CoalescingOutput(stream, interval=60, max_lines=10)
+        output.write("line\r\n" * 10)
+        
+        deadline = time.monotonic() + 2
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.getvalue() == "line\r\n" * 10
+        output.close()
+
+    def test_slow_stream_does_not_block_writes(self):
+        """Test writing doesn't wait for a slow terminal."""
+        stream = SlowStream()
+        output = CoalescingOutput(stream, interval=0.001, max_lines=1)
+        start_time = time.monotonic()
+        for n in range(100):
+            output.write(f"{n}\n")
+        assert time.monotonic() - start_time < 0.5
+        
+        output.close()
+        assert stream.getvalue() == ''.join(f"{n}\n" for n in range(100))
+
+    def test_close_twice(self):
+        """Test closing again does nothing."""
+        stream = CountingStream()
+        output = CoalescingOutput(stream)
+        output.write("done")
+        output.close()
+        output.close()
+        assert stream.getvalue() == "done"
+
+
+class TestJSONLinesOutput:
+    """Test the JSONLinesOutput class."""
+
+    def test_records(self):
+        """Test one record per line with device, command and sequence number."""
+        stream = io.StringIO()
+        output = JSONLinesOutput('sign-1', 'BME280', stream)
+        with patch('circremote.output.time.time', return_value=1754900000.5):
+            output.write("\r\nTemperature: 21.5 °C\r\nHumidity: 40%\r\n")
+            output.close()
+        
+        assert records(stream) == [
+            {'time': 1754900000.5, 'device': 'sign-1', 'command': 'BME280', 'seq': 0,
+             'line': 'Temperature: 21.5 °C'},
+            {'time': 1754900000.5, 'device': 'sign-1', 'command': 'BME280', 'seq': 1,
+             'line': 'Humidity: 40%'},
+        ]
+
+    def test_lines_split_across_writes(self):
+        """Test a line split across writes becomes one record."""
+        stream = io.StringIO()
+        output = JSONLinesOutput('sign-1', 'BME280', stream)
+        for chunk in ["\r\nTemp", "erature: 21", ".5\r", "\nok\r\n"]:
+            output.write(chunk)
+        output.close()
+        
+        assert [record['line'] for record in records(stream)] == ['Temperature: 21.5', 'ok']
+        assert [record['seq'] for record in records(stream)] == [0, 1]
+
+    def test_close_writes_last_line(self):
+        """Test output without a final newline is written on close."""
+        stream = io.StringIO()
+        output = JSONLinesOutput('sign-1', 'ls', stream)
+        output.write("\r\nboot_out.txt\r\ncode.py")
+        assert [record['line'] for record in records(stream)] == ['boot_out.txt']
+        
+        output.close()
+        assert [record['line'] for record in records(stream)] == ['boot_out.txt', 'code.py']
+        
+        output.close()
+        assert [record['line'] for record in records(stream)] == ['boot_out.txt', 'code.py']
+
+    def test_blank_lines_kept(self):
+        """Test blank lines the device printed still get records."""
+        stream = io.StringIO()
+        output = JSONLinesOutput('sign-1', 'BME280', stream)
+        output.write("\r\none\r\n\r\ntwo\r\n")
+        output.close()
+        
+        assert [record['line'] for record in records(stream)] == ['one', '', 'two']
+
+    def test_buffered(self):
+        """Test records aren't flushed until close."""
+        stream = CountingStream()
+        output = JSONLinesOutput('sign-1', 'BME280', stream)
+        for n in range(100):
+            output.write(f"\r\n{n}")
+        assert stream.flushes == 0
+        
+        output.close()
+        assert stream.flushes == 1
+        assert len(records(stream)) == 100
+
+
+class TestPrefixedOutput:
+    """Test the PrefixedOutput class."""
+
+    def test_prefixes_whole_lines(self):
+        """Test lines from two devices sharing an output stay whole and prefixed."""
+        stream = io.StringIO()
+        shared = TextOutput(stream)
+        first = PrefixedOutput(shared, "a | ")
+        second = PrefixedOutput(shared, "b | ")
+        
+        first.write("\r\nTempera")
+        second.write("\r\nready\r\n")
+        first.write("ture: 21.5\r\nlast")
+        first.close()
+        
+        assert stream.getvalue() == "b | ready\r\na | Temperature: 21.5\r\na | last\r\n"
+
+
+class TestMakeOutput:
+    """Test the make_output function."""
+
+    def test_formats(self):
+        """Test each --format choice gets its writer."""
+        output = make_output('text', 'sign-1', 'BME280')
+        assert isinstance(output, CoalescingOutput)
+        output.close()
+        assert isinstance(make_output('text', 'sign-1', 'BME280', unbuffered=True), TextOutput)
+        assert isinstance(make_output('jsonl', 'sign-1', 'BME280'), JSONLinesOutput)
+
+
+class TestWriteFrame:
+    """Test writing frames to each output."""
+
+    def test_text(self):
+        """Test frames shown as a line of text."""
+        from circremote.frames import Frame
+        stream = io.StringIO()
+        TextOutput(stream).write_frame(Frame(0, 'h', (1, 2)))
+        assert stream.getvalue() == "frame 0 (2 x h): 1 2\r\n"
+
+    def test_jsonl(self):
+        """Test frames written as records with their values, sharing the line sequence numbers."""
+        from circremote.frames import Frame
+        stream = io.StringIO()
+        output = JSONLinesOutput('sign-1', 'MLX90640', stream)
+        output.write("\r\nready\r\n")
+        output.write_frame(Frame(1, 'f', (20.5, 21.0)))
+        output.close()
+        
+        frame = records(stream)[1]
+        assert frame['seq'] == 1
+        assert (frame['channel'], frame['typecode'], frame['values']) == (1, 'f', [20.5, 21.0])
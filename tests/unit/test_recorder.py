@@ -0,0 +1,131 @@
+"""
+Unit tests for the SQLite readings recorder.
+"""
+
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from circremote.recorder import Recorder, parse_reading
+
+
+SCD40_OUTPUT = (
+    "\r\nSCD40 CO2 Sensor\r\n"
+    "=========================\r\n"
+    "Started periodic measurements...\r\n"
+    "\r\n"
+    "CO2: 412 ppm\r\n"
+    "Temperature: 22.4°C\r\n"
+    "Humidity: 41.3%\r\n"
+    "-------------------------\r\n"
+)
+
+
+def rows(path):
+    db = sqlite3.connect(str(path))
+    try:
+        return db.execute('SELECT device, command, name, value, unit FROM readings ORDER BY rowid').fetchall()
+    finally:
+        db.close()
+
+
+class TestParseReading:
+    """Test the parse_reading function."""
+
+    @pytest.mark.parametrize("line,expected", [
+        ("CO2: 412 ppm", ("CO2", 412.0, "ppm")),
+        ("Temperature: 22.4°C", ("Temperature", 22.4, "°C")),
+        ("Humidity: 41.3%", ("Humidity", 41.3, "%")),
+        ("  PM2.5: 3.20", ("PM2.5", 3.2, None)),
+        ("Altitude: -12.5 m", ("Altitude", -12.5, "m")),
+        ("Mass Concentration PM1.0: 1.5e1 ug/m3", ("Mass Concentration PM1.0", 15.0, "ug/m3")),
+    ])
+    def test_readings(self, line, expected):
+        """Test lines with a name and a number are readings."""
+        assert parse_reading(line) == expected
+
+    @pytest.mark.parametrize("line", [
+        "SCD40 CO2 Sensor",
+        "-------------------------",
+        "Started periodic measurements...",
+        "Current Mode: normal",
+        "Error reading sensor data: [Errno 19] No such device",
+        "",
+    ])
+    def test_not_readings(self, line):
+        """Test other lines are skipped."""
+        assert parse_reading(line) is None
+
+
+class TestRecorder:
+    """Test the Recorder class."""
+
+    def test_records_readings(self, tmp_path):
+        """Test readings are written as rows and other lines skipped."""
+        path = tmp_path / 'bench.db'
+        recorder = Recorder(path, 'sign-1', 'SCD40')
+        recorder.write(SCD40_OUTPUT)
+        recorder.close()
+        
+        assert rows(path) == [
+            ('sign-1', 'SCD40', 'CO2', 412.0, 'ppm'),
+            ('sign-1', 'SCD40', 'Temperature', 22.4, '°C'),
+            ('sign-1', 'SCD40', 'Humidity', 41.3, '%'),
+        ]
+
+    def test_wal_mode(self, tmp_path):
+        """Test the database uses write-ahead logging."""
+        path = tmp_path / 'bench.db'
+        recorder = Recorder(path, 'sign-1', 'SCD40')
+        assert recorder.db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        recorder.close()
+
+    def test_batched(self, tmp_path):
+        """Test rows wait for the flush interval and are written together."""
+        path = tmp_path / 'bench.db'
+        with patch('circremote.recorder.time.monotonic', return_value=100.0):
+            recorder = Recorder(path, 'sign-1', 'SCD40', flush_interval=5.0)
+            recorder.write(SCD40_OUTPUT)
+        assert rows(path) == []
+        
+        with patch('circremote.recorder.time.monotonic', return_value=105.0):
+            recorder.write("CO2: 415 ppm\r\n")
+        assert len(rows(path)) == 4
+        recorder.close()
+
+    def test_batch_size(self, tmp_path):
+        """Test a full batch is written before the flush interval is up."""
+        path = tmp_path / 'bench.db'
+        recorder = Recorder(path, 'sign-1', 'SCD40', flush_interval=3600, batch_size=2)
+        recorder.write(SCD40_OUTPUT)
+        assert len(rows(path)) == 2
+        recorder.close()
+        assert len(rows(path)) == 3
+
+    def test_one_commit_per_batch(self, tmp_path):
+        """Test a batch is written in a single transaction."""
+        path = tmp_path / 'bench.db'
+        recorder = Recorder(path, 'sign-1', 'SCD40', flush_interval=3600)
+        recorder.write(SCD40_OUTPUT * 50)
+        
+        changes = recorder.db.total_changes
+        recorder.flush()
+        assert recorder.db.total_changes - changes == 150
+        assert recorder.rows == []
+        recorder.close()
+
+    def test_shared_database(self, tmp_path):
+        """Test several devices can record to the same file."""
+        path = tmp_path / 'bench.db'
+        first = Recorder(path, 'sign-1', 'SCD40')
+        second = Recorder(path, 'sign-2', 'BME280')
+        first.write("\r\nCO2: 412 ppm\r\n")
+        second.write("\r\nPressure: 1013.2 hPa\r\n")
+        first.close()
+        second.close()
+        
+        assert sorted(rows(path)) == [
+            ('sign-1', 'SCD40', 'CO2', 412.0, 'ppm'),
+            ('sign-2', 'BME280', 'Pressure', 1013.2, 'hPa'),
+        ]
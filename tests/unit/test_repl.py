@@ -0,0 +1,152 @@
+"""
+Unit tests for the RawREPL protocol engine.
+"""
+
+import time
+import pytest
+from unittest.mock import Mock
+
+from circremote.repl import RawREPL, FRIENDLY_PROMPT, RAW_REPL_BANNER, RAW_REPL_OK
+from tests.fakeboard import FakeBoard, FakeConnection
+
+
+def fake_board(**kwargs):
+    """Return a connection to a FakeBoard that is already in raw REPL mode."""
+    return FakeConnection(FakeBoard(mode='raw', **kwargs))
+
+
+def make_connection(responses):
+    """Return a mock connection whose read_until answers from a dict of responses."""
+    connection = Mock()
+    connection.read_until.side_effect = lambda expected, timeout: responses.get(expected, b'')
+    return connection
+
+
+class TestRawREPL:
+    """Test the RawREPL class."""
+
+    def test_interrupt_waits_for_prompt(self):
+        """Test interrupt sends Ctrl+C three times and waits for the friendly prompt."""
+        connection = make_connection({FRIENDLY_PROMPT: b'KeyboardInterrupt\r\n>>> '})
+        repl = RawREPL(connection)
+        
+        assert repl.interrupt() is True
+        connection.write.assert_called_once_with('\x03\x03\x03')
+        connection.read_until.assert_called_once_with(FRIENDLY_PROMPT, 0.5)
+
+    def test_enter_waits_for_banner(self):
+        """Test enter sends Ctrl+A and waits for the raw REPL banner."""
+        connection = make_connection({RAW_REPL_BANNER: b'\r\n' + RAW_REPL_BANNER})
+        repl = RawREPL(connection)
+        
+        assert repl.enter() is True
+        connection.write.assert_called_once_with('\x01')
+
+    def test_enter_banner_missing(self):
+        """Test enter reports failure when the banner never arrives."""
+        connection = make_connection({})
+        repl = RawREPL(connection, timeout=0.01)
+        
+        assert repl.enter() is False
+        connection.read_until.assert_called_once_with(RAW_REPL_BANNER, 0.01)
+
+    def test_execute_waits_for_ok(self):
+        """Test execute sends Ctrl+D and waits for OK."""
+        connection = make_connection({RAW_REPL_OK: b'OK'})
+        repl = RawREPL(connection)
+        
+        assert repl.execute() is True
+        connection.write.assert_called_once_with('\x04')
+
+    def test_exit_sends_ctrl_b(self):
+        """Test exit sends Ctrl+B."""
+        connection = Mock()
+        repl = RawREPL(connection)
+        repl.exit()
+        
+        connection.write.assert_called_once_with('\x02')
+
+    def test_handshake_does_not_sleep(self):
+        """Test a responsive board completes the handshake without fixed delays."""
+        connection = make_connection({
+            FRIENDLY_PROMPT: FRIENDLY_PROMPT,
+            RAW_REPL_BANNER: RAW_REPL_BANNER,
+            RAW_REPL_OK: RAW_REPL_OK,
+        })
+        repl = RawREPL(connection)
+        
+        start_time = time.monotonic()
+        repl.interrupt()
+        repl.enter()
+        repl.execute()
+        repl.exit()
+        
+        assert time.monotonic() - start_time < 0.1
+
+    def test_run_code_raw_paste(self):
+        """Test code is uploaded with raw-paste flow control when supported."""
+        connection = fake_board(window_size=32)
+        repl = RawREPL(connection)
+        code = "print('hello')\r\n" * 20
+        
+        assert repl.run_code(code) is True
+        assert bytes(connection.board.received) == code.encode('utf-8')
+        assert connection.written[0] == b'\x05A\x01'
+        assert connection.written[-1] == b'\x04'
+
+    def test_run_code_raw_paste_unsupported(self):
+        """Test upload falls back to plain raw REPL when raw-paste is unsupported."""
+        connection = fake_board(raw_paste=False)
+        repl = RawREPL(connection)
+        code = "print('hello')\r\n"
+        
+        assert repl.run_code(code) is False
+        assert bytes(connection.board.received) == code.encode('utf-8')
+        assert connection.written[-1] == b'\x04'
+
+    def test_run_code_without_raw_paste(self):
+        """Test raw-paste is not attempted when the caller knows it is unsupported."""
+        connection = fake_board()
+        repl = RawREPL(connection)
+        
+        assert repl.run_code("print(1)\r\n", raw_paste=False) is False
+        assert b'\x05A\x01' not in connection.written
+
+    def test_raw_paste_multibyte_characters(self):
+        """Test multi-byte characters survive being split across raw-paste windows."""
+        connection = fake_board(window_size=7)
+        repl = RawREPL(connection)
+        code = "print('°C μg/m³')\r\n" * 4
+        
+        repl.run_code(code)
+        assert bytes(connection.board.received) == code.encode('utf-8')
+
+    def test_raw_paste_stalled_board(self):
+        """Test raw-paste upload fails when the board stops granting windows."""
+        connection = fake_board(window_size=8)
+        connection.write = Mock(side_effect=lambda data: connection.rx.extend(b'R\x01\x08\x00') if data == '\x05A\x01' else None)
+        repl = RawREPL(connection, flow_timeout=0.01)
+        
+        with pytest.raises(RuntimeError, match="Timed out"):
+            repl.run_code("x = 1\r\n" * 10)
+
+    def test_raw_paste_no_answer_not_refused(self):
+        """Test a board that doesn't answer the raw-paste request in time isn't marked as lacking it."""
+        connection = fake_board()
+        connection.write = Mock()
+        connection.read_bytes = Mock(return_value=b'')
+        repl = RawREPL(connection, flow_timeout=0.01)
+        
+        assert repl.paste("x = 1\r\n") is False
+        assert repl.raw_paste_refused is False
+        connection.read_bytes.assert_called_once_with(2, 0.01)
+
+    def test_raw_paste_banner_echo_refused(self):
+        """Test older firmware that echoes the raw REPL banner is marked as lacking raw-paste."""
+        connection = fake_board()
+        connection.write = Mock(side_effect=lambda data: connection.rx.extend(RAW_REPL_BANNER))
+        repl = RawREPL(connection)
+        
+        assert repl.paste("x = 1\r\n") is False
+        assert repl.raw_paste_refused is True
+        assert connection.rx == b''
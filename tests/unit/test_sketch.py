@@ -0,0 +1,86 @@
+"""
+Unit tests for the quantile sketch.
+"""
+
+import random
+
+import pytest
+
+from circremote.sketch import QuantileSketch
+
+
+def exact_quantile(values, fraction):
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+class TestQuantileSketch:
+    """Test the QuantileSketch class."""
+
+    @pytest.mark.parametrize("fraction", [0.0, 0.1, 0.5, 0.9, 0.99, 1.0])
+    def test_relative_accuracy(self, fraction):
+        """Test quantiles are within the relative accuracy."""
+        rng = random.Random(1)
+        values = [rng.lognormvariate(3, 1) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        
+        assert sketch.quantile(fraction) == pytest.approx(exact_quantile(values, fraction), rel=0.011)
+
+    def test_negative_and_zero(self):
+        """Test readings below zero and at zero, like outdoor temperatures."""
+        sketch = QuantileSketch()
+        for value in [-20.0, -10.0, 0.0, 10.0, 20.0]:
+            sketch.add(value)
+        assert sketch.quantile(0.0) == -20.0
+        assert sketch.quantile(0.25) == pytest.approx(-10.0, rel=0.01)
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(1.0) == 20.0
+
+    def test_summary(self):
+        """Test count, min, max and mean are exact."""
+        sketch = QuantileSketch()
+        for value in [21.5, 22.0, 22.5]:
+            sketch.add(value)
+        assert (sketch.count, sketch.min, sketch.max) == (3, 21.5, 22.5)
+        assert sketch.mean == pytest.approx(22.0)
+
+    def test_constant_memory(self):
+        """Test the number of bins doesn't grow with the number of values."""
+        sketch = QuantileSketch()
+        for n in range(100000):
+            sketch.add(20.0 + (n % 1000) / 100)
+        assert len(sketch.positive) < 100
+
+    def test_max_bins(self):
+        """Test a very wide range is kept to max_bins."""
+        sketch = QuantileSketch(max_bins=10)
+        for exponent in range(-5, 30):
+            sketch.add(10.0 ** exponent)
+        assert len(sketch.positive) <= 10
+        assert sketch.quantile(0.9) == pytest.approx(1e25, rel=0.01)
+        assert sketch.quantile(1.0) == 1e29
+
+    def test_merge(self):
+        """Test a merged sketch matches one that saw every value."""
+        rng = random.Random(2)
+        values = [rng.uniform(-5, 40) for _ in range(5000)]
+        whole, first, second = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for value in values:
+            whole.add(value)
+        for value in values[:2000]:
+            first.add(value)
+        for value in values[2000:]:
+            second.add(value)
+        first.merge(second)
+        
+        assert first.count == whole.count
+        assert first.quantile(0.9) == whole.quantile(0.9)
+        assert (first.min, first.max) == (whole.min, whole.max)
+
+    def test_empty(self):
+        """Test an empty sketch."""
+        sketch = QuantileSketch()
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.mean == 0.0
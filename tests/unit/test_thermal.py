@@ -0,0 +1,164 @@
+"""
+Unit tests for thermal camera frames.
+"""
+
+import ast
+import struct
+
+import pytest
+
+from circremote.frames import Frame
+from circremote.thermal import FrameRate, NpyWriter, ThermalOutput, frame_celsius, render_frame, ROWS, COLUMNS
+from tests.fakeboard import Collector
+
+
+FRAME = Frame(0, 'f', tuple(20.0 + (n % COLUMNS) * 0.5 for n in range(ROWS * COLUMNS)))
+
+
+def read_npy(path):
+    """Read a float32 .npy file without NumPy, returning its shape and values."""
+    data = path.read_bytes()
+    assert data[:8] == b'\x93NUMPY\x01\x00'
+    header_length, = struct.unpack_from('<H', data, 8)
+    header = ast.literal_eval(data[10:10 + header_length].decode('latin1'))
+    assert (10 + header_length) % 64 == 0
+    count = 1
+    for size in header['shape']:
+        count *= size
+    values = struct.unpack_from(f"{header['descr'][0]}{count}f", data, 10 + header_length)
+    return header['shape'], values
+
+
+class TestRenderFrame:
+    """Test the render_frame function."""
+
+    def test_size(self):
+        """Test two pixel rows per line, two characters per pixel."""
+        image = render_frame(FRAME.values)
+        lines = image.split('\r\n')[:-1]
+        assert len(lines) == ROWS // 2
+        assert all(line.count('▀') == COLUMNS * 2 for line in lines)
+
+    def test_scaled_to_range(self):
+        """Test the coldest pixel gets the coldest colour and the hottest the hottest."""
+        image = render_frame([0.0, 100.0, 0.0, 100.0], columns=2)
+        assert image.startswith('\x1b[38;5;16;48;5;16m▀▀\x1b[38;5;231;48;5;231m▀▀')
+
+    def test_flat_frame(self):
+        """Test a frame that's the same temperature everywhere."""
+        assert '▀' in render_frame([21.0] * 4, columns=2)
+
+
+class TestFrameRate:
+    """Test the FrameRate class."""
+
+    def test_rates(self):
+        """Test recent and average frames per second."""
+        rate = FrameRate(window=3)
+        for when in (0.0, 1.0, 2.0, 2.25, 2.5):
+            rate.add(when)
+        assert rate.current() == 4.0
+        assert rate.average() == 1.6
+        assert rate.count == 5
+
+    def test_too_few_frames(self):
+        """Test rates are 0 before two frames."""
+        rate = FrameRate()
+        assert rate.current() == 0.0
+        rate.add(1.0)
+        assert rate.average() == 0.0
+
+
+class TestNpyWriter:
+    """Test the NpyWriter class."""
+
+    def test_write(self, tmp_path):
+        """Test frames are saved as one array with the count filled in on close."""
+        path = tmp_path / 'frames.npy'
+        writer = NpyWriter(path)
+        writer.write(FRAME.values)
+        writer.write(FRAME.values)
+        writer.close()
+        
+        shape, values = read_npy(path)
+        assert shape == (2, ROWS, COLUMNS)
+        assert values == FRAME.values * 2
+
+    def test_wrong_size(self, tmp_path):
+        """Test frames of another size are refused."""
+        writer = NpyWriter(tmp_path / 'frames.npy')
+        with pytest.raises(ValueError):
+            writer.write((1.0, 2.0))
+        writer.close()
+
+    def test_numpy_load(self, tmp_path):
+        """Test NumPy reads the file."""
+        numpy = pytest.importorskip('numpy')
+        path = tmp_path / 'frames.npy'
+        writer = NpyWriter(path)
+        writer.write(FRAME.values)
+        writer.close()
+        
+        frames = numpy.load(path)
+        assert frames.shape == (1, ROWS, COLUMNS)
+        assert frames[0, 0, 1] == 20.5
+
+
+class TestFrameCelsius:
+    """Test the frame_celsius function."""
+
+    def test_float_frame(self):
+        """Test frames of floats are already in °C."""
+        assert frame_celsius(FRAME) == FRAME.values
+
+    def test_centidegree_frame(self):
+        """Test 16-bit frames are in hundredths of a degree."""
+        frame = Frame(0, 'h', (2150, -425, 0))
+        assert frame_celsius(frame) == [21.5, -4.25, 0.0]
+
+
+class TestThermalOutput:
+    """Test the ThermalOutput class."""
+
+    def test_redraw_in_place(self):
+        """Test each frame after the first moves up over the last one."""
+        output = Collector()
+        thermal = ThermalOutput(output)
+        thermal.write("\r\nStreaming thermal frames...\r\n")
+        thermal.write_frame(FRAME)
+        assert '\x1b[13A' not in output.text
+        thermal.write_frame(FRAME)
+        assert output.text.count('\x1b[13A') == 1
+        assert 'frames/s' in output.text
+        assert thermal.rate.count == 2
+
+    def test_text_between_frames(self):
+        """Test text printed between frames isn't drawn over."""
+        output = Collector()
+        thermal = ThermalOutput(output)
+        thermal.write_frame(FRAME)
+        thermal.write("sensor warm\r\n")
+        thermal.write_frame(FRAME)
+        assert '\x1b[13A' not in output.text
+
+    def test_npy_only(self, tmp_path):
+        """Test frames are saved without being shown."""
+        output = Collector()
+        path = tmp_path / 'frames.npy'
+        thermal = ThermalOutput(output, view=False, npy_path=path)
+        thermal.write_frame(FRAME)
+        thermal.close()
+        
+        assert output.text == ''
+        assert output.closed
+        assert read_npy(path)[0] == (1, ROWS, COLUMNS)
+
+    def test_centidegree_frames_saved_in_celsius(self, tmp_path):
+        """Test the 16-bit frames the MLX90640 command streams are saved as °C."""
+        path = tmp_path / 'frames.npy'
+        thermal = ThermalOutput(Collector(), view=False, npy_path=path)
+        thermal.write_frame(Frame(0, 'h', tuple(round(value * 100) for value in FRAME.values)))
+        thermal.close()
+        
+        shape, values = read_npy(path)
+        assert values[1] == 20.5
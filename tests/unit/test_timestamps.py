@@ -0,0 +1,113 @@
+"""
+Unit tests for device timestamps and latency estimates.
+"""
+
+import io
+import contextlib
+from unittest.mock import patch
+
+import pytest
+
+from circremote.timestamps import TimestampDemux, add_device_helper, estimate_clock, percentile
+from tests.fakeboard import Collector
+
+
+class TestDeviceHelper:
+    """Test the device-side print() replacement."""
+
+    def test_prefix(self):
+        """Test each print starts with the device time in nanoseconds."""
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            with patch('time.monotonic_ns', side_effect=[1000, 2000]):
+                exec(add_device_helper("print('a', 1)\nprint('b')\n"), {})
+        assert printed.getvalue() == "@1000 a 1\n@2000 b\n"
+
+    def test_only_at_line_start(self):
+        """Test prints that carry on a line aren't stamped again."""
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            with patch('time.monotonic_ns', side_effect=[1000, 2000]):
+                exec(add_device_helper("print('a', end='')\nprint('b')\nprint('c')\n"), {})
+        assert printed.getvalue() == "@1000 ab\n@2000 c\n"
+
+
+class TestTimestampDemux:
+    """Test the TimestampDemux class."""
+
+    STREAM = "\r\n@1000000000 Temperature: 21.5\r\n@1500000000 Humidity: 40\r\nno stamp @5 \r\n"
+
+    def demux(self, chunks):
+        output = Collector()
+        demux = TimestampDemux(output)
+        for chunk in chunks:
+            demux.write(chunk)
+        demux.close()
+        return output, demux
+
+    def test_strips_timestamps(self):
+        """Test timestamps are taken off and kept with the receive time."""
+        output, demux = self.demux([self.STREAM])
+        assert output.text == "\r\nTemperature: 21.5\r\nHumidity: 40\r\nno stamp @5 \r\n"
+        assert list(demux.device_times) == [1.0, 1.5]
+        assert len(demux.host_times) == 2
+
+    @pytest.mark.parametrize("split", range(1, 50))
+    def test_split_anywhere(self, split):
+        """Test timestamps split across writes."""
+        output, demux = self.demux([self.STREAM[:split], self.STREAM[split:]])
+        assert output.text == "\r\nTemperature: 21.5\r\nHumidity: 40\r\nno stamp @5 \r\n"
+        assert list(demux.device_times) == [1.0, 1.5]
+
+    def test_at_sign_that_is_not_a_timestamp(self):
+        """Test a line starting with @ but no timestamp is passed on."""
+        output, demux = self.demux(["\r\n@home: 5\r\n@12"])
+        assert output.text == "\r\n@home: 5\r\n@12"
+        assert len(demux.device_times) == 0
+
+    def test_report(self):
+        """Test the report gives drift and latency percentiles."""
+        output = Collector()
+        demux = TimestampDemux(output)
+        with patch('circremote.timestamps.time.monotonic', side_effect=[100.0, 100.6, 101.0]):
+            demux.write("\r\n@1000000000 a\r\n")
+            demux.write("@1500000000 b\r\n")
+            demux.write("@2000000000 c\r\n")
+        
+        report = demux.report()
+        assert len(report) == 2
+        assert "ppm" in report[0]
+        assert "p50" in report[1] and "3 lines" in report[1]
+
+    def test_report_needs_lines(self):
+        """Test no report without enough timestamped lines."""
+        assert TimestampDemux(Collector()).report() == []
+
+
+class TestEstimateClock:
+    """Test the estimate_clock function."""
+
+    def test_drift_and_latency(self):
+        """Test a drifting clock with varying delays is recovered."""
+        drift = 50e-6
+        delays = [0.002, 0.010, 0.002, 0.030, 0.004, 0.002, 0.008, 0.002]
+        samples = [(device, 500.0 + device * (1 + drift) + delay)
+                   for device, delay in zip(range(0, 800, 100), delays)]
+        
+        offset, estimated_drift, latencies = estimate_clock(samples)
+        assert estimated_drift == pytest.approx(drift, abs=1e-9)
+        assert latencies == pytest.approx([delay - 0.002 for delay in delays], abs=1e-6)
+        assert min(latencies) == pytest.approx(0.0, abs=1e-9)
+
+    def test_few_samples(self):
+        """Test too few samples for drift still give latencies."""
+        offset, drift, latencies = estimate_clock([(0.0, 10.0), (1.0, 11.5)])
+        assert drift == 0.0
+        assert latencies == pytest.approx([0.0, 0.5])
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        ordered = [float(n) for n in range(1, 101)]
+        assert percentile(ordered, 0.5) == 50.0
+        assert percentile(ordered, 0.99) == 99.0
+        assert percentile([], 0.5) == 0.0
@@ -0,0 +1,263 @@
+"""
+Unit tests for verified chunked uploads.
+"""
+
+import io
+import binascii
+import pytest
+from unittest.mock import Mock, patch
+
+from circremote.cache import DeviceCache
+from circremote.upload import (
+    VerifiedUpload, RECEIVER_STUB, RAW_PASTE_MAX_AGE, ZLIB_PROBE, ZLIB_MAX_AGE,
+    build_payload, compress_payload, send_program
+)
+from circremote.frames import DEVICE_HELPER as FRAME_HELPER
+from circremote.timestamps import DEVICE_HELPER as TIMESTAMP_HELPER
+
+
+class FakeReceiver:
+    """Stand-in for a board running the receiver stub."""
+
+    def __init__(self, damaged=()):
+        self.damaged = set(damaged)
+        self.chunks = []
+        self.lines = []
+        self.rx = bytearray()
+
+    def write(self, data):
+        line = data.strip()
+        self.lines.append(line)
+        if line == 'E':
+            return
+        index, crc, encoded = line.split(' ')
+        index = int(index)
+        chunk = binascii.a2b_base64(encoded)
+        if index in self.damaged:
+            self.damaged.discard(index)
+            chunk = b'X' + chunk[1:]
+        if binascii.crc32(chunk) & 0xffffffff == int(crc):
+            if index == len(self.chunks):
+                self.chunks.append(chunk)
+            self.rx += f"A{index}\r\n".encode()
+        else:
+            self.rx += f"N{index}\r\n".encode()
+
+    def flush(self):
+        pass
+
+    def read_until(self, expected, timeout):
+        end = self.rx.find(expected)
+        end = end + len(expected) if end >= 0 else len(self.rx)
+        data = bytes(self.rx[:end])
+        del self.rx[:end]
+        return data
+
+
+class StubREPL:
+    """Stand-in for a RawREPL that records the code it is asked to run."""
+
+    def __init__(self, used_raw_paste=True, refused=False):
+        self.used_raw_paste = used_raw_paste
+        self.raw_paste_refused = refused
+        self.connection = None
+        self.flow_timeout = 5.0
+        self.run_code = Mock()
+        self.debug = Mock()
+
+    def run_code_steps(self, code, raw_paste=True):
+        self.run_code(code, raw_paste=raw_paste)
+        return self.used_raw_paste
+        yield
+
+
+class TestBuildPayload:
+    """Test the build_payload function."""
+
+    def test_wrapped_in_markers(self):
+        """Test code is wrapped in the marker statements with CRLF line endings."""
+        assert build_payload("print('hi')\n") == "print('***START***')\r\nprint('hi')\r\nprint('***END***')\r\n"
+
+    def test_end_marker_on_its_own_line(self):
+        """Test code without a final newline doesn't run into the end marker."""
+        assert build_payload("print('hi')") == "print('***START***')\r\nprint('hi')\r\nprint('***END***')\r\n"
+
+    def test_helpers_only_when_needed(self):
+        """Test the send_frame() helper is only added to code that calls it, and timestamps only when asked."""
+        assert FRAME_HELPER.replace('\n', '\r\n') not in build_payload("print('hi')\n")
+        assert FRAME_HELPER.replace('\n', '\r\n') in build_payload("send_frame([1.0])\n")
+        assert TIMESTAMP_HELPER.replace('\n', '\r\n') in build_payload("print('hi')\n", timestamps=True)
+
+
+class TestVerifiedUpload:
+    """Test the VerifiedUpload class."""
+
+    def test_stub_is_valid_python(self):
+        """Test the receiver stub compiles."""
+        compile(RECEIVER_STUB, 'stub', 'exec')
+
+    def test_stub_receives_and_runs_code(self, capsys):
+        """Test the receiver stub acknowledges chunks and runs the result."""
+        chunks = [b"print('hel", b"lo')\n"]
+        lines = ["0 0 garbage\r\n", "\r\n"]
+        for index, chunk in enumerate(chunks):
+            lines.append(f"{index} {binascii.crc32(chunk)} {binascii.b2a_base64(chunk, newline=False).decode()}\r\n")
+        lines.append("E\r\n")
+        
+        with patch('sys.stdin', io.StringIO(''.join(lines))):
+            exec(RECEIVER_STUB, {})
+        
+        assert capsys.readouterr().out.split() == ['N0', 'A0', 'A1', 'hello']
+
+    def test_upload_reassembles_code(self):
+        """Test code arrives intact in numbered chunks."""
+        board = FakeReceiver()
+        repl = StubREPL(used_raw_paste=True)
+        code = "print('***START***')\r\n" + "x = 1\r\n" * 100
+        
+        uploader = VerifiedUpload(board, repl, chunk_size=64)
+        assert uploader.run_code(code) is True
+        
+        repl.run_code.assert_called_once()
+        assert b''.join(board.chunks) == code.encode('utf-8')
+        assert board.lines[-1] == 'E'
+        assert uploader.retransmissions == 0
+
+    def test_only_damaged_chunk_is_resent(self):
+        """Test a damaged chunk is retransmitted on its own."""
+        board = FakeReceiver(damaged=[2])
+        code = "y = 2\r\n" * 50
+        
+        uploader = VerifiedUpload(board, StubREPL(), chunk_size=32)
+        uploader.run_code(code)
+        
+        assert b''.join(board.chunks) == code.encode('utf-8')
+        assert uploader.retransmissions == 1
+        assert [line.split(' ')[0] for line in board.lines[:-1]].count('2') == 2
+
+    def test_gives_up_after_retries(self):
+        """Test upload fails when a chunk is never acknowledged."""
+        board = Mock()
+        board.read_until.return_value = b''
+        
+        uploader = VerifiedUpload(board, StubREPL(), retries=2, timeout=0.01)
+        with pytest.raises(RuntimeError, match="did not accept chunk 0 after 3 attempts"):
+            uploader.run_code("z = 3\r\n")
+
+
+class TestSendProgram:
+    """Test send_program()."""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return DeviceCache(path=tmp_path / 'cache.json')
+
+    def make_repl(self, used_raw_paste, refused):
+        return StubREPL(used_raw_paste, refused)
+
+    def test_caches_refusal(self, cache):
+        """Test a board that refuses raw-paste is remembered as lacking it."""
+        send_program(Mock(), self.make_repl(False, True), "x = 1\r\n", {'name': 'test'}, cache)
+        assert cache.get('test', 'raw_paste') is False
+
+    def test_slow_answer_not_cached(self, cache):
+        """Test a board that didn't answer in time is asked again next run."""
+        send_program(Mock(), self.make_repl(False, False), "x = 1\r\n", {'name': 'test'}, cache)
+        assert cache.get('test', 'raw_paste') is None
+
+    def test_refusal_expires(self, cache):
+        """Test raw-paste is tried again once the cached refusal is old."""
+        cache.set('test', 'raw_paste', False)
+        repl = self.make_repl(True, False)
+        
+        send_program(Mock(), repl, "x = 1\r\n", {'name': 'test'}, cache)
+        repl.run_code.assert_called_once_with("x = 1\r\n", raw_paste=False)
+        
+        cache.load()['test']['raw_paste']['updated'] -= RAW_PASTE_MAX_AGE + 1
+        send_program(Mock(), repl, "x = 1\r\n", {'name': 'test'}, cache)
+        repl.run_code.assert_called_with("x = 1\r\n", raw_paste=True)
+        assert cache.get('test', 'raw_paste') is True
+
+
+class TestCompressedUpload:
+    """Test compressed uploads."""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return DeviceCache(path=tmp_path / 'cache.json')
+
+    def board(self, answer):
+        connection = Mock()
+        connection.read_until.return_value = answer + b'\r\n\x04\x04>'
+        return connection
+
+    def test_probe_is_valid_python(self, capsys):
+        """Test the zlib probe runs and finds zlib here."""
+        exec(ZLIB_PROBE, {})
+        assert capsys.readouterr().out == 'ZLIB:1\n'
+
+    def test_bootstrap_runs_code(self, capsys):
+        """Test the bootstrap decompresses and runs the original code."""
+        code = "total = 0\r\n" + "# a comment that compresses well\r\n" * 50 + "print('done', total)\r\n"
+        bootstrap = compress_payload(code)
+        assert len(bootstrap) < len(code)
+        exec(bootstrap.replace('\r\n', '\n'), {})
+        assert capsys.readouterr().out == 'done 0\n'
+
+    def test_small_code_not_compressed(self):
+        """Test code that wouldn't get smaller is sent as it is."""
+        assert compress_payload("x = 1\r\n") == "x = 1\r\n"
+
+    def test_compresses_when_supported(self, cache):
+        """Test the board is asked about zlib once and sent the bootstrap."""
+        code = "x = 1\r\n" * 200
+        repl = StubREPL()
+        connection = self.board(b'ZLIB:1')
+        
+        send_program(connection, repl, code, {'name': 'test', 'compress': True}, cache)
+        assert cache.get('test', 'zlib') is True
+        assert repl.run_code.call_count == 2
+        assert repl.run_code.call_args[0][0] == compress_payload(code)
+        
+        repl.run_code.reset_mock()
+        send_program(connection, repl, code, {'name': 'test', 'compress': True}, cache)
+        repl.run_code.assert_called_once()
+        assert connection.read_until.call_count == 1
+
+    def test_without_zlib_sends_code(self, cache):
+        """Test a board without zlib is remembered and sent the code uncompressed."""
+        code = "x = 1\r\n" * 200
+        repl = StubREPL()
+        
+        send_program(self.board(b'ZLIB:0'), repl, code, {'name': 'test', 'compress': True}, cache)
+        assert cache.get('test', 'zlib') is False
+        assert repl.run_code.call_args[0][0] == code
+
+    def test_no_answer_not_cached(self, cache):
+        """Test a board that didn't answer the probe is asked again next run."""
+        code = "x = 1\r\n" * 200
+        repl = StubREPL()
+        connection = Mock()
+        connection.read_until.return_value = b''
+        
+        send_program(connection, repl, code, {'name': 'test', 'compress': True}, cache)
+        assert cache.get('test', 'zlib') is None
+        assert repl.run_code.call_args[0][0] == code
+
+    def test_answer_expires(self, cache):
+        """Test the board is asked again once the cached answer is old."""
+        cache.set('test', 'zlib', False)
+        cache.load()['test']['zlib']['updated'] -= ZLIB_MAX_AGE + 1
+        repl = StubREPL()
+        
+        send_program(self.board(b'ZLIB:1'), repl, "x = 1\r\n" * 200, {'name': 'test', 'compress': True}, cache)
+        assert cache.get('test', 'zlib') is True
+
+    def test_off_by_default(self, cache):
+        """Test code is sent as it is unless compression is asked for."""
+        repl = StubREPL()
+        connection = Mock()
+        
+        send_program(connection, repl, "x = 1\r\n" * 200, {'name': 'test'}, cache)
+        repl.run_code.assert_called_once_with("x = 1\r\n" * 200, raw_paste=True)
+        connection.read_until.assert_not_called()
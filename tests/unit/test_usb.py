@@ -0,0 +1,139 @@
+"""
+Unit tests for finding boards on USB by serial number.
+"""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from circremote.usb import (
+    is_circuitpython, list_boards, port_matches, resolve, resolve_device_info, forget
+)
+
+
+def port(device, serial_number, vid=0x239A, pid=0x8114, interface='CircuitPython CDC control', location='1-1.2:1.0'):
+    return SimpleNamespace(device=device, serial_number=serial_number, vid=vid, pid=pid, interface=interface,
+                           location=location, manufacturer='Adafruit Industries LLC', product='Feather ESP32-S3')
+
+
+PORTS = [
+    port('/dev/ttyACM1', 'DF6254B8D3433A2B', interface='CircuitPython CDC2 control', location='1-1.2:1.2'),
+    port('/dev/ttyACM0', 'DF6254B8D3433A2B'),
+    port('/dev/ttyACM2', 'E6614C311B2F7F29', vid=0x2E8A, pid=0x1000, location='1-1.3:1.0'),
+    port('/dev/ttyUSB0', 'A10KJ3X2', vid=0x0403, pid=0x6001, interface=None, location='1-1.4:1.0'),
+]
+
+
+@pytest.fixture
+def ports():
+    connected = list(PORTS)
+    with patch('circremote.usb.list_ports.comports', side_effect=lambda: list(connected)) as comports:
+        comports.connected = connected
+        yield comports
+
+
+class TestListBoards:
+    """Test finding CircuitPython boards among the serial ports."""
+
+    def test_is_circuitpython(self):
+        """Test boards are recognised by vendor ID or by name, and data ports left out."""
+        assert is_circuitpython(PORTS[1])
+        assert not is_circuitpython(PORTS[0])
+        assert not is_circuitpython(PORTS[3])
+        assert is_circuitpython(port('/dev/ttyACM5', 'X', vid=0x1234, interface='CircuitPython CDC control'))
+
+    def test_shared_vendor_ids(self):
+        """Test MicroPython boards, USB-JTAG bridges and debug probes with Espressif or Raspberry Pi IDs are left out."""
+        def unnamed(vid, pid):
+            return SimpleNamespace(device='/dev/ttyACM5', serial_number='X', vid=vid, pid=pid, interface=None,
+                                   location=None, manufacturer=None, product='Board')
+        
+        assert not is_circuitpython(unnamed(0x303A, 0x1001))
+        assert not is_circuitpython(unnamed(0x303A, 0x4001))
+        assert not is_circuitpython(unnamed(0x2E8A, 0x0005))
+        assert not is_circuitpython(unnamed(0x2E8A, 0x000C))
+        assert is_circuitpython(unnamed(0x303A, 0x7009))
+        assert is_circuitpython(unnamed(0x239A, 0x8114))
+        assert is_circuitpython(port('/dev/ttyACM5', 'X', vid=0x2E8A, pid=0x0005))
+
+    def test_one_console_per_board(self, ports):
+        """Test a board with two CDC ports is listed once, by its console."""
+        assert [(board.port, board.serial_number) for board in list_boards()] == [
+            ('/dev/ttyACM0', 'DF6254B8D3433A2B'),
+            ('/dev/ttyACM2', 'E6614C311B2F7F29'),
+        ]
+
+
+class TestResolve:
+    """Test turning serial numbers into ports."""
+
+    def test_cached_port_used_without_listing(self, ports, cache, tmp_path):
+        """Test a remembered port that still has the board is used without listing ports."""
+        device = tmp_path / 'ttyACM7'
+        device.touch()
+        cache.set('usb:DF6254B8D3433A2B', 'port', str(device))
+        
+        with patch('circremote.usb.port_serial_number', return_value='DF6254B8D3433A2B'):
+            assert resolve('DF6254B8D3433A2B', cache) == str(device)
+        ports.assert_not_called()
+
+    def test_moved_board_found_again(self, ports, cache, tmp_path):
+        """Test a board now on another port is found by listing and its new port remembered."""
+        device = tmp_path / 'ttyACM0'
+        device.touch()
+        cache.set('usb:E6614C311B2F7F29', 'port', str(device))
+        
+        with patch('circremote.usb.port_serial_number', return_value='DF6254B8D3433A2B'):
+            assert resolve('e6614c311b2f7f29', cache) == '/dev/ttyACM2'
+        assert cache.get('usb:E6614C311B2F7F29', 'port') == '/dev/ttyACM2'
+
+    def test_waits_for_board_to_come_back(self, ports, cache):
+        """Test a board that's restarting is waited for."""
+        ports.connected.clear()
+        
+        def reconnect(seconds):
+            ports.connected.extend(PORTS)
+        
+        with patch('circremote.usb.time.sleep', side_effect=reconnect):
+            assert resolve('DF6254B8D3433A2B', cache) == '/dev/ttyACM0'
+
+    def test_missing_board(self, ports, cache):
+        """Test a board that doesn't turn up is reported."""
+        with pytest.raises(RuntimeError, match="serial number NOPE"):
+            resolve('NOPE', cache, wait=0)
+
+    def test_port_matches(self, tmp_path):
+        """Test a port matches when it exists and doesn't belong to another board."""
+        device = tmp_path / 'ttyACM0'
+        assert not port_matches(str(device), 'ABC')
+        device.touch()
+        with patch('circremote.usb.port_serial_number', return_value=None):
+            assert port_matches(str(device), 'ABC')
+        with patch('circremote.usb.port_serial_number', return_value='XYZ'):
+            assert not port_matches(str(device), 'ABC')
+
+    def test_resolve_device_info(self, ports, cache):
+        """Test only usb: devices are changed, and forgetting a port makes the next lookup list ports."""
+        other = {'name': 'sign-1', 'device': '192.168.1.50'}
+        assert resolve_device_info(other, cache) is other
+        
+        resolved = resolve_device_info({'name': 'bench', 'device': 'usb:DF6254B8D3433A2B'}, cache)
+        assert resolved == {'name': 'bench', 'device': '/dev/ttyACM0', 'usb_serial': 'DF6254B8D3433A2B'}
+        
+        forget(cache, 'DF6254B8D3433A2B')
+        assert cache.get('usb:DF6254B8D3433A2B', 'port') is None
+
+
+class TestDiscoverUsb:
+    """Test circremote discover usb."""
+
+    def test_lists_and_remembers(self, cli_instance, ports, cache, capsys):
+        cli_instance.cache = cache
+        with pytest.raises(SystemExit) as exit_info:
+            cli_instance.run(['discover', 'usb'])
+        
+        assert exit_info.value.code == 0
+        out = capsys.readouterr().out
+        assert "/dev/ttyACM0  usb:DF6254B8D3433A2B  239a:8114" in out
+        assert "Found 2 CircuitPython boards on USB" in out
+        assert cache.get('usb:E6614C311B2F7F29', 'port') == '/dev/ttyACM2'